@@ -1,6 +1,6 @@
 """Application Configuration"""
 from pydantic_settings import BaseSettings
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 
 class Settings(BaseSettings):
@@ -24,9 +24,114 @@ class Settings(BaseSettings):
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
     
     # LLM Configuration
-    LLM_PROVIDER: str = "gemini"  # "gemini" or "openai"
+    LLM_PROVIDER: str = "gemini"  # "gemini", "openai" or "mock"
+    LLM_MODEL: Optional[str] = None  # Defaults to the provider's standard model
     GEMINI_API_KEY: Optional[str] = None
     OPENAI_API_KEY: Optional[str] = None
+    LLM_HTTP_MAX_CONNECTIONS: int = 100
+    LLM_HTTP_MAX_KEEPALIVE: int = 20
+    LLM_HTTP_TIMEOUT_SECONDS: float = 60.0
+    
+    # Model Routing (first matching rule picks "strong", "fast", "provider" or "provider:model")
+    LLM_ROUTING_ENABLED: bool = True
+    LLM_FAST_MODEL: Optional[str] = None  # Defaults to the provider's fast model
+    LLM_ROUTING_RULES: List[Dict] = [
+        {"name": "enterprise", "tier": "enterprise", "model": "strong"},
+        {"name": "short-slides", "content_type": ["slide", "bullet_points"], "length": ["short", "medium"], "model": "fast"},
+        {"name": "short-text", "length": "short", "model": "fast"},
+    ]
+    LLM_ROUTING_DEFAULT: str = "strong"
+    LLM_ROUTING_FALLBACKS: Dict[str, List[str]] = {"fast": ["strong"]}  # tried when a target fails before any output
+    LLM_FAILOVER_PROVIDERS: List[str] = []  # other providers' default models, tried after a route's fallbacks
+    
+    # Provider Circuit Breakers (trip on the error or slow-call rate of each provider's recent calls)
+    LLM_BREAKER_ENABLED: bool = True
+    LLM_BREAKER_WINDOW_CALLS: int = 20
+    LLM_BREAKER_MIN_CALLS: int = 10
+    LLM_BREAKER_FAILURE_RATE: float = 0.5
+    LLM_BREAKER_SLOW_CALL_SECONDS: float = 30.0  # time to first token for streams
+    LLM_BREAKER_SLOW_CALL_RATE: float = 0.8
+    LLM_BREAKER_OPEN_SECONDS: float = 30.0  # calls are refused this long before a probe is let through
+    
+    # Hedged Requests (a non-streaming call still running after the model's recent p95 gets a duplicate)
+    LLM_HEDGE_ENABLED: bool = False
+    LLM_HEDGE_PERCENTILE: float = 95.0
+    LLM_HEDGE_MIN_SAMPLES: int = 20
+    LLM_HEDGE_MIN_DELAY_SECONDS: float = 0.2
+    
+    # LLM Provider Rate Limits (defaults apply to every provider)
+    LLM_REQUESTS_PER_MINUTE: int = 60
+    LLM_TOKENS_PER_MINUTE: int = 120000
+    LLM_MAX_CONCURRENCY: int = 16
+    LLM_MIN_CONCURRENCY: int = 1
+    LLM_PROVIDER_LIMITS: Dict[str, Dict[str, int]] = {}  # e.g. {"openai": {"requests_per_minute": 500}}
+    LLM_RATE_LIMIT_MAX_WAIT_SECONDS: float = 120.0
+    LLM_429_MAX_RETRIES: int = 3
+    
+    # Mock LLM Provider (offline load tests and benchmarks)
+    MOCK_LLM_TTFT_MS: float = 200.0
+    MOCK_LLM_TOKENS_PER_SECOND: float = 50.0
+    MOCK_LLM_ERROR_RATE: float = 0.0
+    MOCK_LLM_RATE_LIMIT_RATE: float = 0.0
+    MOCK_LLM_SEED: int = 0
+    
+    # LLM Latency Ledger (per-call timings written in batches to llm_calls)
+    LLM_LEDGER_ENABLED: bool = True
+    LLM_LEDGER_FLUSH_INTERVAL_SECONDS: float = 2.0
+    LLM_LEDGER_BATCH_SIZE: int = 200
+    LLM_LEDGER_MAX_PENDING: int = 10000
+    
+    # Generation Concurrency (document-wide jobs)
+    GENERATION_MAX_CONCURRENCY: int = 16
+    GENERATION_MAX_CONCURRENCY_PER_USER: int = 4
+    
+    # Job Scheduler (LLM jobs admitted at once; lane weights set each lane's share under contention)
+    SCHEDULER_MAX_CONCURRENT_JOBS: int = 24
+    SCHEDULER_LANE_WEIGHTS: Dict[str, int] = {"interactive_stream": 8, "interactive": 4, "batch": 1}
+    
+    # Background Generation Jobs (worker processes: python -m app.worker)
+    JOB_QUEUE_BACKEND: str = "database"  # "database" or "redis" (uses REDIS_URL)
+    JOB_WORKER_CONCURRENCY: int = 4
+    JOB_POLL_INTERVAL_SECONDS: float = 1.0
+    JOB_PROGRESS_FLUSH_SECONDS: float = 1.0
+    JOB_LEASE_SECONDS: int = 60
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BACKOFF_SECONDS: float = 5.0  # doubled after each failed attempt
+    JOB_RETRY_BACKOFF_MAX_SECONDS: float = 300.0
+    
+    # Streaming (chunks are merged until either limit is reached)
+    STREAM_FLUSH_MAX_BYTES: int = 512
+    STREAM_FLUSH_INTERVAL_MS: int = 50
+    STREAM_EVENT_QUEUE_SIZE: int = 64
+    
+    # Rolling Document Summary (digests of finished sections sent with each section prompt)
+    DOCUMENT_SUMMARY_ENABLED: bool = True
+    DOCUMENT_SUMMARY_MAX_TOKENS: int = 600
+    DOCUMENT_SUMMARY_SECTION_TOKENS: int = 80
+    
+    # Span Refinement (feedback applied to a selected excerpt instead of the whole section)
+    REFINEMENT_SPAN_CONTEXT_CHARS: int = 300  # neighbouring text sent on each side of the excerpt
+    REFINEMENT_SPAN_MAX_TOKENS: int = 1000
+    
+    # Long Sections (written as parts in parallel, the first streamed while the rest are in flight)
+    LONG_SECTION_SPLIT_ENABLED: bool = True
+    LONG_SECTION_LENGTHS: List[str] = ["long"]  # document length settings that are split
+    LONG_SECTION_CONTENT_TYPES: List[str] = ["text"]
+    LONG_SECTION_PARTS: int = 3
+    LONG_SECTION_PART_MAX_TOKENS: int = 1500
+    
+    # Streaming Checkpoints (partial content saved at whichever interval is reached first)
+    GENERATION_CHECKPOINT_TOKENS: int = 200
+    GENERATION_CHECKPOINT_SECONDS: float = 5.0
+    GENERATION_CHECKPOINT_STALE_SECONDS: int = 120  # in-progress rows idle this long were interrupted
+    
+    # Resumable SSE Streams (events kept per generation for Last-Event-ID replay)
+    SSE_REPLAY_BUFFER_EVENTS: int = 512
+    SSE_REPLAY_RETENTION_SECONDS: int = 300  # finished generations stay replayable this long
+    SSE_KEEPALIVE_SECONDS: float = 15.0
+    
+    # Admin access (user ids allowed on operational endpoints)
+    ADMIN_USER_IDS: List[str] = []
     
     # CORS Configuration
     ALLOWED_ORIGINS: List[str] = ["http://localhost:3000", "http://localhost:8000"]
@@ -37,14 +142,36 @@ class Settings(BaseSettings):
     # Redis Configuration
     REDIS_URL: Optional[str] = None
     
+    # LLM Response Cache
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_TTL_SECONDS: int = 3600
+    LLM_CACHE_MAX_ENTRIES: int = 1000
+    LLM_CACHE_MAX_BYTES: int = 50 * 1024 * 1024
+    
+    # Outline / Slide-Title Template Cache (stale entries are served while refreshed)
+    TEMPLATE_CACHE_TTL_SECONDS: int = 3600
+    TEMPLATE_CACHE_STALE_SECONDS: int = 86400
+    TEMPLATE_CACHE_MAX_ENTRIES: int = 500
+    
     # File Storage
     EXPORT_TEMP_DIR: str = "./exports"
     MAX_FILE_SIZE_MB: int = 50
     
-    # Rate Limiting
+    # Rate Limiting (per-user LLM requests over a sliding window; the default for tiers without a request limit)
     RATE_LIMIT_REQUESTS: int = 100
     RATE_LIMIT_PERIOD: int = 3600  # seconds
     
+    # Per-User Quotas (tier budgets per RATE_LIMIT_PERIOD; 0 = unlimited)
+    QUOTA_ENABLED: bool = True
+    QUOTA_BACKEND: str = "memory"  # "memory" or "redis" (uses REDIS_URL, shared across processes)
+    QUOTA_DEFAULT_TIER: str = "free"
+    QUOTA_TIERS: Dict[str, Dict[str, int]] = {
+        "free": {"tokens": 200000},
+        "pro": {"requests": 1000, "tokens": 2000000},
+        "enterprise": {"requests": 0, "tokens": 0},
+    }
+    QUOTA_COMPLETION_ESTIMATE_TOKENS: int = 1000  # held per call until actual usage is known
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -4,7 +4,7 @@ from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthCredentials
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 from .config import settings
 
@@ -84,7 +84,7 @@ class SecurityUtils:
             )
 
 
-async def get_current_user(credentials: HTTPAuthCredentials = Depends(security)) -> dict:
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     """Dependency to get current authenticated user"""
     token = credentials.credentials
     payload = SecurityUtils.verify_token(token)
@@ -97,11 +97,44 @@ async def get_current_user(credentials: HTTPAuthCredentials = Depends(security))
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    return {"user_id": user_id}
+    return {"user_id": user_id, "tier": payload.get("tier") or settings.QUOTA_DEFAULT_TIER}
+
+
+async def get_current_user_within_quota(current_user: dict = Depends(get_current_user)) -> dict:
+    """Dependency for LLM-backed endpoints: rejects users who have spent their tier's budget"""
+    from app.integrations.quota import QuotaExceededError, quota_manager
+    
+    try:
+        await quota_manager.check(current_user["user_id"], current_user["tier"])
+    except QuotaExceededError as e:
+        raise quota_exceeded_exception(e)
+    
+    return current_user
+
+
+def quota_exceeded_exception(error) -> HTTPException:
+    """429 response for a QuotaExceededError"""
+    headers = {"Retry-After": str(int(error.retry_after) + 1)} if error.retry_after is not None else None
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=str(error),
+        headers=headers
+    )
+
+
+async def get_current_admin(current_user: dict = Depends(get_current_user)) -> dict:
+    """Dependency to restrict operational endpoints to configured admin users"""
+    if current_user["user_id"] not in settings.ADMIN_USER_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    
+    return current_user
 
 
 async def get_current_user_optional(
-    credentials: Optional[HTTPAuthCredentials] = Depends(security)
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)
 ) -> Optional[dict]:
     """Dependency to get current user (optional)"""
     if credentials is None:
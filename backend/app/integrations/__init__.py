@@ -1,133 +1,568 @@
 """LLM Integration Service"""
 import asyncio
-from typing import AsyncGenerator, Optional
+import logging
+import random
+import time
+from contextlib import contextmanager
+from typing import AsyncGenerator, Callable, Dict, List, Optional, Tuple
 from app.core.config import settings
+from app.integrations.cache import response_cache
+from app.integrations.circuit_breaker import CircuitOpenError, LLMProviderError, get_circuit_breaker
+from app.integrations.ledger import LLMCallRecord
+from app.integrations.rate_limiter import LLMRateLimitError, get_rate_limiter, is_rate_limit_error
+from app.integrations.tokenizer import TokenUsage
+
+logger = logging.getLogger(__name__)
+
+# Default model per provider when settings.LLM_MODEL is not set
+DEFAULT_MODELS = {
+    "gemini": "gemini-pro",
+    "openai": "gpt-4",
+    "mock": "mock-llm",
+}
+
+# Fast, cheap model per provider for routes that don't need the default one
+FAST_MODELS = {
+    "gemini": "gemini-1.5-flash",
+    "openai": "gpt-3.5-turbo",
+    "mock": "mock-llm-fast",
+}
 
 
 class LLMClient:
     """Base LLM client interface"""
     
+    provider: str = ""
+    
+    def __init__(self, model: str):
+        self.model = model
+    
     async def generate_content(
         self,
         prompt: str,
         max_tokens: int = 2000,
         temperature: float = 0.7,
-        stream: bool = False
+        stream: bool = False,
+        use_cache: Optional[bool] = None,
+        usage: Optional[TokenUsage] = None
     ) -> AsyncGenerator[str, None] | str:
-        """Generate content using LLM"""
+        """Generate content using LLM, serving repeated prompts from the response cache.
+        
+        By default only deterministic calls (temperature 0) use the cache, since
+        a sampled completion should differ each time; use_cache=True opts in
+        regardless and False bypasses it. Pass a TokenUsage to have
+        prompt/completion tokens recorded on it.
+        """
+        usage = usage if usage is not None else TokenUsage(self.model)
+        usage.count_prompt(prompt)
+        call = LLMCallRecord(self.provider, self.model, usage, streamed=stream)
+        
+        if use_cache is None:
+            use_cache = temperature == 0
+        cache = response_cache if use_cache and settings.LLM_CACHE_ENABLED else None
+        cache_key = None
+        
+        if cache is not None:
+            cache_key = cache.make_key(prompt, self.model, temperature, max_tokens)
+            cached = await cache.get(cache_key)
+            if cached is not None:
+                usage.cached = True
+                usage.add_completion(cached)
+                call.finish("success")
+                return self._replay(cached) if stream else cached
+        
+        # Refuse at once while the provider is failing, so callers can fail over
+        breaker = get_circuit_breaker(self.provider)
+        if not breaker.allow():
+            raise CircuitOpenError(
+                f"{self.provider} circuit is open after repeated failures; retry in {int(breaker.retry_after()) + 1}s",
+                self.provider,
+                breaker.retry_after()
+            )
+        
+        if stream:
+            return self._stream_and_cache(prompt, max_tokens, temperature, cache, cache_key, call)
+        
+        try:
+            content = await self._complete_hedged(prompt, max_tokens, temperature, call)
+        except BaseException as e:
+            self._finish(call, self._outcome(e), e)
+            raise
+        self._finish(call, "success")
+        if cache is not None:
+            await cache.set(cache_key, content)
+        return content
+    
+    async def _complete(self, prompt: str, max_tokens: int, temperature: float, usage: TokenUsage) -> str:
+        """Provider-specific non-streaming completion; reports provider usage on usage when available"""
         raise NotImplementedError
+    
+    async def _stream(self, prompt: str, max_tokens: int, temperature: float, usage: TokenUsage) -> AsyncGenerator[str, None]:
+        """Provider-specific streaming completion; reports provider usage on usage when available"""
+        raise NotImplementedError
+        yield
+    
+    async def _replay(self, content: str):
+        """Serve a cached completion through the streaming interface"""
+        yield content
+    
+    def _finish(self, call: LLMCallRecord, outcome: str, error: Optional[BaseException] = None):
+        """Close a call's ledger record and report its outcome to the provider's circuit breaker"""
+        if call.outcome is not None:
+            return
+        call.finish(outcome, error)
+        get_circuit_breaker(self.provider).record(outcome, call.ttft_seconds, self.model, call.streamed)
+    
+    async def _complete_hedged(self, prompt: str, max_tokens: int, temperature: float, call: LLMCallRecord) -> str:
+        """Complete a call, sending a second identical request if the first outlasts the model's p95 latency.
+        
+        Whichever request succeeds first wins and the other is cancelled.
+        """
+        delay = None
+        if settings.LLM_HEDGE_ENABLED:
+            delay = get_circuit_breaker(self.provider).latency_percentile(
+                self.model, settings.LLM_HEDGE_PERCENTILE, settings.LLM_HEDGE_MIN_SAMPLES
+            )
+        if delay is None:
+            return await self._complete_with_limits(prompt, max_tokens, temperature, call)
+        
+        primary = asyncio.ensure_future(self._complete_with_limits(prompt, max_tokens, temperature, call))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=max(delay, settings.LLM_HEDGE_MIN_DELAY_SECONDS))
+        except BaseException:
+            primary.cancel()
+            raise
+        if done:
+            return primary.result()
+        
+        hedge_usage = TokenUsage(self.model)
+        hedge_usage.count_prompt(prompt)
+        hedge_call = LLMCallRecord(self.provider, self.model, hedge_usage)
+        hedge = asyncio.ensure_future(self._complete_with_limits(prompt, max_tokens, temperature, hedge_call))
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            # The caller's usage reports what the winning request spent; a primary
+                            # that already failed keeps its error, one still pending is cancelled
+                            self._finish(call, "cancelled")
+                            self._finish(hedge_call, "success")
+                            call.usage.prompt_tokens = hedge_usage.prompt_tokens
+                            call.usage.completion_tokens = hedge_usage.completion_tokens
+                            call.usage.source = hedge_usage.source
+                        return task.result()
+                    # A failed request is a real provider error even if the other one goes on to win
+                    self._finish(hedge_call if task is hedge else call, self._outcome(task.exception()), task.exception())
+            raise primary.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+            if hedge in pending:
+                self._finish(hedge_call, "cancelled")
+    
+    @staticmethod
+    def _outcome(error: BaseException) -> str:
+        """Ledger outcome for a failed call"""
+        if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+            return "cancelled"
+        return "rate_limited" if is_rate_limit_error(error) else "error"
+    
+    async def _backoff(self, attempt: int, error: LLMRateLimitError):
+        """Wait before retrying a throttled call"""
+        delay = error.retry_after or min(30.0, 2 ** attempt)
+        await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+    
+    async def _complete_with_limits(self, prompt: str, max_tokens: int, temperature: float, call: LLMCallRecord) -> str:
+        """Run a completion under the provider's rate limiter, retrying on 429"""
+        limiter = get_rate_limiter(self.provider)
+        usage = call.usage
+        
+        for attempt in range(settings.LLM_429_MAX_RETRIES + 1):
+            try:
+                async with limiter.limit(usage.prompt_tokens + max_tokens) as permit:
+                    call.queue_wait_seconds += permit.queue_wait_seconds
+                    content = await self._complete(prompt, max_tokens, temperature, usage)
+                    if usage.source != "provider":
+                        usage.add_completion(content)
+                    permit.settle(usage.total_tokens)
+                    return content
+            except LLMRateLimitError as e:
+                if attempt == settings.LLM_429_MAX_RETRIES:
+                    raise
+                await self._backoff(attempt, e)
+    
+    async def _stream_and_cache(self, prompt: str, max_tokens: int, temperature: float, cache, cache_key, call: LLMCallRecord):
+        """Stream from the provider under its rate limiter and cache the full completion"""
+        limiter = get_rate_limiter(self.provider)
+        usage = call.usage
+        parts = []
+        
+        try:
+            for attempt in range(settings.LLM_429_MAX_RETRIES + 1):
+                try:
+                    async with limiter.limit(usage.prompt_tokens + max_tokens) as permit:
+                        call.queue_wait_seconds += permit.queue_wait_seconds
+                        started = time.monotonic()
+                        async for chunk in self._stream(prompt, max_tokens, temperature, usage):
+                            if not parts:
+                                # Time to first chunk is the latency signal for streams
+                                permit.latency = time.monotonic() - started
+                                call.first_token()
+                            parts.append(chunk)
+                            usage.add_completion(chunk)
+                            yield chunk
+                        permit.settle(usage.total_tokens)
+                    break
+                except LLMRateLimitError as e:
+                    # Once chunks have reached the caller the stream cannot be replayed
+                    if parts or attempt == settings.LLM_429_MAX_RETRIES:
+                        raise
+                    await self._backoff(attempt, e)
+        except BaseException as e:
+            self._finish(call, self._outcome(e), e if not isinstance(e, GeneratorExit) else None)
+            raise
+        self._finish(call, "success")
+        
+        if cache is not None:
+            await cache.set(cache_key, "".join(parts))
+    
+    async def aclose(self):
+        """Release resources held by the client"""
+        pass
+    
+    def __str__(self) -> str:
+        return f"{self.provider}:{self.model}"
 
 
 class GeminiClient(LLMClient):
     """Gemini LLM Client"""
     
-    def __init__(self):
+    provider = "gemini"
+    _configured = False
+    
+    def __init__(self, model: str = DEFAULT_MODELS["gemini"], http_client=None):
+        super().__init__(model)
         try:
             import google.generativeai as genai
             self.genai = genai
-            self.genai.configure(api_key=settings.GEMINI_API_KEY)
         except ImportError:
             raise ImportError("google-generativeai not installed")
+        
+        # genai keeps one process-wide gRPC channel, so configure it only once
+        if not GeminiClient._configured:
+            self.genai.configure(api_key=settings.GEMINI_API_KEY)
+            GeminiClient._configured = True
+        self.model_client = self.genai.GenerativeModel(model)
     
-    async def generate_content(
-        self,
-        prompt: str,
-        max_tokens: int = 2000,
-        temperature: float = 0.7,
-        stream: bool = False
-    ):
+    @staticmethod
+    def _report_usage(response, usage: TokenUsage):
+        """Copy usage metadata from a Gemini response when the SDK provides it"""
+        metadata = getattr(response, "usage_metadata", None)
+        if metadata is not None:
+            usage.set_provider_counts(
+                getattr(metadata, "prompt_token_count", None),
+                getattr(metadata, "candidates_token_count", None)
+            )
+    
+    async def _complete(self, prompt: str, max_tokens: int, temperature: float, usage: TokenUsage) -> str:
         """Generate content using Gemini API"""
         try:
-            model = self.genai.GenerativeModel("gemini-pro")
-            
-            if stream:
-                return self._stream_gemini(model, prompt, max_tokens, temperature)
-            else:
-                response = model.generate_content(
-                    prompt,
-                    generation_config={
-                        "max_output_tokens": max_tokens,
-                        "temperature": temperature,
-                    }
-                )
-                return response.text
+            response = await self.model_client.generate_content_async(
+                prompt,
+                generation_config={
+                    "max_output_tokens": max_tokens,
+                    "temperature": temperature,
+                }
+            )
+            self._report_usage(response, usage)
+            return response.text
         except Exception as e:
-            raise Exception(f"Gemini API error: {str(e)}")
+            if is_rate_limit_error(e):
+                raise LLMRateLimitError(f"Gemini API rate limit: {str(e)}")
+            raise LLMProviderError(f"Gemini API error: {str(e)}", self.provider)
     
-    async def _stream_gemini(self, model, prompt: str, max_tokens: int, temperature: float):
+    async def _stream(self, prompt: str, max_tokens: int, temperature: float, usage: TokenUsage):
         """Stream Gemini responses"""
-        response = model.generate_content(
-            prompt,
-            generation_config={
-                "max_output_tokens": max_tokens,
-                "temperature": temperature,
-            },
-            stream=True
-        )
-        
-        for chunk in response:
-            if chunk.text:
-                yield chunk.text
+        try:
+            response = await self.model_client.generate_content_async(
+                prompt,
+                generation_config={
+                    "max_output_tokens": max_tokens,
+                    "temperature": temperature,
+                },
+                stream=True
+            )
+            
+            async for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+            self._report_usage(response, usage)
+        except Exception as e:
+            if is_rate_limit_error(e):
+                raise LLMRateLimitError(f"Gemini API rate limit: {str(e)}")
+            raise LLMProviderError(f"Gemini API error: {str(e)}", self.provider)
 
 
 class OpenAIClient(LLMClient):
     """OpenAI LLM Client"""
     
-    def __init__(self):
+    provider = "openai"
+    
+    def __init__(self, model: str = DEFAULT_MODELS["openai"], http_client=None):
+        super().__init__(model)
         try:
-            import openai
-            self.openai = openai
-            self.openai.api_key = settings.OPENAI_API_KEY
+            from openai import AsyncOpenAI
+            self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, http_client=http_client)
         except ImportError:
             raise ImportError("openai not installed")
     
-    async def generate_content(
-        self,
-        prompt: str,
-        max_tokens: int = 2000,
-        temperature: float = 0.7,
-        stream: bool = False
-    ):
+    async def _complete(self, prompt: str, max_tokens: int, temperature: float, usage: TokenUsage) -> str:
         """Generate content using OpenAI API"""
         try:
-            if stream:
-                return self._stream_openai(prompt, max_tokens, temperature)
-            else:
-                response = self.openai.ChatCompletion.create(
-                    model="gpt-4",
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=max_tokens,
-                    temperature=temperature,
-                )
-                return response.choices[0].message.content
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                temperature=temperature,
+            )
+            response_usage = getattr(response, "usage", None)
+            if response_usage is not None:
+                usage.set_provider_counts(response_usage.prompt_tokens, response_usage.completion_tokens)
+            return response.choices[0].message.content
         except Exception as e:
-            raise Exception(f"OpenAI API error: {str(e)}")
+            if is_rate_limit_error(e):
+                raise LLMRateLimitError(f"OpenAI API rate limit: {str(e)}")
+            raise LLMProviderError(f"OpenAI API error: {str(e)}", self.provider)
     
-    async def _stream_openai(self, prompt: str, max_tokens: int, temperature: float):
+    async def _stream(self, prompt: str, max_tokens: int, temperature: float, usage: TokenUsage):
         """Stream OpenAI responses"""
-        response = self.openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=max_tokens,
-            temperature=temperature,
-            stream=True
-        )
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+                # Ask for a final usage chunk so stream token counts come from the provider
+                extra_body={"stream_options": {"include_usage": True}}
+            )
+            
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                chunk_usage = getattr(chunk, "usage", None)
+                if chunk_usage:
+                    # Older SDKs surface the usage chunk as a plain dict
+                    if not isinstance(chunk_usage, dict):
+                        chunk_usage = chunk_usage.model_dump()
+                    usage.set_provider_counts(
+                        chunk_usage.get("prompt_tokens"),
+                        chunk_usage.get("completion_tokens")
+                    )
+        except Exception as e:
+            if is_rate_limit_error(e):
+                raise LLMRateLimitError(f"OpenAI API rate limit: {str(e)}")
+            raise LLMProviderError(f"OpenAI API error: {str(e)}", self.provider)
+
+
+class MockLLMClient(LLMClient):
+    """Deterministic offline LLM for load tests and benchmarks"""
+    
+    provider = "mock"
+    
+    VOCABULARY = (
+        "strategy growth market customer value platform data team process quality "
+        "insight revenue delivery roadmap risk impact performance analysis outcome "
+        "operations innovation efficiency stakeholder initiative metric plan review"
+    ).split()
+    
+    LENGTH_TOKENS = {"short": 150, "medium": 400, "long": 900}
+    
+    def __init__(
+        self,
+        model: str = "mock-llm",
+        http_client=None,
+        ttft_ms: Optional[float] = None,
+        tokens_per_second: Optional[float] = None,
+        error_rate: Optional[float] = None,
+        rate_limit_rate: Optional[float] = None,
+        seed: Optional[int] = None
+    ):
+        super().__init__(model)
+        self.ttft_ms = settings.MOCK_LLM_TTFT_MS if ttft_ms is None else ttft_ms
+        self.tokens_per_second = settings.MOCK_LLM_TOKENS_PER_SECOND if tokens_per_second is None else tokens_per_second
+        self.error_rate = settings.MOCK_LLM_ERROR_RATE if error_rate is None else error_rate
+        self.rate_limit_rate = settings.MOCK_LLM_RATE_LIMIT_RATE if rate_limit_rate is None else rate_limit_rate
+        self.seed = settings.MOCK_LLM_SEED if seed is None else seed
+        # Fault injection draws from its own seeded sequence so runs are reproducible
+        self._faults = random.Random(self.seed)
+    
+    def render(self, prompt: str, max_tokens: int) -> List[str]:
+        """Deterministic completion tokens for a prompt"""
+        import hashlib
+        import json
+        import re
         
-        for chunk in response:
-            if "choices" in chunk and len(chunk["choices"]) > 0:
-                delta = chunk["choices"][0].get("delta", {})
-                if "content" in delta:
-                    yield delta["content"]
+        digest = hashlib.sha256(f"{self.seed}|{self.model}|{prompt}".encode("utf-8")).hexdigest()
+        rng = random.Random(int(digest[:16], 16))
+        
+        def phrase(n: int) -> str:
+            return " ".join(rng.choice(self.VOCABULARY) for _ in range(n)).capitalize()
+        
+        # Outline and slide-title prompts ask for JSON, so answer in kind
+        sections = re.search(r"Number of Sections: (\d+)", prompt)
+        slides = re.search(r"Number of Slides: (\d+)", prompt)
+        if sections:
+            text = json.dumps([
+                {"title": phrase(3), "description": phrase(12) + "."}
+                for _ in range(int(sections.group(1)))
+            ], indent=2)
+            return re.findall(r"\S+\s*", text)
+        if slides:
+            text = json.dumps([phrase(4) for _ in range(int(slides.group(1)))], indent=2)
+            return re.findall(r"\S+\s*", text)
+        
+        length = re.search(r"Length: (\w+)", prompt)
+        target = self.LENGTH_TOKENS.get(length.group(1) if length else "", 300)
+        tokens = []
+        for i in range(min(target, max_tokens)):
+            word = rng.choice(self.VOCABULARY)
+            tokens.append(word + ("\n\n" if i % 60 == 59 else ". " if i % 12 == 11 else " "))
+        return tokens
+    
+    def _inject_faults(self):
+        roll = self._faults.random()
+        if roll < self.rate_limit_rate:
+            raise LLMRateLimitError("Mock LLM rate limit: injected 429", retry_after=1.0)
+        if roll < self.rate_limit_rate + self.error_rate:
+            raise LLMProviderError("Mock LLM error: injected failure", self.provider)
+    
+    async def _complete(self, prompt: str, max_tokens: int, temperature: float, usage: TokenUsage) -> str:
+        """Return the full deterministic completion after simulated latency"""
+        self._inject_faults()
+        tokens = self.render(prompt, max_tokens)
+        usage.set_provider_counts(usage.prompt_tokens, len(tokens))
+        duration = self.ttft_ms / 1000.0
+        if self.tokens_per_second > 0:
+            duration += len(tokens) / self.tokens_per_second
+        await asyncio.sleep(duration)
+        return "".join(tokens)
+    
+    async def _stream(self, prompt: str, max_tokens: int, temperature: float, usage: TokenUsage):
+        """Stream one token per chunk at the configured time-to-first-token and rate"""
+        self._inject_faults()
+        tokens = self.render(prompt, max_tokens)
+        loop = asyncio.get_running_loop()
+        first_token_at = loop.time() + self.ttft_ms / 1000.0
+        for i, token in enumerate(tokens):
+            # Pace against a schedule rather than sleeping per token, so timer
+            # granularity doesn't drift the simulated throughput
+            due = first_token_at + (i / self.tokens_per_second if self.tokens_per_second > 0 else 0)
+            delay = due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield token
+        usage.set_provider_counts(usage.prompt_tokens, len(tokens))
+
+
+class LLMClientRegistry:
+    """Process-wide registry holding one long-lived client per provider/model"""
+    
+    def __init__(self):
+        self._factories: Dict[str, Callable[..., LLMClient]] = {
+            "gemini": GeminiClient,
+            "openai": OpenAIClient,
+            "mock": MockLLMClient,
+        }
+        self._clients: Dict[Tuple[str, str], LLMClient] = {}
+        self._overrides: Dict[Optional[str], LLMClient] = {}
+        self._http_client = None
+    
+    def register_provider(
+        self,
+        name: str,
+        factory: Callable[..., LLMClient],
+        default_model: str,
+        fast_model: Optional[str] = None
+    ):
+        """Register a client factory for a provider name"""
+        self._factories[name] = factory
+        DEFAULT_MODELS[name] = default_model
+        FAST_MODELS[name] = fast_model or default_model
+    
+    @property
+    def http_client(self):
+        """Shared keep-alive HTTP connection pool for HTTP-based providers"""
+        if self._http_client is None:
+            import httpx
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE,
+                ),
+                timeout=httpx.Timeout(settings.LLM_HTTP_TIMEOUT_SECONDS, connect=10.0),
+            )
+        return self._http_client
+    
+    def get(self, provider: Optional[str] = None, model: Optional[str] = None) -> LLMClient:
+        """Return the cached client for a provider/model, creating it on first use"""
+        provider = provider or settings.LLM_PROVIDER
+        
+        override = self._overrides.get(provider) or self._overrides.get(None)
+        if override is not None:
+            return override
+        
+        if provider not in self._factories:
+            raise ValueError(f"Unsupported LLM provider: {provider}")
+        
+        if model is None:
+            model = settings.LLM_MODEL if provider == settings.LLM_PROVIDER and settings.LLM_MODEL else DEFAULT_MODELS[provider]
+        
+        key = (provider, model)
+        client = self._clients.get(key)
+        if client is None:
+            client = self._factories[provider](model=model, http_client=self.http_client)
+            self._clients[key] = client
+        return client
+    
+    @contextmanager
+    def override(self, client: LLMClient, provider: Optional[str] = None):
+        """Temporarily serve a stand-in client (for all providers when provider is None)"""
+        previous = self._overrides.get(provider)
+        self._overrides[provider] = client
+        try:
+            yield client
+        finally:
+            if previous is None:
+                self._overrides.pop(provider, None)
+            else:
+                self._overrides[provider] = previous
+    
+    async def warm_up(self):
+        """Create the default client and its connection pool ahead of the first request"""
+        client = self.get()
+        logger.info(f"LLM client ready: {client}")
+    
+    async def aclose(self):
+        """Close all cached clients and the shared connection pool"""
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
 
 
-def get_llm_client() -> LLMClient:
-    """Factory function to get appropriate LLM client"""
-    if settings.LLM_PROVIDER == "gemini":
-        return GeminiClient()
-    elif settings.LLM_PROVIDER == "openai":
-        return OpenAIClient()
-    else:
-        raise ValueError(f"Unsupported LLM provider: {settings.LLM_PROVIDER}")
+# Global registry instance
+llm_registry = LLMClientRegistry()
+
+
+def get_llm_client(provider: Optional[str] = None, model: Optional[str] = None) -> LLMClient:
+    """Get the shared LLM client for a provider/model"""
+    return llm_registry.get(provider, model)
 
 
 class PromptManager:
@@ -179,11 +614,15 @@ Focus Points:
 Additional Context:
 {context}
 
+Summary of the Other Sections:
+{document_summary}
+
 Generate high-quality, well-structured content that:
 1. Addresses the focus points
 2. Maintains the specified tone
 3. Is appropriate for the content type
 4. Is roughly {length} in length
+5. Fits with the other sections without repeating what they cover
 
 Content:
 """
@@ -205,6 +644,36 @@ Please provide an improved version that:
 4. Addresses the refinement reason: {refinement_reason}
 
 Refined Content:
+"""
+
+    SPAN_CONTEXT_TEMPLATE = """
+The content to refine below is an excerpt from a longer section. The text around it, for reference only:
+
+Before the excerpt: ...{before}
+After the excerpt: {after}...
+
+Rewrite only the excerpt so it still reads naturally between them, at a similar length unless the feedback asks otherwise. Output only the replacement text.
+"""
+
+    SECTION_PART_TEMPLATE = """
+This section is long, so it is written in {total} parts at once by separate writers.
+Write only part {index} of {total}, which covers:
+{scope}
+
+The other parts cover:
+{others}
+
+Write about 1/{total} of the section's length. {position} Output only the text of this part.
+"""
+
+    CONTINUATION_TEMPLATE = """
+{original_prompt}
+
+The response was interrupted. The text generated so far is:
+
+{partial_content}
+
+Continue the text exactly where it stops. Do not repeat any of it or restart; output only the remainder.
 """
 
     @staticmethod
@@ -243,18 +712,20 @@ Refined Content:
         tone: str = "professional",
         length: str = "medium",
         focus_points: str = "",
-        context: str = ""
+        context: str = "",
+        document_summary: str = ""
     ) -> str:
         """Build prompt for content generation"""
-        focus_list = "\n".join([f"- {fp}" for fp in focus_points.split(",")])
+        focus_list = "\n".join([f"- {fp.strip()}" for fp in focus_points.split(",") if fp.strip()])
         return PromptManager.CONTENT_GENERATION_TEMPLATE.format(
             section_title=section_title,
             document_type=document_type,
             content_type=content_type,
             tone=tone,
             length=length,
-            focus_points=focus_list,
-            context=context or "None"
+            focus_points=focus_list or "None",
+            context=context or "None",
+            document_summary=document_summary or "None"
         )
     
     @staticmethod
@@ -274,6 +745,56 @@ Refined Content:
             refinement_reason=refinement_reason
         )
     
+    @staticmethod
+    def build_span_refinement_prompt(
+        span: str,
+        before: str,
+        after: str,
+        feedback_type: str,
+        user_feedback: str,
+        suggested_changes: str,
+        refinement_reason: str
+    ) -> str:
+        """Build prompt refining one excerpt of a section, with its neighbouring text as context"""
+        context = PromptManager.SPAN_CONTEXT_TEMPLATE.format(
+            before=before.strip() or "(start of section)",
+            after=after.strip() or "(end of section)"
+        )
+        return context + PromptManager.build_refinement_prompt(
+            span, feedback_type, user_feedback, suggested_changes, refinement_reason
+        )
+    
+    @staticmethod
+    def build_section_part_prompt(section_prompt: str, index: int, scopes: List[List[str]]) -> str:
+        """Build prompt for one part (0-based index) of a section written as several parts"""
+        total = len(scopes)
+        if index == 0:
+            position = "Open the section, but leave the later parts' points to them."
+        elif index == total - 1:
+            position = "Close the section; do not reintroduce the topic or restate earlier parts."
+        else:
+            position = "Start and end mid-section: no introduction, title or conclusion."
+        
+        def bullets(points):
+            return "\n".join(f"- {point}" for point in points)
+        
+        instructions = PromptManager.SECTION_PART_TEMPLATE.format(
+            total=total,
+            index=index + 1,
+            scope=bullets(scopes[index]),
+            others="\n".join(f"Part {i + 1}: {'; '.join(scope)}" for i, scope in enumerate(scopes) if i != index),
+            position=position
+        )
+        return instructions + section_prompt
+    
+    @staticmethod
+    def build_continuation_prompt(original_prompt: str, partial_content: str) -> str:
+        """Build prompt continuing an interrupted generation from its partial content"""
+        return PromptManager.CONTINUATION_TEMPLATE.format(
+            original_prompt=original_prompt.strip(),
+            partial_content=partial_content
+        )
+    
     @staticmethod
     def add_safety_guidelines(prompt: str) -> str:
         """Add safety guidelines to prompt to prevent injection attacks"""
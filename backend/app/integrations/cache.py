@@ -0,0 +1,156 @@
+"""LLM Response Cache"""
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LLMResponseCache:
+    """Two-tier (in-process LRU + optional Redis) cache of LLM completions"""
+
+    KEY_PREFIX = "llm:response:"
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        max_bytes: int = 50 * 1024 * 1024,
+        ttl_seconds: int = 3600,
+        redis_url: Optional[str] = None
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.redis_url = redis_url
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._size_bytes = 0
+        self._redis = None
+        self.hits = 0
+        self.misses = 0
+        self.redis_hits = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_settings(cls) -> "LLMResponseCache":
+        """Build the cache from application settings"""
+        return cls(
+            max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+            max_bytes=settings.LLM_CACHE_MAX_BYTES,
+            ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+            redis_url=settings.REDIS_URL
+        )
+
+    @staticmethod
+    def make_key(prompt: str, model: str, temperature: float, max_tokens: int) -> str:
+        """Hash a whitespace-normalized prompt together with its sampling parameters"""
+        normalized = re.sub(r"\s+", " ", prompt).strip()
+        digest = hashlib.sha256(
+            f"{model}|{temperature:.3f}|{max_tokens}|{normalized}".encode("utf-8")
+        ).hexdigest()
+        return digest
+
+    def _get_redis(self):
+        """Lazily connect to Redis; returns None when no Redis tier is configured"""
+        if self._redis is None and self.redis_url:
+            try:
+                import redis.asyncio as aioredis
+                self._redis = aioredis.from_url(self.redis_url, decode_responses=True)
+            except ImportError:
+                logger.warning("redis not installed, LLM cache running in-process only")
+                self.redis_url = None
+        return self._redis
+
+    def _get_local(self, key: str) -> Optional[str]:
+        """Look up the in-process tier, dropping expired entries"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._remove_local(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_local(self, key: str, value: str):
+        """Store in the in-process tier and evict least-recently-used entries"""
+        self._remove_local(key)
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._size_bytes += size
+        while len(self._entries) > self.max_entries or self._size_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove_local(oldest)
+            self.evictions += 1
+
+    def _remove_local(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size_bytes -= len(entry[1].encode("utf-8"))
+
+    async def get(self, key: str) -> Optional[str]:
+        """Return a cached completion or None"""
+        value = self._get_local(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        redis_client = self._get_redis()
+        if redis_client is not None:
+            try:
+                value = await redis_client.get(self.KEY_PREFIX + key)
+            except Exception as e:
+                logger.warning(f"LLM cache Redis read failed: {e}")
+                value = None
+            if value is not None:
+                self._set_local(key, value)
+                self.hits += 1
+                self.redis_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str):
+        """Store a completion in both tiers"""
+        if not value:
+            return
+        self._set_local(key, value)
+
+        redis_client = self._get_redis()
+        if redis_client is not None:
+            try:
+                await redis_client.set(self.KEY_PREFIX + key, value, ex=self.ttl_seconds)
+            except Exception as e:
+                logger.warning(f"LLM cache Redis write failed: {e}")
+
+    def clear(self):
+        """Empty the in-process tier and reset counters"""
+        self._entries.clear()
+        self._size_bytes = 0
+        self.hits = self.misses = self.redis_hits = self.evictions = 0
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current in-process usage"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "redis_hits": self.redis_hits,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "size_bytes": self._size_bytes,
+            "redis_enabled": bool(self.redis_url),
+        }
+
+
+# Global cache instance
+response_cache = LLMResponseCache.from_settings()
@@ -0,0 +1,180 @@
+"""Per-provider circuit breakers and latency tracking for failover and hedged calls"""
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class LLMProviderError(Exception):
+    """A provider call failed (API error, outage or open circuit)"""
+
+    def __init__(self, message: str, provider: Optional[str] = None):
+        super().__init__(message)
+        self.provider = provider
+
+
+class CircuitOpenError(LLMProviderError):
+    """The provider's circuit is open, so the call was refused without being sent"""
+
+    def __init__(self, message: str, provider: Optional[str] = None, retry_after: Optional[float] = None):
+        super().__init__(message, provider)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Trips when too many of a provider's recent calls fail or are slow.
+
+    While open, calls are refused at once so callers can fail over instead of
+    waiting on a degraded provider. After open_seconds a single probe call is
+    let through; its success closes the circuit, its failure reopens it.
+    """
+
+    LATENCY_SAMPLES = 200
+
+    def __init__(
+        self,
+        provider: str,
+        window_calls: int = 20,
+        min_calls: int = 10,
+        failure_rate: float = 0.5,
+        slow_call_seconds: float = 30.0,
+        slow_call_rate: float = 0.8,
+        open_seconds: float = 30.0,
+        enabled: bool = True
+    ):
+        self.provider = provider
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.enabled = enabled
+        self.state = CLOSED
+        self.trips = 0
+        self.rejected = 0
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=window_calls)  # (failed, slow)
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+        self._latencies: Dict[str, Deque[float]] = {}
+
+    @classmethod
+    def from_settings(cls, provider: str) -> "CircuitBreaker":
+        return cls(
+            provider,
+            window_calls=settings.LLM_BREAKER_WINDOW_CALLS,
+            min_calls=settings.LLM_BREAKER_MIN_CALLS,
+            failure_rate=settings.LLM_BREAKER_FAILURE_RATE,
+            slow_call_seconds=settings.LLM_BREAKER_SLOW_CALL_SECONDS,
+            slow_call_rate=settings.LLM_BREAKER_SLOW_CALL_RATE,
+            open_seconds=settings.LLM_BREAKER_OPEN_SECONDS,
+            enabled=settings.LLM_BREAKER_ENABLED
+        )
+
+    @property
+    def available(self) -> bool:
+        """Whether a call made now would be let through (without claiming the probe)"""
+        if not self.enabled or self.state == CLOSED:
+            return True
+        return self._probe_due(time.monotonic())
+
+    def _probe_due(self, now: float) -> bool:
+        if self.state == OPEN:
+            return now - self._opened_at >= self.open_seconds
+        # A probe that never reported back (e.g. throttled or cancelled) is retried after open_seconds
+        return self._probe_started is None or now - self._probe_started >= self.open_seconds
+
+    def retry_after(self) -> float:
+        started = self._opened_at if self.state == OPEN else (self._probe_started or self._opened_at)
+        return max(0.0, self.open_seconds - (time.monotonic() - started))
+
+    def allow(self) -> bool:
+        """Admit a call, or refuse it while the circuit is open"""
+        if not self.enabled or self.state == CLOSED:
+            return True
+        now = time.monotonic()
+        if not self._probe_due(now):
+            self.rejected += 1
+            return False
+        self.state = HALF_OPEN
+        self._probe_started = now
+        return True
+
+    def record(self, outcome: str, latency: Optional[float] = None, model: Optional[str] = None, streamed: bool = False):
+        """Count a finished call; throttled and cancelled calls say nothing about provider health"""
+        if outcome not in ("success", "error"):
+            return
+        failed = outcome == "error"
+        slow = latency is not None and latency >= self.slow_call_seconds
+        if not failed and latency is not None and model is not None and not streamed:
+            self._latencies.setdefault(model, deque(maxlen=self.LATENCY_SAMPLES)).append(latency)
+
+        if self.state == HALF_OPEN:
+            if failed or slow:
+                self._trip()
+            else:
+                self.state = CLOSED
+                self._probe_started = None
+                self._outcomes.clear()
+            return
+        if self.state == OPEN:
+            # A call admitted before the circuit tripped
+            return
+
+        self._outcomes.append((failed, slow))
+        calls = len(self._outcomes)
+        if calls < self.min_calls:
+            return
+        failures = sum(1 for f, _ in self._outcomes if f)
+        slow_calls = sum(1 for _, s in self._outcomes if s)
+        if failures / calls >= self.failure_rate or slow_calls / calls >= self.slow_call_rate:
+            self._trip()
+
+    def _trip(self):
+        self.state = OPEN
+        self.trips += 1
+        self._opened_at = time.monotonic()
+        self._probe_started = None
+        self._outcomes.clear()
+
+    def latency_percentile(self, model: str, pct: float, min_samples: int = 1) -> Optional[float]:
+        """Nearest-rank percentile of recent successful non-streaming call latencies for a model"""
+        samples = self._latencies.get(model)
+        if not samples or len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+    def stats(self) -> dict:
+        calls = len(self._outcomes)
+        return {
+            "provider": self.provider,
+            "state": self.state,
+            "recent_calls": calls,
+            "recent_failure_rate": round(sum(1 for f, _ in self._outcomes if f) / calls, 3) if calls else 0.0,
+            "trips": self.trips,
+            "rejected_calls": self.rejected,
+            "retry_after_seconds": round(self.retry_after(), 1) if self.state != CLOSED else 0,
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(provider: str) -> CircuitBreaker:
+    """Shared breaker for a provider, created on first use"""
+    breaker = _breakers.get(provider)
+    if breaker is None:
+        breaker = CircuitBreaker.from_settings(provider)
+        _breakers[provider] = breaker
+    return breaker
+
+
+def all_circuit_breakers() -> Dict[str, CircuitBreaker]:
+    """Every breaker created so far, keyed by provider"""
+    return dict(_breakers)
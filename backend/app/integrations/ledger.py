@@ -0,0 +1,212 @@
+"""Per-call LLM latency ledger, written to the llm_calls table in the background"""
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Deque, Dict, List, Optional
+
+from app.core.config import settings
+from app.integrations.tokenizer import TokenUsage
+
+logger = logging.getLogger(__name__)
+
+
+class LLMCallRecord:
+    """Timings and outcome of one LLM call, measured from the moment it was requested"""
+
+    def __init__(self, provider: str, model: str, usage: TokenUsage, streamed: bool = False):
+        self.provider = provider
+        self.model = model
+        self.usage = usage
+        self.streamed = streamed
+        self.queue_wait_seconds = 0.0
+        self.ttft_seconds: Optional[float] = None
+        self.total_seconds: Optional[float] = None
+        self.outcome: Optional[str] = None
+        self.error_message: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self._started = time.monotonic()
+
+    def first_token(self):
+        """Mark the arrival of the first chunk (later calls are ignored)"""
+        if self.ttft_seconds is None:
+            self.ttft_seconds = time.monotonic() - self._started
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        if self.total_seconds is None or self.ttft_seconds is None:
+            return None
+        generating = self.total_seconds - self.ttft_seconds
+        if generating <= 0:
+            return None
+        return self.usage.completion_tokens / generating
+
+    def finish(self, outcome: str, error: Optional[BaseException] = None):
+        """Close the record and hand it to the ledger (only the first call counts)"""
+        if self.outcome is not None:
+            return
+        self.total_seconds = time.monotonic() - self._started
+        if self.ttft_seconds is None and outcome == "success":
+            # Non-streaming calls see their first token with the whole response
+            self.ttft_seconds = self.total_seconds
+        self.outcome = outcome
+        self.error_message = str(error)[:1000] if error is not None else None
+        latency_ledger.record(self)
+
+    def to_row(self) -> dict:
+        def ms(seconds):
+            return int(seconds * 1000) if seconds is not None else None
+
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "streamed": self.streamed,
+            "queue_wait_ms": ms(self.queue_wait_seconds),
+            "ttft_ms": ms(self.ttft_seconds),
+            "total_ms": ms(self.total_seconds),
+            "tokens_per_second": self.tokens_per_second,
+            "prompt_tokens": self.usage.prompt_tokens,
+            "completion_tokens": self.usage.completion_tokens,
+            "cache_hit": self.usage.cached,
+            "outcome": self.outcome,
+            "error_message": self.error_message,
+            "created_at": self.created_at,
+        }
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class LatencyLedger:
+    """Buffers call records in memory and bulk-inserts them off the request path"""
+
+    def __init__(
+        self,
+        batch_size: int = 200,
+        flush_interval: float = 2.0,
+        max_pending: int = 10000,
+        session_factory: Optional[Callable] = None,
+        enabled: bool = True
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self.session_factory = session_factory
+        self.dropped = 0
+        self._pending: Deque[dict] = deque(maxlen=max_pending)
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    @classmethod
+    def from_settings(cls) -> "LatencyLedger":
+        return cls(
+            batch_size=settings.LLM_LEDGER_BATCH_SIZE,
+            flush_interval=settings.LLM_LEDGER_FLUSH_INTERVAL_SECONDS,
+            max_pending=settings.LLM_LEDGER_MAX_PENDING,
+            enabled=settings.LLM_LEDGER_ENABLED
+        )
+
+    def record(self, call: LLMCallRecord):
+        """Queue a finished call; never blocks the caller"""
+        if not self.enabled:
+            return
+        if len(self._pending) == self._pending.maxlen:
+            # The oldest record is pushed out rather than stalling generation
+            self.dropped += 1
+        self._pending.append(call.to_row())
+        self._ensure_writer()
+        if len(self._pending) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _ensure_writer(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._writer())
+
+    async def _writer(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to write LLM call ledger: {e}")
+
+    async def flush(self):
+        """Write every pending record in batches"""
+        while self._pending:
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            await asyncio.get_running_loop().run_in_executor(None, self._write, batch)
+
+    def _write(self, rows: List[dict]):
+        from app.models import LLMCall
+
+        if self.session_factory is None:
+            from app.database import SessionLocal
+            self.session_factory = SessionLocal
+        db = self.session_factory()
+        try:
+            db.bulk_insert_mappings(LLMCall, rows)
+            db.commit()
+        finally:
+            db.close()
+
+    async def aclose(self):
+        """Stop the background writer and flush what is left"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        await self.flush()
+
+    @staticmethod
+    def summarize(db, since: datetime) -> List[Dict]:
+        """Latency percentiles per provider and model for calls since a point in time"""
+        from app.models import LLMCall
+
+        rows = db.query(
+            LLMCall.provider, LLMCall.model, LLMCall.outcome, LLMCall.cache_hit,
+            LLMCall.queue_wait_ms, LLMCall.ttft_ms, LLMCall.total_ms, LLMCall.tokens_per_second
+        ).filter(LLMCall.created_at >= since).all()
+
+        groups: Dict[tuple, List] = {}
+        for row in rows:
+            groups.setdefault((row.provider, row.model), []).append(row)
+
+        summary = []
+        for (provider, model), calls in sorted(groups.items(), key=lambda item: (item[0][0] or "", item[0][1] or "")):
+            # Cache hits and failures would drag the provider latency numbers down
+            served = [c for c in calls if c.outcome == "success" and not c.cache_hit]
+            entry = {
+                "provider": provider,
+                "model": model,
+                "calls": len(calls),
+                "cache_hits": sum(1 for c in calls if c.cache_hit),
+                "errors": sum(1 for c in calls if c.outcome == "error"),
+                "rate_limited": sum(1 for c in calls if c.outcome == "rate_limited"),
+            }
+            for metric in ("queue_wait_ms", "ttft_ms", "total_ms", "tokens_per_second"):
+                values = [getattr(c, metric) for c in served if getattr(c, metric) is not None]
+                entry[metric] = {f"p{p}": _percentile(values, p) for p in (50, 95, 99)}
+            summary.append(entry)
+        return summary
+
+
+latency_ledger = LatencyLedger.from_settings()
@@ -0,0 +1,379 @@
+"""Per-user request and token budgets over sliding windows"""
+import asyncio
+import logging
+import time
+import weakref
+from contextlib import asynccontextmanager, nullcontext
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+REQUESTS = "requests"
+TOKENS = "tokens"
+
+
+def _key(user: Hashable, kind: str) -> str:
+    return f"{user}:{kind}"
+
+
+class QuotaExceededError(Exception):
+    """A user's tier budget for the current window would be exceeded"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None, kind: str = TOKENS,
+                 limit: int = 0, used: int = 0):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.kind = kind
+        self.limit = limit
+        self.used = used
+
+
+class MemoryWindowStore:
+    """In-process fixed-window counts; the sliding total is derived from the current and previous window"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._counts: Dict[str, Tuple[int, int, int]] = {}  # key -> (window, current, previous)
+
+    def _windows(self, key: str, window: int) -> Tuple[int, int]:
+        entry = self._counts.get(key)
+        if entry is None:
+            return 0, 0
+        stored_window, current, previous = entry
+        if stored_window == window:
+            return current, previous
+        if stored_window == window - 1:
+            return 0, current
+        return 0, 0
+
+    async def read(self, keys: List[str], window: int) -> List[Tuple[int, int]]:
+        """(current, previous) window counts per key"""
+        return [self._windows(key, window) for key in keys]
+
+    async def add(self, increments: Dict[str, int], window: int):
+        self.increment(increments, window)
+    
+    async def add_and_read(self, increments: Dict[str, int], window: int) -> List[Tuple[int, int]]:
+        """Apply increments, then (current, previous) window counts per incremented key"""
+        self.increment(increments, window)
+        return [self._windows(key, window) for key in increments]
+
+    def increment(self, increments: Dict[str, int], window: int):
+        """Add to window's counts; a late change for an earlier window never touches the current one"""
+        for key, amount in increments.items():
+            entry = self._counts.get(key)
+            if entry is not None and entry[0] > window:
+                stored_window, current, previous = entry
+                if stored_window == window + 1:
+                    self._counts[key] = (stored_window, current, max(0, previous + amount))
+                continue
+            current, previous = self._windows(key, window)
+            if key not in self._counts and len(self._counts) >= self.max_keys:
+                self._prune(window)
+            self._counts[key] = (window, current + amount, previous)
+
+    def _prune(self, window: int):
+        for key, (stored_window, _, _) in list(self._counts.items()):
+            if stored_window < window - 1:
+                del self._counts[key]
+
+    def clear(self):
+        self._counts.clear()
+
+
+class RedisWindowStore:
+    """Fixed-window counts in Redis, shared by every API node and worker"""
+
+    KEY_PREFIX = "quota:"
+    # INCRBY that never leaves a count below zero, e.g. after a late settlement for a window already spent
+    ADD_SCRIPT = """
+    local count = redis.call('INCRBY', KEYS[1], ARGV[1])
+    if count < 0 then
+        redis.call('SET', KEYS[1], 0)
+    end
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    """
+
+    def __init__(self, redis_url: str, window_seconds: int):
+        import redis.asyncio as aioredis
+
+        self._redis = aioredis.from_url(redis_url, decode_responses=True)
+        self._add = self._redis.register_script(self.ADD_SCRIPT)
+        self.window_seconds = window_seconds
+
+    def _key(self, key: str, window: int) -> str:
+        return f"{self.KEY_PREFIX}{key}:{window}"
+
+    async def read(self, keys: List[str], window: int) -> List[Tuple[int, int]]:
+        names = [name for key in keys for name in (self._key(key, window), self._key(key, window - 1))]
+        values = await self._redis.mget(names)
+        counts = [int(v or 0) for v in values]
+        return [(counts[i], counts[i + 1]) for i in range(0, len(counts), 2)]
+
+    async def add(self, increments: Dict[str, int], window: int):
+        """Add to window's own keys, so changes for an earlier window never touch the current one"""
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for key, amount in increments.items():
+                await self._add(keys=[self._key(key, window)], args=[amount, self.window_seconds * 2], client=pipe)
+            await pipe.execute()
+
+    async def add_and_read(self, increments: Dict[str, int], window: int) -> List[Tuple[int, int]]:
+        """INCRBY each key and read its previous window in one round trip; the counts include this increment"""
+        async with self._redis.pipeline(transaction=True) as pipe:
+            for key, amount in increments.items():
+                name = self._key(key, window)
+                pipe.incrby(name, amount)
+                pipe.expire(name, self.window_seconds * 2)
+                pipe.get(self._key(key, window - 1))
+            results = await pipe.execute()
+        return [(int(results[i]), int(results[i + 2] or 0)) for i in range(0, len(results), 3)]
+
+    def clear(self):
+        pass
+
+
+class QuotaReservation:
+    """Tokens held against a user's budget for one call; settle() swaps the estimate for actual usage"""
+
+    def __init__(self, manager: "QuotaManager", user: str, window: int, reserved_tokens: int):
+        self.manager = manager
+        self.user = user
+        self.window = window
+        self.reserved_tokens = reserved_tokens
+        self.settled = False
+
+    def settle(self, actual_tokens: int):
+        """Correct the reservation to the tokens actually spent; only the first call counts"""
+        if self.settled:
+            return
+        self.settled = True
+        delta = int(actual_tokens) - self.reserved_tokens
+        if delta:
+            self.manager._add_later({_key(self.user, TOKENS): delta}, self.window)
+
+
+class QuotaManager:
+    """Enforces tiered request and token budgets per user over a sliding window.
+
+    The window total is approximated from two fixed windows: the current
+    count plus the previous count weighted by how much of it still overlaps.
+    """
+
+    def __init__(
+        self,
+        window_seconds: int,
+        tiers: Dict[str, Dict[str, int]],
+        default_tier: str = "free",
+        default_requests: int = 0,
+        store=None,
+        enabled: bool = True
+    ):
+        self.window_seconds = window_seconds
+        self.tiers = tiers
+        self.default_tier = default_tier
+        self.default_requests = default_requests
+        self.store = store or MemoryWindowStore()
+        self.enabled = enabled
+        self.rejected = 0
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    @classmethod
+    def from_settings(cls) -> "QuotaManager":
+        store = None
+        if settings.QUOTA_BACKEND == "redis":
+            if not settings.REDIS_URL:
+                raise ValueError("QUOTA_BACKEND=redis requires REDIS_URL")
+            store = RedisWindowStore(settings.REDIS_URL, settings.RATE_LIMIT_PERIOD)
+        elif settings.QUOTA_BACKEND != "memory":
+            raise ValueError(f"Unsupported quota backend: {settings.QUOTA_BACKEND}")
+        return cls(
+            settings.RATE_LIMIT_PERIOD,
+            settings.QUOTA_TIERS,
+            settings.QUOTA_DEFAULT_TIER,
+            settings.RATE_LIMIT_REQUESTS,
+            store,
+            settings.QUOTA_ENABLED
+        )
+
+    def limits_for(self, tier: Optional[str]) -> Dict[str, int]:
+        """Request and token limits of a tier (0 = unlimited); unknown tiers get the default tier"""
+        config = self.tiers.get(tier or self.default_tier)
+        if config is None:
+            config = self.tiers.get(self.default_tier, {})
+        return {
+            REQUESTS: config.get(REQUESTS, self.default_requests),
+            TOKENS: config.get(TOKENS, 0),
+        }
+
+    def _position(self) -> Tuple[int, float]:
+        now = time.time()
+        window = int(now // self.window_seconds)
+        return window, now - window * self.window_seconds
+
+    def _retry_after(self, current: int, previous: int, need: int, limit: int, elapsed: float) -> Optional[float]:
+        """Seconds until need more fits under limit, assuming no further usage"""
+        if need > limit:
+            return None
+        if current + need <= limit:
+            # Only the previous window's weight has to decay
+            overlap = (limit - current - need) / previous
+            return max(0.0, (1 - overlap) * self.window_seconds - elapsed)
+        # The current window has to roll over and then decay in turn
+        overlap = (limit - need) / current
+        return (self.window_seconds - elapsed) + max(0.0, 1 - overlap) * self.window_seconds
+
+    def _weighted(self, counts: List[Tuple[int, int]], elapsed: float) -> Dict[str, Tuple[int, int, float]]:
+        """(current, previous, sliding total) per kind from request and token window counts"""
+        weight = 1 - elapsed / self.window_seconds
+        return {
+            kind: (current, previous, current + previous * weight)
+            for kind, (current, previous) in zip((REQUESTS, TOKENS), counts)
+        }
+    
+    async def _usage(self, user: str, window: int, elapsed: float) -> Dict[str, Tuple[int, int, float]]:
+        counts = await self.store.read([_key(user, REQUESTS), _key(user, TOKENS)], window)
+        return self._weighted(counts, elapsed)
+    
+    def _enforce(self, tier: Optional[str], limits: Dict[str, int], usage: Dict[str, Tuple[int, int, float]],
+                 elapsed: float, tokens: int, requests: int):
+        """Raise QuotaExceededError unless the requested usage fits on top of usage"""
+        for kind, need, unit in ((REQUESTS, requests, "requests"), (TOKENS, tokens, "tokens")):
+            limit = limits[kind]
+            current, previous, used = usage[kind]
+            if not limit:
+                continue
+            # A zero-sized check still fails once the budget is already spent
+            fits = used + need <= limit if need else used < limit
+            if fits:
+                continue
+            self.rejected += 1
+            retry_after = self._retry_after(current, previous, max(need, 1), limit, elapsed)
+            tier_name = tier if tier in self.tiers else self.default_tier
+            if retry_after is None:
+                message = (f"Request needs an estimated {need:,} {unit}, more than the '{tier_name}' tier's "
+                           f"budget of {limit:,} {unit} per {self.window_seconds}s")
+            else:
+                message = (f"Quota exceeded for tier '{tier_name}': {int(used):,} of {limit:,} {unit} used "
+                           f"in the last {self.window_seconds}s; retry in {int(retry_after) + 1}s")
+            raise QuotaExceededError(message, retry_after, kind, limit, int(used))
+    
+    async def check(self, user: str, tier: Optional[str], tokens: int = 0, requests: int = 0):
+        """Raise QuotaExceededError unless the requested usage fits the user's remaining budget"""
+        if not self.enabled:
+            return
+        limits = self.limits_for(tier)
+        if not limits[REQUESTS] and not limits[TOKENS]:
+            return
+        
+        window, elapsed = self._position()
+        try:
+            usage = await self._usage(user, window, elapsed)
+        except Exception as e:
+            # Budgets fail open: an unreachable counter store must not take generation down
+            logger.warning(f"Quota store read failed, allowing request: {e}")
+            return
+        self._enforce(tier, limits, usage, elapsed, tokens, requests)
+    
+    def _user_lock(self, user: str):
+        """Serialises a user's reservations on the in-process store; shared stores rely on increment-then-compare"""
+        if not isinstance(self.store, MemoryWindowStore):
+            return nullcontext()
+        lock = self._locks.get(user)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[user] = lock
+        return lock
+    
+    async def reserve(self, user: str, tier: Optional[str], estimated_tokens: int) -> QuotaReservation:
+        """Count one request plus its estimated tokens before dispatching an LLM call, or refuse it.
+        
+        The counters are incremented first and compared after, with the increment
+        rolled back on refusal, so concurrent reservations (on any node) can't all
+        pass a check that only some of them fit.
+        """
+        window, elapsed = self._position()
+        estimated_tokens = int(estimated_tokens)
+        if not self.enabled:
+            return QuotaReservation(self, user, window, 0)
+        
+        limits = self.limits_for(tier)
+        increments = {_key(user, REQUESTS): 1, _key(user, TOKENS): estimated_tokens}
+        async with self._user_lock(user):
+            try:
+                counts = await self.store.add_and_read(increments, window)
+            except Exception as e:
+                # Budgets fail open: an unreachable counter store must not take generation down
+                logger.warning(f"Quota store write failed, allowing request: {e}")
+                return QuotaReservation(self, user, window, 0)
+            
+            # Judge the request against usage as it stood before its own increment
+            before = [(current - amount, previous) for (current, previous), amount in zip(counts, increments.values())]
+            try:
+                self._enforce(tier, limits, self._weighted(before, elapsed), elapsed, estimated_tokens, 1)
+            except QuotaExceededError:
+                await self._roll_back(increments, window)
+                raise
+        return QuotaReservation(self, user, window, estimated_tokens)
+    
+    async def _roll_back(self, increments: Dict[str, int], window: int):
+        try:
+            await self.store.add({key: -amount for key, amount in increments.items()}, window)
+        except Exception as e:
+            logger.warning(f"Quota rollback failed: {e}")
+    
+    @asynccontextmanager
+    async def charge(self, user: str, tier: Optional[str], usage, prompt: str = ""):
+        """Reserve budget for one LLM call, then settle it with the call's TokenUsage.
+
+        Tokens served from the LLM cache cost nothing (see TokenUsage.billable_tokens).
+        """
+        from app.integrations.tokenizer import count_tokens
+
+        estimate = settings.QUOTA_COMPLETION_ESTIMATE_TOKENS
+        if prompt and self.enabled:
+            estimate += count_tokens(prompt, usage.model)
+        reservation = await self.reserve(user, tier, estimate)
+        try:
+            yield reservation
+        finally:
+            reservation.settle(usage.billable_tokens)
+
+    def _add_later(self, increments: Dict[str, int], window: int):
+        """Apply a settlement without making the caller wait on the store.
+
+        A settlement for a window that no longer counts towards the sliding
+        total (older than the previous window) is dropped.
+        """
+        if window < self._position()[0] - 1:
+            return
+        if isinstance(self.store, MemoryWindowStore):
+            self.store.increment(increments, window)
+            return
+
+        async def apply():
+            try:
+                await self.store.add(increments, window)
+            except Exception as e:
+                logger.warning(f"Quota settlement failed: {e}")
+
+        asyncio.ensure_future(apply())
+
+    async def usage(self, user: str, tier: Optional[str]) -> dict:
+        """Current sliding-window usage against the user's tier limits"""
+        limits = self.limits_for(tier)
+        window, elapsed = self._position()
+        usage = await self._usage(user, window, elapsed)
+        return {
+            "tier": tier if tier in self.tiers else self.default_tier,
+            "window_seconds": self.window_seconds,
+            "enforced": self.enabled,
+            **{
+                kind: {"used": int(usage[kind][2]), "limit": limits[kind] or None}
+                for kind in (REQUESTS, TOKENS)
+            }
+        }
+
+
+quota_manager = QuotaManager.from_settings()
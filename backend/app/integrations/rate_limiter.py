@@ -0,0 +1,262 @@
+"""Provider-aware rate limiting and adaptive concurrency for LLM calls"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from app.core.config import settings
+
+
+class LLMRateLimitError(Exception):
+    """Provider throttled the call (HTTP 429 / quota exhausted) or the local queue wait ran out"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Detect provider 429s across SDK exception types"""
+    if isinstance(error, LLMRateLimitError):
+        return True
+    for attr in ("status_code", "code", "status"):
+        if getattr(error, attr, None) == 429:
+            return True
+    return type(error).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests")
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at a per-minute rate; waiters are served FIFO"""
+
+    def __init__(self, rate_per_minute: int, capacity: Optional[int] = None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = float(capacity or rate_per_minute)
+        self.tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated_at) * self.rate_per_second)
+        self._updated_at = now
+
+    def _get_lock(self) -> asyncio.Lock:
+        # asyncio.Lock is FIFO for waiters, which gives queued calls fair ordering
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._loop is not loop:
+            self._lock = asyncio.Lock()
+            self._loop = loop
+        return self._lock
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount tokens would be available"""
+        self._refill()
+        deficit = min(amount, self.capacity) - self.tokens
+        return max(0.0, deficit / self.rate_per_second) if self.rate_per_second else float("inf")
+
+    async def acquire(self, amount: float, max_wait: float):
+        """Take amount tokens, waiting in line for the bucket to refill if needed"""
+        amount = min(amount, self.capacity)
+        async with self._get_lock():
+            wait = self.wait_time(amount)
+            if wait > max_wait:
+                raise LLMRateLimitError("LLM rate limit queue wait exceeded", retry_after=wait)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                self._refill()
+            self.tokens -= amount
+
+    def adjust(self, delta: float):
+        """Consume (positive) or refund (negative) tokens after the actual cost is known"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class AdaptiveConcurrencyLimit:
+    """AIMD concurrency limit: additive increase on success, multiplicative decrease on throttling"""
+
+    DECREASE_ON_THROTTLE = 0.5
+    DECREASE_ON_LATENCY = 0.8
+    LATENCY_EWMA_ALPHA = 0.2
+    DECREASE_COOLDOWN_SECONDS = 1.0
+
+    def __init__(self, maximum: int, minimum: int = 1, latency_spike_factor: float = 2.0):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(maximum)
+        self.latency_spike_factor = latency_spike_factor
+        self.in_flight = 0
+        self.latency_ewma: Optional[float] = None
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self):
+        """Wait (FIFO) for a slot under the current limit"""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # A slot was handed over just as we were cancelled; pass it on
+                self.in_flight -= 1
+                self._wake()
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            raise
+
+    def release(self, latency: Optional[float] = None, throttled: bool = False):
+        """Return a slot and adapt the limit to the call's outcome"""
+        self.in_flight -= 1
+        if throttled:
+            self._decrease(self.DECREASE_ON_THROTTLE)
+        elif latency is not None and self._is_latency_spike(latency):
+            self._decrease(self.DECREASE_ON_LATENCY)
+        else:
+            self.limit = min(self.maximum, self.limit + 1.0 / max(self.limit, 1.0))
+
+        if latency is not None:
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+            else:
+                self.latency_ewma += self.LATENCY_EWMA_ALPHA * (latency - self.latency_ewma)
+        self._wake()
+
+    def _is_latency_spike(self, latency: float) -> bool:
+        return self.latency_ewma is not None and latency > self.latency_ewma * self.latency_spike_factor
+
+    def _decrease(self, factor: float):
+        now = time.monotonic()
+        # One burst of 429s should back off once, not collapse the limit to the floor
+        if now - self._last_decrease < self.DECREASE_COOLDOWN_SECONDS:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.minimum), self.limit * factor)
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+
+class CallPermit:
+    """Reservation held for the duration of one provider call"""
+
+    def __init__(self, limiter: "ProviderRateLimiter", reserved_tokens: float):
+        self.limiter = limiter
+        self.reserved_tokens = reserved_tokens
+        self.queue_wait_seconds = 0.0
+        self.latency: Optional[float] = None
+        self.throttled = False
+
+    def settle(self, actual_tokens: float):
+        """Reconcile the token bucket with the call's actual token usage"""
+        self.limiter.tokens.adjust(actual_tokens - self.reserved_tokens)
+        self.reserved_tokens = actual_tokens
+
+
+class ProviderRateLimiter:
+    """Requests/min and tokens/min buckets plus adaptive concurrency for one provider"""
+
+    def __init__(
+        self,
+        provider: str,
+        requests_per_minute: int,
+        tokens_per_minute: int,
+        max_concurrency: int,
+        min_concurrency: int = 1,
+        max_wait_seconds: float = 120.0
+    ):
+        self.provider = provider
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.concurrency = AdaptiveConcurrencyLimit(max_concurrency, min_concurrency)
+        self.max_wait_seconds = max_wait_seconds
+        self.throttled_calls = 0
+
+    @classmethod
+    def from_settings(cls, provider: str) -> "ProviderRateLimiter":
+        """Build a limiter from global defaults and per-provider overrides"""
+        overrides = settings.LLM_PROVIDER_LIMITS.get(provider, {})
+        return cls(
+            provider,
+            requests_per_minute=overrides.get("requests_per_minute", settings.LLM_REQUESTS_PER_MINUTE),
+            tokens_per_minute=overrides.get("tokens_per_minute", settings.LLM_TOKENS_PER_MINUTE),
+            max_concurrency=overrides.get("max_concurrency", settings.LLM_MAX_CONCURRENCY),
+            min_concurrency=overrides.get("min_concurrency", settings.LLM_MIN_CONCURRENCY),
+            max_wait_seconds=settings.LLM_RATE_LIMIT_MAX_WAIT_SECONDS
+        )
+
+    @asynccontextmanager
+    async def limit(self, estimated_tokens: float):
+        """Wait for a concurrency slot and request/token budget, then hold them for one call"""
+        started = time.monotonic()
+        await self.concurrency.acquire()
+        permit = CallPermit(self, min(estimated_tokens, self.tokens.capacity))
+        try:
+            remaining = self.max_wait_seconds - (time.monotonic() - started)
+            await self.requests.acquire(1, remaining)
+            await self.tokens.acquire(permit.reserved_tokens, self.max_wait_seconds - (time.monotonic() - started))
+            permit.queue_wait_seconds = time.monotonic() - started
+        except BaseException:
+            self.concurrency.release()
+            raise
+
+        call_started = time.monotonic()
+        try:
+            yield permit
+        except Exception as e:
+            if is_rate_limit_error(e):
+                permit.throttled = True
+            raise
+        finally:
+            if permit.throttled:
+                self.throttled_calls += 1
+            latency = permit.latency if permit.latency is not None else time.monotonic() - call_started
+            self.concurrency.release(latency=latency, throttled=permit.throttled)
+
+    def stats(self) -> dict:
+        """Current limits, queue depth and remaining budget"""
+        self.requests._refill()
+        self.tokens._refill()
+        return {
+            "provider": self.provider,
+            "concurrency_limit": int(self.concurrency.limit),
+            "in_flight": self.concurrency.in_flight,
+            "queued": self.concurrency.queued,
+            "requests_available": int(self.requests.tokens),
+            "tokens_available": int(self.tokens.tokens),
+            "throttled_calls": self.throttled_calls,
+        }
+
+
+_limiters: Dict[str, ProviderRateLimiter] = {}
+
+
+def get_rate_limiter(provider: str) -> ProviderRateLimiter:
+    """Shared limiter for a provider, created on first use"""
+    limiter = _limiters.get(provider)
+    if limiter is None:
+        limiter = ProviderRateLimiter.from_settings(provider)
+        _limiters[provider] = limiter
+    return limiter
+
+
+def all_rate_limiters() -> Dict[str, ProviderRateLimiter]:
+    """Every limiter created so far, keyed by provider"""
+    return dict(_limiters)
@@ -0,0 +1,164 @@
+"""Per-request model selection from section attributes and user tier"""
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Request attributes a routing rule can match on
+ROUTING_ATTRIBUTES = ("content_type", "length", "tone", "tier")
+
+# Built-in targets: the provider's default (strong) model and its fast, cheap model
+STRONG = "strong"
+FAST = "fast"
+
+
+class RoutingRule:
+    """Sends requests whose attributes all match to a target model.
+
+    Each condition is a value or list of values; attributes a rule leaves out match anything.
+    """
+
+    def __init__(self, model: str, name: Optional[str] = None, fallbacks: Optional[List[str]] = None, **conditions):
+        unknown = set(conditions) - set(ROUTING_ATTRIBUTES)
+        if unknown:
+            raise ValueError(f"Unknown routing attributes: {', '.join(sorted(unknown))}")
+        self.model = model
+        self.name = name or model
+        self.fallbacks = fallbacks
+        self.conditions = {
+            key: {str(v).lower() for v in (value if isinstance(value, (list, tuple, set)) else [value])}
+            for key, value in conditions.items()
+        }
+
+    def matches(self, attributes: Dict[str, Optional[str]]) -> bool:
+        return all(
+            str(attributes.get(key) or "").lower() in values
+            for key, values in self.conditions.items()
+        )
+
+
+class RouteDecision:
+    """The rule that matched and the (provider, model) targets to try, in order"""
+
+    def __init__(self, rule: str, targets: List[Tuple[str, Optional[str]]]):
+        self.rule = rule
+        self.targets = targets
+
+
+class ModelRouter:
+    """Picks the model for each generation; the first matching rule wins, else the default target.
+
+    Targets are "strong", "fast", "provider" or "provider:model". If a target's
+    call fails before producing output, its fallbacks are tried in turn, then
+    the failover providers' default models. Models whose provider circuit is
+    open go to the back of the list.
+    """
+
+    def __init__(
+        self,
+        rules: Sequence[dict],
+        fallbacks: Optional[Dict[str, List[str]]] = None,
+        default: str = STRONG,
+        enabled: bool = True,
+        provider: Optional[str] = None,
+        fast_model: Optional[str] = None,
+        failover_providers: Sequence[str] = (),
+        registry=None
+    ):
+        self.rules = [RoutingRule(**rule) for rule in rules]
+        self.fallbacks = fallbacks or {}
+        self.default = default
+        self.enabled = enabled
+        self.provider = provider
+        self.fast_model = fast_model
+        self.failover_providers = list(failover_providers)
+        self._registry = registry
+        self.routed: Dict[str, int] = {}
+
+    @classmethod
+    def from_settings(cls) -> "ModelRouter":
+        return cls(
+            settings.LLM_ROUTING_RULES,
+            settings.LLM_ROUTING_FALLBACKS,
+            settings.LLM_ROUTING_DEFAULT,
+            settings.LLM_ROUTING_ENABLED,
+            fast_model=settings.LLM_FAST_MODEL,
+            failover_providers=settings.LLM_FAILOVER_PROVIDERS
+        )
+
+    @property
+    def registry(self):
+        if self._registry is None:
+            from app.integrations import llm_registry
+            self._registry = llm_registry
+        return self._registry
+
+    def resolve(self, target: str) -> Tuple[str, Optional[str]]:
+        """(provider, model) for a target; a None model is the provider's default"""
+        from app.integrations import FAST_MODELS
+
+        provider = self.provider or settings.LLM_PROVIDER
+        if target == STRONG:
+            return provider, None
+        if target == FAST:
+            return provider, self.fast_model or FAST_MODELS.get(provider)
+        provider, _, model = target.partition(":")
+        return provider, model or None
+
+    def route(
+        self,
+        content_type: Optional[str] = None,
+        length: Optional[str] = None,
+        tone: Optional[str] = None,
+        tier: Optional[str] = None
+    ) -> RouteDecision:
+        """Choose the target, and its fallbacks, for one request"""
+        if not self.enabled:
+            name, target, fallbacks = "disabled", STRONG, []
+        else:
+            attributes = {"content_type": content_type, "length": length, "tone": tone, "tier": tier}
+            rule = next((r for r in self.rules if r.matches(attributes)), None)
+            name = rule.name if rule is not None else "default"
+            target = rule.model if rule is not None else self.default
+            fallbacks = rule.fallbacks if rule is not None and rule.fallbacks is not None else self.fallbacks.get(target, [])
+
+        targets = []
+        for candidate in [target, *fallbacks, *self.failover_providers]:
+            resolved = self.resolve(candidate)
+            if resolved not in targets:
+                targets.append(resolved)
+        decision = RouteDecision(name, targets)
+        self.routed[decision.rule] = self.routed.get(decision.rule, 0) + 1
+        return decision
+
+    def clients(self, **attributes) -> list:
+        """LLM clients for a request: the routed model first, then its fallbacks"""
+        from app.integrations.circuit_breaker import get_circuit_breaker
+
+        clients = []
+        for provider, model in self.route(**attributes).targets:
+            try:
+                client = self.registry.get(provider, model)
+            except Exception as e:
+                # A misconfigured fallback must not take down the primary route
+                logger.warning(f"Skipping unavailable model {provider}:{model}: {e}")
+                continue
+            if all(client is not c for c in clients):
+                clients.append(client)
+        if not clients:
+            raise ValueError("No LLM model available for this request")
+        # Skip straight past providers that are known to be down
+        return sorted(clients, key=lambda c: not get_circuit_breaker(c.provider).available)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "rules": [rule.name for rule in self.rules],
+            "default": self.default,
+            "routed": dict(self.routed),
+        }
+
+
+model_router = ModelRouter.from_settings()
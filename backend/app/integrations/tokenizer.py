@@ -0,0 +1,114 @@
+"""Token counting for LLM prompts and completions"""
+import logging
+import math
+import re
+from functools import lru_cache
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Word pieces and standalone punctuation, roughly how BPE tokenizers split English
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+@lru_cache(maxsize=16)
+def _get_encoding(model: str):
+    """Load (once per model) a tiktoken encoding, or None when tiktoken is unavailable"""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            # Non-OpenAI models (e.g. Gemini) are approximated with the GPT-4 encoding
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # Encodings are fetched on first use; offline hosts fall back to the estimate
+        logger.warning(f"tiktoken encoding unavailable, estimating tokens: {e}")
+        return None
+
+
+def _estimate(text: str) -> int:
+    """BPE-like estimate: one token per short word or symbol, ~4 characters per token for long words"""
+    return sum(max(1, math.ceil(len(piece) / 4)) for piece in _PIECES.findall(text))
+
+
+@lru_cache(maxsize=4096)
+def _count_cached(text: str, model: str) -> int:
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return _estimate(text)
+
+
+def count_tokens(text: Optional[str], model: str = "gpt-4") -> int:
+    """Count tokens in text for a model; repeated strings (prompt templates) hit a cache"""
+    if not text:
+        return 0
+    # Short chunks are cheap to count and would only churn the cache
+    if len(text) < 64:
+        encoding = _get_encoding(model)
+        return len(encoding.encode(text, disallowed_special=())) if encoding is not None else _estimate(text)
+    return _count_cached(text, model)
+
+
+class TokenUsage:
+    """Prompt and completion token counts for one LLM call"""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.source = "tokenizer"  # 'provider' once the provider reports usage
+        self.cached = False  # the whole response came from the LLM cache
+        # Share of the counts served from the LLM cache, e.g. some parts of a long section
+        self.cached_prompt_tokens = 0
+        self.cached_completion_tokens = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def spent_prompt_tokens(self) -> int:
+        """Prompt tokens actually sent to the provider; cached responses cost nothing"""
+        return 0 if self.cached else self.prompt_tokens - self.cached_prompt_tokens
+
+    @property
+    def spent_completion_tokens(self) -> int:
+        return 0 if self.cached else self.completion_tokens - self.cached_completion_tokens
+
+    @property
+    def billable_tokens(self) -> int:
+        """Tokens charged to quotas and recorded on content rows"""
+        return self.spent_prompt_tokens + self.spent_completion_tokens
+
+    def count_prompt(self, prompt: str):
+        """Count the prompt locally (replaced if the provider reports usage)"""
+        self.prompt_tokens = count_tokens(prompt, self.model)
+
+    def add_completion(self, text: str):
+        """Add locally counted completion tokens, e.g. one streamed chunk"""
+        if self.source != "provider":
+            self.completion_tokens += count_tokens(text, self.model)
+
+    def set_provider_counts(self, prompt_tokens: Optional[int], completion_tokens: Optional[int]):
+        """Record provider-reported usage, which takes precedence over local counts"""
+        if prompt_tokens is None and completion_tokens is None:
+            return
+        if prompt_tokens is not None:
+            self.prompt_tokens = int(prompt_tokens)
+        if completion_tokens is not None:
+            self.completion_tokens = int(completion_tokens)
+        self.source = "provider"
+
+    def to_dict(self) -> dict:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+            "source": self.source,
+            "cached": self.cached,
+        }
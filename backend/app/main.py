@@ -6,6 +6,8 @@ import logging
 
 from app.core.config import settings
 from app.database import init_db
+from app.integrations import llm_registry
+from app.integrations.ledger import latency_ledger
 from app.core.security import get_current_user
 
 # Initialize logging
@@ -37,6 +39,36 @@ async def startup_event():
         logger.info("Database initialized")
     except Exception as e:
         logger.error(f"Failed to initialize database: {e}")
+    
+    try:
+        from app.database import SessionLocal
+        from app.services import GenerationService
+        
+        db = SessionLocal()
+        try:
+            interrupted = GenerationService.recover_interrupted(db)
+        finally:
+            db.close()
+        if interrupted:
+            logger.info(f"Marked {interrupted} interrupted generations as resumable")
+    except Exception as e:
+        logger.error(f"Failed to recover interrupted generations: {e}")
+    
+    try:
+        await llm_registry.warm_up()
+    except Exception as e:
+        logger.error(f"Failed to warm up LLM client: {e}")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release pooled LLM connections and flush the call ledger on shutdown"""
+    await llm_registry.aclose()
+    
+    try:
+        await latency_ledger.aclose()
+    except Exception as e:
+        logger.error(f"Failed to flush LLM call ledger: {e}")
 
 
 @app.get("/health")
@@ -1,5 +1,5 @@
 """Database Models"""
-from sqlalchemy import Column, String, DateTime, Boolean, Integer, ForeignKey, JSON, Text, Enum
+from sqlalchemy import Column, String, DateTime, Boolean, Integer, Float, ForeignKey, JSON, Text, Enum
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
@@ -20,6 +20,7 @@ class User(Base):
     first_name = Column(String(100))
     last_name = Column(String(100))
     profile_picture_url = Column(String(500))
+    tier = Column(String(50), default="free")  # quota tier, see QUOTA_TIERS
     is_active = Column(Boolean, default=True)
     is_email_verified = Column(Boolean, default=False)
     last_login = Column(DateTime)
@@ -62,6 +63,7 @@ class Document(Base):
     config_json = Column(JSON, nullable=False)
     current_version = Column(Integer, default=1)
     is_template = Column(Boolean, default=False)
+    summary_json = Column(JSON)  # rolling per-section digests, fed to later generations as context
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -100,15 +102,21 @@ class GeneratedContent(Base):
     version = Column(Integer, default=1)
     model_used = Column(String(100))  # 'gemini-pro', 'gpt-4', etc.
     prompt_used = Column(Text)
-    tokens_used = Column(Integer)
+    prompt_tokens = Column(Integer)
+    completion_tokens = Column(Integer)
+    tokens_used = Column(Integer)  # prompt_tokens + completion_tokens
+    cache_hit = Column(Boolean, default=False)  # served from the LLM response cache, so no tokens were spent
     generation_time_ms = Column(Integer)
+    status = Column(String(50), default="completed", index=True)  # 'in_progress', 'interrupted', 'draft', 'completed'
+    checkpointed_at = Column(DateTime)  # last partial-content checkpoint while streaming
     is_approved = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     section = relationship("Section", back_populates="generated_contents")
-    refinements = relationship("Refinement", back_populates="generated_content", cascade="all, delete-orphan")
+    refinements = relationship("Refinement", back_populates="generated_content", cascade="all, delete-orphan", foreign_keys="Refinement.generated_content_id")
+    regenerated_from = relationship("Refinement", foreign_keys="Refinement.regenerated_content_id", viewonly=True)  # feedback this version applied
 
 
 class Refinement(Base):
@@ -123,10 +131,30 @@ class Refinement(Base):
     suggested_changes = Column(Text)
     is_processed = Column(Boolean, default=False)
     regenerated_content_id = Column(UUID(as_uuid=True), ForeignKey("generated_content.id"), nullable=True)
+    job_id = Column(UUID(as_uuid=True), ForeignKey("refinement_jobs.id", ondelete="CASCADE"), nullable=True, index=True)
+    error_message = Column(Text)  # why the last attempt to apply it failed
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     generated_content = relationship("GeneratedContent", back_populates="refinements", foreign_keys=[generated_content_id])
+    job = relationship("RefinementJob", back_populates="refinements")
+
+
+class RefinementJob(Base):
+    """One instruction applied to every approved section of a document, one refinement per section"""
+    __tablename__ = "refinement_jobs"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    document_id = Column(UUID(as_uuid=True), ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+    instruction = Column(Text, nullable=False)
+    status = Column(String(50), default="pending", index=True)  # 'pending', 'running', 'completed', 'failed'
+    params_json = Column(JSON)  # e.g. {"use_cache": true}
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime)
+    
+    # Relationships
+    refinements = relationship("Refinement", back_populates="job")
 
 
 class ExportLog(Base):
@@ -143,6 +171,48 @@ class ExportLog(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
+class GenerationJob(Base):
+    """Durable background generation job, run by worker processes"""
+    __tablename__ = "generation_jobs"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    document_id = Column(UUID(as_uuid=True), ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+    section_id = Column(UUID(as_uuid=True), ForeignKey("sections.id", ondelete="CASCADE"), nullable=False)
+    status = Column(String(50), default="queued", index=True)  # 'queued', 'running', 'completed', 'failed'
+    params_json = Column(JSON)  # e.g. {"use_cache": true}
+    available_at = Column(DateTime)  # not claimed before this (retry backoff); reset when re-offered to the queue
+    partial_content = Column(Text)  # checkpointed streamed text while running
+    content_id = Column(UUID(as_uuid=True), ForeignKey("generated_content.id", ondelete="SET NULL"), nullable=True)
+    error_message = Column(Text)
+    attempts = Column(Integer, default=0)
+    worker_id = Column(String(255))
+    heartbeat_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+
+class LLMCall(Base):
+    """Per-call LLM latency and usage ledger"""
+    __tablename__ = "llm_calls"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    provider = Column(String(50))  # 'gemini', 'openai', 'mock'
+    model = Column(String(100), index=True)
+    streamed = Column(Boolean, default=False)
+    queue_wait_ms = Column(Integer)  # time spent waiting on the provider rate limiter
+    ttft_ms = Column(Integer)  # time to first token (first chunk, or full response when not streaming)
+    total_ms = Column(Integer)
+    tokens_per_second = Column(Float)  # completion tokens over time after the first token
+    prompt_tokens = Column(Integer)
+    completion_tokens = Column(Integer)
+    cache_hit = Column(Boolean, default=False)
+    outcome = Column(String(50))  # 'success', 'error', 'rate_limited', 'cancelled'
+    error_message = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
 class AuditLog(Base):
     """Audit trail for system actions"""
     __tablename__ = "audit_logs"
@@ -53,8 +53,10 @@ async def login(credentials: UserLogin, db: Session = Depends(get_db)):
         )
     
     # Create tokens
-    access_token = SecurityUtils.create_access_token({"sub": str(user.id)})
-    refresh_token = SecurityUtils.create_refresh_token({"sub": str(user.id)})
+    # The quota tier rides in the token so budget checks need no user lookup
+    claims = {"sub": str(user.id), "tier": user.tier or settings.QUOTA_DEFAULT_TIER}
+    access_token = SecurityUtils.create_access_token(claims)
+    refresh_token = SecurityUtils.create_refresh_token(claims)
     
     return {
         "status": "success",
@@ -74,20 +76,25 @@ async def login(credentials: UserLogin, db: Session = Depends(get_db)):
 
 
 @router.post("/refresh", response_model=dict)
-async def refresh_token(request: RefreshTokenRequest):
+async def refresh_token(request: RefreshTokenRequest, db: Session = Depends(get_db)):
     """Refresh access token"""
+    from uuid import UUID
+    
     try:
         payload = SecurityUtils.verify_token(request.refresh_token)
         user_id = payload.get("sub")
+        user = AuthService.get_user_by_id(db, UUID(user_id)) if user_id else None
         
-        if not user_id:
+        if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid refresh token"
             )
         
-        # Create new access token
-        access_token = SecurityUtils.create_access_token({"sub": user_id})
+        # Create new access token; the tier is re-read so upgrades and downgrades apply on refresh
+        access_token = SecurityUtils.create_access_token({
+            "sub": user_id, "tier": user.tier or settings.QUOTA_DEFAULT_TIER
+        })
         
         return {
             "status": "success",
@@ -78,6 +78,33 @@ async def get_document(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+@router.get("/{document_id}/summary", response_model=dict)
+async def get_document_summary(
+    document_id: UUID,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the rolling summary that sections of the document are generated with"""
+    from app.core.config import settings
+    from app.integrations.tokenizer import count_tokens
+    from app.utils.summary import render
+    
+    document = DocumentService.get_document(db, document_id, UUID(current_user["user_id"]))
+    if not document:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+    
+    summary = render((document.summary_json or {}).get("sections") or {})
+    return {
+        "status": "success",
+        "data": {
+            "document_id": str(document.id),
+            "summary": summary,
+            "tokens": count_tokens(summary),
+            "budget_tokens": settings.DOCUMENT_SUMMARY_MAX_TOKENS
+        }
+    }
+
+
 @router.post("/{document_id}/sections", response_model=dict, status_code=status.HTTP_201_CREATED)
 async def create_section(
     document_id: UUID,
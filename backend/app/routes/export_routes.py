@@ -1,15 +1,18 @@
 """Export Routes"""
 from fastapi import APIRouter, HTTPException, Depends, status, Query
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from uuid import UUID
+import json
 import os
 
-from app.core.security import get_current_user
+from app.core.security import get_current_user, get_current_user_within_quota, quota_exceeded_exception
 from app.database import get_db
 from app.core.config import settings
+from app.integrations.quota import QuotaExceededError, quota_manager
 from app.schemas import ExportRequest
 from app.utils.export import ExportService, TemplateService
+from app.utils.scheduler import LANE_INTERACTIVE, LANE_INTERACTIVE_STREAM, job_scheduler
 
 router = APIRouter()
 
@@ -160,16 +163,20 @@ async def generate_outline_template(
     document_type: str = Query(...),
     num_sections: int = Query(5, ge=2, le=20),
     style: str = Query("professional", regex="^(professional|casual|academic|creative)$"),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_within_quota)
 ):
     """Generate AI-suggested outline template (bonus feature)"""
     try:
         from app.integrations import get_llm_client
+        from app.integrations.tokenizer import TokenUsage
         
         llm_client = get_llm_client()
-        outline = TemplateService.generate_outline_template(
-            topic, document_type, num_sections, llm_client, style
-        )
+        usage = TokenUsage(llm_client.model)
+        async with quota_manager.charge(current_user["user_id"], current_user["tier"], usage), \
+                job_scheduler.slot(LANE_INTERACTIVE, current_user["user_id"]):
+            outline = await TemplateService.generate_outline_template(
+                topic, document_type, num_sections, llm_client, style, usage
+            )
         
         return {
             "status": "success",
@@ -177,6 +184,8 @@ async def generate_outline_template(
                 "outline": outline
             }
         }
+    except QuotaExceededError as e:
+        raise quota_exceeded_exception(e)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -186,16 +195,20 @@ async def generate_slide_titles_template(
     topic: str = Query(...),
     num_slides: int = Query(5, ge=2, le=50),
     audience: str = Query("general"),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_within_quota)
 ):
     """Generate AI-suggested slide titles (bonus feature)"""
     try:
         from app.integrations import get_llm_client
+        from app.integrations.tokenizer import TokenUsage
         
         llm_client = get_llm_client()
-        slide_titles = TemplateService.generate_slide_titles_template(
-            topic, num_slides, llm_client, audience
-        )
+        usage = TokenUsage(llm_client.model)
+        async with quota_manager.charge(current_user["user_id"], current_user["tier"], usage), \
+                job_scheduler.slot(LANE_INTERACTIVE, current_user["user_id"]):
+            slide_titles = await TemplateService.generate_slide_titles_template(
+                topic, num_slides, llm_client, audience, usage
+            )
         
         return {
             "status": "success",
@@ -203,5 +216,76 @@ async def generate_slide_titles_template(
                 "slide_titles": slide_titles
             }
         }
+    except QuotaExceededError as e:
+        raise quota_exceeded_exception(e)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.post("/templates/outline/stream")
+async def stream_outline_template(
+    topic: str = Query(...),
+    document_type: str = Query(...),
+    num_sections: int = Query(5, ge=2, le=20),
+    style: str = Query("professional", regex="^(professional|casual|academic|creative)$"),
+    current_user: dict = Depends(get_current_user_within_quota)
+):
+    """Stream outline items as NDJSON, each as soon as the LLM has produced it"""
+    from app.integrations import get_llm_client
+    from app.integrations.tokenizer import TokenUsage
+    
+    try:
+        llm_client = get_llm_client()
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+    usage = TokenUsage(llm_client.model)
+    
+    async def generate():
+        count = 0
+        try:
+            async with quota_manager.charge(current_user["user_id"], current_user["tier"], usage), \
+                    job_scheduler.slot(LANE_INTERACTIVE_STREAM, current_user["user_id"]):
+                async for item in TemplateService.stream_outline_template(
+                    topic, document_type, num_sections, llm_client, style, usage
+                ):
+                    yield json.dumps({"type": "outline_item", "index": count, "item": item}) + "\n"
+                    count += 1
+            yield json.dumps({"type": "outline_complete", "count": count}) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@router.post("/templates/slide-titles/stream")
+async def stream_slide_titles_template(
+    topic: str = Query(...),
+    num_slides: int = Query(5, ge=2, le=50),
+    audience: str = Query("general"),
+    current_user: dict = Depends(get_current_user_within_quota)
+):
+    """Stream slide titles as NDJSON, each as soon as the LLM has produced it"""
+    from app.integrations import get_llm_client
+    from app.integrations.tokenizer import TokenUsage
+    
+    try:
+        llm_client = get_llm_client()
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+    usage = TokenUsage(llm_client.model)
+    
+    async def generate():
+        count = 0
+        try:
+            async with quota_manager.charge(current_user["user_id"], current_user["tier"], usage), \
+                    job_scheduler.slot(LANE_INTERACTIVE_STREAM, current_user["user_id"]):
+                async for title in TemplateService.stream_slide_titles_template(
+                    topic, num_slides, llm_client, audience, usage
+                ):
+                    yield json.dumps({"type": "slide_title", "index": count, "title": title}) + "\n"
+                    count += 1
+            yield json.dumps({"type": "slide_titles_complete", "count": count}) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
@@ -1,35 +1,97 @@
 """Content Generation Routes"""
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, status
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from uuid import UUID
 import json
 
-from app.core.security import get_current_user
+from app.core.config import settings
+from app.core.security import (
+    get_current_admin, get_current_user, get_current_user_within_quota, quota_exceeded_exception
+)
 from app.database import get_db
-from app.schemas import GenerationRequest
-from app.services import GenerationService
+from app.integrations.circuit_breaker import CircuitOpenError
+from app.integrations.quota import QuotaExceededError, quota_manager
+from app.integrations.rate_limiter import LLMRateLimitError
+from app.schemas import (
+    GenerationRequest, DocumentGenerationRequest, GenerationJobRequest, OutlineDocumentRequest, ResumeGenerationRequest
+)
+from app.services import GenerationJobService, GenerationService
+from app.utils.replay import format_sse
 
 router = APIRouter()
 
 
+def _generation_error(error: Exception) -> HTTPException:
+    """HTTP error for a generation that failed before its response started"""
+    if isinstance(error, QuotaExceededError):
+        return quota_exceeded_exception(error)
+    if isinstance(error, ValueError):
+        # Access denied and missing documents or sections alike
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(error))
+    if isinstance(error, LLMRateLimitError):
+        return HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(error),
+            headers={"Retry-After": str(int(error.retry_after or 1))}
+        )
+    if isinstance(error, CircuitOpenError):
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(error),
+            headers={"Retry-After": str(int(error.retry_after or 0) + 1)}
+        )
+    return HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(error))
+
+
+def _sse_response(buffer, last_event_id: int = 0) -> StreamingResponse:
+    """Stream a replay buffer as Server-Sent Events, starting after last_event_id"""
+    async def generate():
+        yield "retry: 2000\n\n"
+        async for event_id, event in buffer.subscribe(last_event_id, keepalive=settings.SSE_KEEPALIVE_SECONDS):
+            yield format_sse(event_id, event)
+    
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "X-Generation-Id": buffer.generation_id
+        }
+    )
+
+
 @router.post("/generate", response_model=dict)
 async def generate_content(
     request: GenerationRequest,
-    current_user: dict = Depends(get_current_user),
+    http_request: Request,
+    current_user: dict = Depends(get_current_user_within_quota),
     db: Session = Depends(get_db)
 ):
     """Generate AI content for section"""
     try:
         user_id = UUID(current_user["user_id"])
         
+        if request.stream and "text/event-stream" in http_request.headers.get("accept", ""):
+            # Resumable mode: reconnect through /streams/{generation_id} with Last-Event-ID
+            buffer = await GenerationService.start_replayable_stream(
+                db, request.section_id, request.document_id, user_id,
+                use_cache=request.use_cache, tier=current_user["tier"]
+            )
+            return _sse_response(buffer)
+        
         if request.stream:
+            # Access is checked and the generation started before the response, so failures get a status code
+            chunks = await GenerationService.generate_content(
+                db, request.section_id, request.document_id, user_id,
+                request.prompt_overrides, stream=True,
+                use_cache=request.use_cache, tier=current_user["tier"]
+            )
+            
             async def generate():
                 try:
-                    async for chunk in await GenerationService.generate_content(
-                        db, request.section_id, request.document_id, user_id,
-                        request.prompt_overrides, stream=True
-                    ):
+                    async for chunk in chunks:
                         yield chunk
                 except Exception as e:
                     yield json.dumps({"error": str(e)}) + "\n"
@@ -38,7 +100,8 @@ async def generate_content(
         else:
             content = await GenerationService.generate_content(
                 db, request.section_id, request.document_id, user_id,
-                request.prompt_overrides, stream=False
+                request.prompt_overrides, stream=False,
+                use_cache=request.use_cache, tier=current_user["tier"]
             )
             
             return {
@@ -48,11 +111,254 @@ async def generate_content(
                     "section_id": str(content.section_id),
                     "content": content.content,
                     "model_used": content.model_used,
+                    "prompt_tokens": content.prompt_tokens,
+                    "completion_tokens": content.completion_tokens,
                     "tokens_used": content.tokens_used,
+                    "cache_hit": content.cache_hit,
                     "generation_time_ms": content.generation_time_ms,
                     "created_at": content.created_at.isoformat()
                 }
             }
+    except Exception as e:
+        raise _generation_error(e)
+
+
+@router.get("/streams/{generation_id}")
+async def resume_stream(
+    generation_id: str,
+    last_event_id: str = Header(None, alias="Last-Event-ID"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Attach to a live or recently finished SSE generation, replaying events after Last-Event-ID"""
+    try:
+        buffer = GenerationService.get_replayable_stream(generation_id, UUID(current_user["user_id"]))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    
+    try:
+        after = max(0, int(last_event_id or 0))
+    except ValueError:
+        after = 0
+    return _sse_response(buffer, after)
+
+
+@router.post("/generate-document")
+async def generate_document(
+    request: DocumentGenerationRequest,
+    current_user: dict = Depends(get_current_user_within_quota),
+    db: Session = Depends(get_db)
+):
+    """Generate all (or selected) sections of a document concurrently"""
+    try:
+        events = await GenerationService.generate_document(
+            db, request.document_id, UUID(current_user["user_id"]),
+            request.section_ids, use_cache=request.use_cache, tier=current_user["tier"]
+        )
+    except Exception as e:
+        raise _generation_error(e)
+    
+    async def generate():
+        try:
+            async for event in events:
+                yield event
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@router.post("/generate-from-outline")
+async def generate_from_outline(
+    request: OutlineDocumentRequest,
+    current_user: dict = Depends(get_current_user_within_quota),
+    db: Session = Depends(get_db)
+):
+    """Generate an outline for a topic, create its sections and draft them in one pipelined job"""
+    try:
+        events = await GenerationService.generate_document_from_outline(
+            db, request.document_id, UUID(current_user["user_id"]),
+            request.topic, request.num_sections, request.style,
+            use_cache=request.use_cache, tier=current_user["tier"]
+        )
+    except Exception as e:
+        raise _generation_error(e)
+    
+    async def generate():
+        try:
+            async for event in events:
+                yield event
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@router.post("/jobs", response_model=dict, status_code=status.HTTP_202_ACCEPTED)
+async def create_generation_job(
+    request: GenerationJobRequest,
+    current_user: dict = Depends(get_current_user_within_quota),
+    db: Session = Depends(get_db)
+):
+    """Queue a section generation for a background worker; survives client disconnects"""
+    try:
+        job = await GenerationJobService.enqueue(
+            db, UUID(current_user["user_id"]), request.document_id, request.section_id,
+            use_cache=request.use_cache, tier=current_user["tier"]
+        )
+        
+        return {
+            "status": "success",
+            "data": {
+                "job_id": str(job.id),
+                "status": job.status,
+                "created_at": job.created_at.isoformat()
+            }
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.get("/jobs/{job_id}", response_model=dict)
+async def get_generation_job(
+    job_id: UUID,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the status of a background generation job"""
+    try:
+        job = GenerationJobService.get_job(db, job_id, UUID(current_user["user_id"]))
+        
+        return {
+            "status": "success",
+            "data": {
+                "job_id": str(job.id),
+                "section_id": str(job.section_id),
+                "status": job.status,
+                "content_id": str(job.content_id) if job.content_id else None,
+                "partial_length": len(job.partial_content or ""),
+                "attempts": job.attempts,
+                "error": job.error_message,
+                "created_at": job.created_at.isoformat(),
+                "finished_at": job.finished_at.isoformat() if job.finished_at else None
+            }
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.get("/jobs/{job_id}/stream")
+async def stream_generation_job(
+    job_id: UUID,
+    offset: int = Query(0, ge=0),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Re-attach to a background job: replay content from offset, then follow it as NDJSON"""
+    try:
+        events = await GenerationJobService.stream_job(db, job_id, UUID(current_user["user_id"]), offset)
+    except Exception as e:
+        raise _generation_error(e)
+    
+    async def generate():
+        try:
+            async for event in events:
+                yield event
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@router.get("/quota", response_model=dict)
+async def get_quota(current_user: dict = Depends(get_current_user)):
+    """Current user's sliding-window request and token usage against their tier's budget"""
+    try:
+        return {
+            "status": "success",
+            "data": await quota_manager.usage(current_user["user_id"], current_user["tier"])
+        }
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.get("/cache/stats", response_model=dict)
+async def get_cache_stats(current_user: dict = Depends(get_current_admin)):
+    """Get LLM response cache hit/miss counters (admin only)"""
+    from app.integrations.cache import response_cache
+    
+    return {
+        "status": "success",
+        "data": response_cache.stats()
+    }
+
+
+@router.get("/rate-limits", response_model=dict)
+async def get_rate_limits(current_user: dict = Depends(get_current_admin)):
+    """Get per-provider LLM rate limiter state (admin only)"""
+    from app.integrations.rate_limiter import all_rate_limiters
+    
+    return {
+        "status": "success",
+        "data": [limiter.stats() for limiter in all_rate_limiters().values()]
+    }
+
+
+@router.get("/circuit-breakers", response_model=dict)
+async def get_circuit_breakers(current_user: dict = Depends(get_current_admin)):
+    """Get per-provider circuit breaker state (closed, open or half_open) and recent failure rate (admin only)"""
+    from app.integrations.circuit_breaker import all_circuit_breakers
+    
+    return {
+        "status": "success",
+        "data": [breaker.stats() for breaker in all_circuit_breakers().values()]
+    }
+
+
+@router.get("/scheduler", response_model=dict)
+async def get_scheduler_stats(current_user: dict = Depends(get_current_admin)):
+    """Get queue depth, running jobs and admission wait times per scheduler lane (admin only)"""
+    from app.utils.scheduler import job_scheduler
+    
+    return {
+        "status": "success",
+        "data": job_scheduler.stats()
+    }
+
+
+@router.get("/routing", response_model=dict)
+async def get_routing_stats(current_user: dict = Depends(get_current_admin)):
+    """Get model routing rules and how many generations each rule has routed (admin only)"""
+    from app.integrations.routing import model_router
+    
+    return {
+        "status": "success",
+        "data": model_router.stats()
+    }
+
+
+@router.get("/latency", response_model=dict)
+async def get_latency_summary(
+    hours: int = Query(24, ge=1, le=24 * 30),
+    current_user: dict = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """Get p50/p95/p99 LLM call latency per model from the call ledger (admin only)"""
+    from app.integrations.ledger import LatencyLedger
+    from datetime import datetime, timedelta
+    
+    try:
+        since = datetime.utcnow() - timedelta(hours=hours)
+        return {
+            "status": "success",
+            "data": {
+                "since": since.isoformat(),
+                "models": LatencyLedger.summarize(db, since)
+            }
+        }
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -80,7 +386,10 @@ async def get_generated_content(
                 "content": content.content,
                 "version": content.version,
                 "model_used": content.model_used,
+                "prompt_tokens": content.prompt_tokens,
+                "completion_tokens": content.completion_tokens,
                 "tokens_used": content.tokens_used,
+                "status": content.status,
                 "is_approved": content.is_approved,
                 "refinements": [
                     {
@@ -97,3 +406,86 @@ async def get_generated_content(
         raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.post("/generated-content/{content_id}/resume")
+async def resume_generated_content(
+    content_id: UUID,
+    request: ResumeGenerationRequest,
+    current_user: dict = Depends(get_current_user_within_quota),
+    db: Session = Depends(get_db)
+):
+    """Continue an interrupted streamed generation from its last checkpoint, or keep it as a draft"""
+    try:
+        result = await GenerationService.resume_generation(
+            db, content_id, UUID(current_user["user_id"]),
+            mode=request.mode, stream=request.stream, tier=current_user["tier"]
+        )
+    except QuotaExceededError as e:
+        raise quota_exceeded_exception(e)
+    except ValueError as e:
+        code = status.HTTP_404_NOT_FOUND if str(e) == "Content not found" else status.HTTP_409_CONFLICT
+        raise HTTPException(status_code=code, detail=str(e))
+    except LLMRateLimitError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(int(e.retry_after or 1))}
+        )
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(int(e.retry_after or 0) + 1)}
+        )
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+    
+    if request.stream and request.mode == "continue":
+        async def generate():
+            try:
+                async for chunk in result:
+                    yield chunk
+            except Exception as e:
+                yield json.dumps({"error": str(e)}) + "\n"
+        
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+    
+    return {
+        "status": "success",
+        "data": {
+            "content_id": str(result.id),
+            "section_id": str(result.section_id),
+            "content": result.content,
+            "status": result.status,
+            "model_used": result.model_used,
+            "prompt_tokens": result.prompt_tokens,
+            "completion_tokens": result.completion_tokens,
+            "tokens_used": result.tokens_used
+        }
+    }
+
+
+@router.post("/generated-content/{content_id}/approve", response_model=dict)
+async def approve_generated_content(
+    content_id: UUID,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Approve a version as its section's content; later generations see it in the document summary"""
+    try:
+        content = GenerationService.approve_content(db, content_id, UUID(current_user["user_id"]))
+        return {
+            "status": "success",
+            "data": {
+                "content_id": str(content.id),
+                "section_id": str(content.section_id),
+                "is_approved": content.is_approved
+            }
+        }
+    except ValueError as e:
+        code = status.HTTP_404_NOT_FOUND if str(e) == "Content not found" else status.HTTP_409_CONFLICT
+        raise HTTPException(status_code=code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
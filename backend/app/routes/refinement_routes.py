@@ -5,10 +5,13 @@ from sqlalchemy.orm import Session
 from uuid import UUID
 import json
 
-from app.core.security import get_current_user
+from app.core.security import get_current_user, get_current_user_within_quota, quota_exceeded_exception
 from app.database import get_db
-from app.schemas import RefinementRequest, ApplyFeedbackRequest
-from app.services import RefinementService, GenerationService
+from app.integrations.circuit_breaker import CircuitOpenError
+from app.integrations.quota import QuotaExceededError
+from app.integrations.rate_limiter import LLMRateLimitError
+from app.schemas import RefinementRequest, ApplyFeedbackRequest, BulkRefinementRequest
+from app.services import RefinementService
 
 router = APIRouter()
 
@@ -79,44 +82,183 @@ async def get_refinement_history(
 @router.post("/apply-feedback", response_model=dict)
 async def apply_feedback(
     request: ApplyFeedbackRequest,
-    current_user: dict = Depends(get_current_user),
+    current_user: dict = Depends(get_current_user_within_quota),
     db: Session = Depends(get_db)
 ):
-    """Apply feedback and regenerate content"""
+    """Apply feedback in one refinement call, or with a span, rewrite only that excerpt into a new version"""
+    if request.span is not None:
+        return await _apply_span_feedback(request, current_user, db)
+    
     try:
-        from app.models import GeneratedContent
-        
-        content = db.query(GeneratedContent).filter(GeneratedContent.id == request.content_id).first()
+        result = await RefinementService.refine_content(
+            db, request.content_id, UUID(current_user["user_id"]),
+            refinement_ids=request.refinement_ids, stream=request.stream, tier=current_user["tier"]
+        )
+    except Exception as e:
+        raise _refinement_error(e)
+    
+    if request.stream:
+        async def generate():
+            try:
+                async for chunk in result:
+                    yield chunk
+            except Exception as e:
+                yield json.dumps({"error": str(e)}) + "\n"
         
-        if not content:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Content not found")
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+    
+    return {
+        "status": "success",
+        "data": {
+            "content_id": str(result.id),
+            "section_id": str(result.section_id),
+            "version": result.version,
+            "content": result.content,
+            "refinement_ids": [str(r.id) for r in result.regenerated_from],
+            "model_used": result.model_used,
+            "prompt_tokens": result.prompt_tokens,
+            "completion_tokens": result.completion_tokens,
+            "tokens_used": result.tokens_used
+        }
+    }
+
+
+@router.post("/bulk")
+async def start_bulk_refinement(
+    request: BulkRefinementRequest,
+    current_user: dict = Depends(get_current_user_within_quota),
+    db: Session = Depends(get_db)
+):
+    """Apply one instruction to every approved section of a document, streaming each section's result"""
+    user_id = UUID(current_user["user_id"])
+    try:
+        job = RefinementService.create_bulk_job(
+            db, request.document_id, user_id, request.instruction,
+            request.refinement_reason, use_cache=request.use_cache
+        )
+        events = await RefinementService.run_bulk_job(db, job.id, user_id, tier=current_user["tier"])
+    except Exception as e:
+        raise _refinement_error(e)
+    
+    return _bulk_response(events)
+
+
+@router.post("/bulk/{job_id}/retry")
+async def retry_bulk_refinement(
+    job_id: UUID,
+    current_user: dict = Depends(get_current_user_within_quota),
+    db: Session = Depends(get_db)
+):
+    """Re-run the sections of a bulk refinement that failed or never ran; finished sections are kept"""
+    try:
+        events = await RefinementService.run_bulk_job(
+            db, job_id, UUID(current_user["user_id"]), tier=current_user["tier"]
+        )
+    except Exception as e:
+        raise _refinement_error(e)
+    
+    return _bulk_response(events)
+
+
+@router.get("/bulk/{job_id}", response_model=dict)
+async def get_bulk_refinement(
+    job_id: UUID,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the status of a bulk refinement and each of its sections"""
+    try:
+        job = RefinementService.get_bulk_job(db, job_id, UUID(current_user["user_id"]))
         
-        if request.stream:
-            async def generate():
-                try:
-                    # Regenerate with feedback
-                    feedback_text = "\n".join([
-                        r.feedback_text for r in content.refinements if r.feedback_text
-                    ])
-                    
-                    async for chunk in await GenerationService.generate_content(
-                        db, content.section_id, content.section.document_id, 
-                        UUID(current_user["user_id"]), 
-                        {"feedback": feedback_text},
-                        stream=True
-                    ):
-                        yield chunk
-                except Exception as e:
-                    yield json.dumps({"error": str(e)}) + "\n"
-            
-            return StreamingResponse(generate(), media_type="application/x-ndjson")
-        else:
-            # Non-streaming refinement
-            return {
-                "status": "success",
-                "message": "Feedback applied successfully"
+        return {
+            "status": "success",
+            "data": {
+                "job_id": str(job.id),
+                "document_id": str(job.document_id),
+                "instruction": job.instruction,
+                "status": job.status,
+                "sections": [
+                    {
+                        "refinement_id": str(r.id),
+                        "section_id": str(r.generated_content.section_id),
+                        "content_id": str(r.generated_content_id),
+                        "is_processed": r.is_processed,
+                        "new_content_id": str(r.regenerated_content_id) if r.regenerated_content_id else None,
+                        "error": r.error_message
+                    }
+                    for r in job.refinements
+                ],
+                "created_at": job.created_at.isoformat(),
+                "finished_at": job.finished_at.isoformat() if job.finished_at else None
             }
-    except HTTPException:
-        raise
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+def _bulk_response(events) -> StreamingResponse:
+    async def generate():
+        try:
+            async for event in events:
+                yield event
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+def _refinement_error(error: Exception) -> HTTPException:
+    """HTTP error for a failed refinement"""
+    if isinstance(error, QuotaExceededError):
+        return quota_exceeded_exception(error)
+    if isinstance(error, ValueError):
+        not_found = str(error) in ("Content not found", "Job not found", "Access denied")
+        code = status.HTTP_404_NOT_FOUND if not_found else status.HTTP_422_UNPROCESSABLE_ENTITY
+        return HTTPException(status_code=code, detail=str(error))
+    if isinstance(error, LLMRateLimitError):
+        return HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(error),
+            headers={"Retry-After": str(int(error.retry_after or 1))}
+        )
+    if isinstance(error, CircuitOpenError):
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(error),
+            headers={"Retry-After": str(int(error.retry_after or 0) + 1)}
+        )
+    return HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(error))
+
+
+async def _apply_span_feedback(request: ApplyFeedbackRequest, current_user: dict, db: Session):
+    """Span refinement: answers as JSON, or as the usual NDJSON events when streaming"""
+    try:
+        refined, (start, end) = await RefinementService.refine_span(
+            db, request.content_id, UUID(current_user["user_id"]),
+            request.span.start, request.span.end, request.span.text,
+            refinement_ids=request.refinement_ids, tier=current_user["tier"]
+        )
+    except Exception as e:
+        raise _refinement_error(e)
+    
+    data = {
+        "content_id": str(refined.id),
+        "section_id": str(refined.section_id),
+        "version": refined.version,
+        "content": refined.content,
+        "span": {"start": start, "end": end},
+        "model_used": refined.model_used,
+        "prompt_tokens": refined.prompt_tokens,
+        "completion_tokens": refined.completion_tokens,
+        "tokens_used": refined.tokens_used
+    }
+    if request.stream:
+        async def generate():
+            yield json.dumps({"type": "content_chunk", "content": refined.content[start:end]}) + "\n"
+            yield json.dumps({"type": "generation_complete", **data}) + "\n"
+        
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+    
+    return {"status": "success", "data": data}
@@ -144,6 +144,32 @@ class GenerationRequest(BaseModel):
     section_id: UUID
     prompt_overrides: Optional[Dict[str, Any]] = None
     stream: bool = False
+    use_cache: bool = False  # True reuses a cached completion of the same prompt instead of a fresh draft
+
+
+class DocumentGenerationRequest(BaseModel):
+    document_id: UUID
+    section_ids: Optional[List[UUID]] = None  # Defaults to every section
+    use_cache: bool = False
+
+
+class GenerationJobRequest(BaseModel):
+    document_id: UUID
+    section_id: UUID
+    use_cache: bool = False
+
+
+class ResumeGenerationRequest(BaseModel):
+    mode: str = "continue"  # "continue" generates the remainder, "keep" saves the partial text as a draft
+    stream: bool = False
+
+
+class OutlineDocumentRequest(BaseModel):
+    document_id: UUID
+    topic: str = Field(..., min_length=1, max_length=500)
+    num_sections: int = Field(5, ge=2, le=20)
+    style: str = Field("professional", pattern="^(professional|casual|academic|creative)$")
+    use_cache: bool = False
 
 
 class GeneratedContentResponse(BaseModel):
@@ -152,8 +178,11 @@ class GeneratedContentResponse(BaseModel):
     content: str
     version: int
     model_used: str
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
     tokens_used: int
     generation_time_ms: int
+    status: str = "completed"  # 'in_progress', 'interrupted', 'draft', 'completed'
     is_approved: bool
     created_at: datetime
     
@@ -165,6 +194,8 @@ class ContentChunk(BaseModel):
     type: str  # 'content_chunk' or 'generation_complete'
     content: Optional[str] = None
     content_id: Optional[UUID] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
     tokens_used: Optional[int] = None
 
 
@@ -191,10 +222,24 @@ class RefinementResponse(BaseModel):
         from_attributes = True
 
 
+class SpanSelection(BaseModel):
+    start: int = Field(..., ge=0)  # character offsets into the content, end exclusive
+    end: int = Field(..., gt=0)
+    text: Optional[str] = None  # the selected text, used to re-find the span if the offsets drifted
+
+
 class ApplyFeedbackRequest(BaseModel):
     content_id: UUID
     refinement_ids: List[UUID] = []
     stream: bool = False
+    span: Optional[SpanSelection] = None  # refine only this excerpt
+
+
+class BulkRefinementRequest(BaseModel):
+    document_id: UUID
+    instruction: str = Field(..., min_length=1)  # e.g. "make it shorter", applied to every approved section
+    refinement_reason: Optional[str] = None
+    use_cache: bool = False
 
 
 # ==================== Export Schemas ====================
@@ -1,12 +1,23 @@
 """Authentication Service"""
+from contextlib import asynccontextmanager
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import List, Optional, Sequence
 from uuid import UUID
+import logging
 import uuid as uuid_module
 
+from app.core.config import settings
 from app.core.security import SecurityUtils
 from app.models import User
 from app.schemas import UserCreate, UserResponse
+from app.integrations.quota import quota_manager
+from app.utils.concurrency import ConcurrencyLimiter
+from app.utils.replay import ReplayRegistry
+from app.utils.scheduler import LANE_BATCH, LANE_INTERACTIVE, LANE_INTERACTIVE_STREAM, job_scheduler
+from app.utils.singleflight import SingleFlight
+from app.utils.streaming import coalesce_chunks
+
+logger = logging.getLogger(__name__)
 
 
 class AuthService:
@@ -207,9 +218,59 @@ class DocumentService:
         return section
 
 
+class DocumentSummaryService:
+    """Rolling per-document summary that carries context between section generations"""
+    
+    @staticmethod
+    def record_section(db: Session, section, content) -> None:
+        """Fold a section's newly generated or approved content into its document's summary"""
+        from app.utils.summary import digest, fit_to_budget
+        
+        if not settings.DOCUMENT_SUMMARY_ENABLED:
+            return
+        document = section.document
+        entries = {k: dict(v) for k, v in ((document.summary_json or {}).get("sections") or {}).items()}
+        current = entries.get(str(section.id))
+        if current and current.get("approved") and not content.is_approved:
+            # An approved version speaks for its section until another version is approved
+            return
+        
+        # Only this section is re-read; the others keep their digests, shrunk if over budget
+        entries[str(section.id)] = {
+            "order": section.section_order,
+            "title": section.title,
+            "content_id": str(content.id),
+            "approved": bool(content.is_approved),
+            "digest": digest(content.content, settings.DOCUMENT_SUMMARY_SECTION_TOKENS),
+        }
+        document.summary_json = {"sections": fit_to_budget(entries, settings.DOCUMENT_SUMMARY_MAX_TOKENS)}
+        db.commit()
+    
+    @staticmethod
+    def context_for(document, section) -> str:
+        """The document summary as prompt context for a section, without that section's own digest"""
+        from app.utils.summary import render
+        
+        if not settings.DOCUMENT_SUMMARY_ENABLED:
+            return ""
+        return render(((document.summary_json or {}).get("sections") or {}), exclude=str(section.id))
+
+
 class GenerationService:
     """Content generation business logic"""
     
+    # Concurrent requests for the same section and prompt share one LLM call
+    _in_flight = SingleFlight()
+    
+    # Recent events of SSE generations, for reconnecting clients and extra viewers
+    _replays = ReplayRegistry(settings.SSE_REPLAY_BUFFER_EVENTS, settings.SSE_REPLAY_RETENTION_SECONDS)
+    
+    # Caps on sections generated at once by document-wide jobs
+    _slots = ConcurrencyLimiter(
+        settings.GENERATION_MAX_CONCURRENCY,
+        settings.GENERATION_MAX_CONCURRENCY_PER_USER
+    )
+    
     @staticmethod
     async def generate_content(
         db: Session,
@@ -217,12 +278,12 @@ class GenerationService:
         document_id: UUID,
         user_id: UUID,
         prompt_overrides: dict = None,
-        stream: bool = False
+        stream: bool = False,
+        use_cache: bool = False,
+        tier: Optional[str] = None
     ):
-        """Generate content for a section"""
+        """Generate content for a section, charged to the user's quota tier"""
         from app.models import Section, Document, Project, GeneratedContent
-        from app.integrations import get_llm_client, PromptManager
-        import time
         import json
         
         # Verify access
@@ -238,67 +299,1018 @@ class GenerationService:
         if not section or section.document_id != document_id:
             raise ValueError("Section not found")
         
+        lane = LANE_INTERACTIVE_STREAM if stream else LANE_INTERACTIVE
+        flight = GenerationService._start_generation(db, document, section, stream, use_cache, lane, user_id, tier)
+        
+        if stream:
+            async def content_generator():
+                async for chunk in GenerationService._coalesced(flight):
+                    yield json.dumps({"type": "content_chunk", "content": chunk}) + "\n"
+                
+                result = await flight.result()
+                yield json.dumps({
+                    "type": "generation_complete",
+                    "content_id": str(result["content_id"]),
+                    "prompt_tokens": result["prompt_tokens"],
+                    "completion_tokens": result["completion_tokens"],
+                    "tokens_used": result["tokens_used"]
+                }) + "\n"
+            
+            return content_generator()
+        else:
+            result = await flight.result()
+            return db.query(GeneratedContent).filter(GeneratedContent.id == result["content_id"]).first()
+    
+    @staticmethod
+    async def start_replayable_stream(
+        db: Session,
+        section_id: UUID,
+        document_id: UUID,
+        user_id: UUID,
+        use_cache: bool = False,
+        tier: Optional[str] = None
+    ):
+        """Start (or join) a section generation whose events are buffered for replay.
+        
+        The generation runs in its own session so it outlives the request that started it.
+        """
+        from app.models import Section, Document, Project
+        import asyncio
+        
+        # Verify access
+        document = db.query(Document).join(Project).filter(
+            Document.id == document_id,
+            Project.user_id == user_id
+        ).first()
+        
+        if not document:
+            raise ValueError("Access denied")
+        
+        section = db.query(Section).filter(Section.id == section_id).first()
+        if not section or section.document_id != document_id:
+            raise ValueError("Section not found")
+        
+        gen_db = Session(bind=db.get_bind())
+        try:
+            document = gen_db.query(Document).filter(Document.id == document_id).first()
+            section = gen_db.query(Section).filter(Section.id == section_id).first()
+            flight = GenerationService._start_generation(
+                gen_db, document, section, True, use_cache, LANE_INTERACTIVE_STREAM, user_id, tier
+            )
+        except Exception:
+            gen_db.close()
+            raise
+        
+        def start(buffer):
+            buffer.append({"type": "generation_started", "generation_id": buffer.generation_id})
+            buffer.task = asyncio.ensure_future(GenerationService._fill_replay_buffer(buffer, flight, gen_db))
+        
+        buffer, created = GenerationService._replays.join(flight.key, str(user_id), start)
+        if not created:
+            # Another viewer's generation is already filling the buffer
+            gen_db.close()
+        return buffer
+    
+    @staticmethod
+    def get_replayable_stream(generation_id: str, user_id: UUID):
+        """Get a live or recently finished replayable generation owned by the user"""
+        buffer = GenerationService._replays.get(generation_id)
+        if buffer is None or buffer.owner != str(user_id):
+            raise ValueError("Stream not found")
+        return buffer
+    
+    @staticmethod
+    async def _fill_replay_buffer(buffer, flight, db: Session):
+        """Copy a flight's chunks and outcome into its replay buffer, independent of any viewer"""
+        try:
+            async for chunk in GenerationService._coalesced(flight):
+                buffer.append({"type": "content_chunk", "content": chunk})
+            result = await flight.result()
+            buffer.append({
+                "type": "generation_complete",
+                "content_id": str(result["content_id"]),
+                "prompt_tokens": result["prompt_tokens"],
+                "completion_tokens": result["completion_tokens"],
+                "tokens_used": result["tokens_used"]
+            })
+        except Exception as e:
+            buffer.append({"type": "generation_error", "error": str(e)})
+        finally:
+            buffer.close()
+            db.close()
+    
+    @staticmethod
+    async def generate_document(
+        db: Session,
+        document_id: UUID,
+        user_id: UUID,
+        section_ids: Optional[List[UUID]] = None,
+        use_cache: bool = False,
+        tier: Optional[str] = None
+    ):
+        """Generate many sections of a document concurrently as one NDJSON event stream"""
+        from app.models import Section, Document, Project
+        import asyncio
+        import json
+        
+        # Verify access
+        document = db.query(Document).join(Project).filter(
+            Document.id == document_id,
+            Project.user_id == user_id
+        ).first()
+        
+        if not document:
+            raise ValueError("Access denied")
+        
+        query = db.query(Section).filter(Section.document_id == document_id)
+        if section_ids:
+            query = query.filter(Section.id.in_(section_ids))
+        sections = query.order_by(Section.section_order).all()
+        
+        if section_ids and len(sections) != len(set(section_ids)):
+            raise ValueError("Section not found")
+        
+        events: asyncio.Queue = asyncio.Queue(maxsize=settings.STREAM_EVENT_QUEUE_SIZE)
+        
+        async def event_generator():
+            tasks = [
+                asyncio.ensure_future(GenerationService._generate_section_events(
+                    events, db, document, section, user_id, use_cache, tier
+                ))
+                for section in sections
+            ]
+            remaining = len(tasks)
+            completed = 0
+            try:
+                while remaining:
+                    event = await events.get()
+                    if event["type"] == "section_complete":
+                        completed += 1
+                        remaining -= 1
+                    elif event["type"] == "section_error":
+                        remaining -= 1
+                    yield json.dumps(event) + "\n"
+                
+                yield json.dumps({
+                    "type": "document_complete",
+                    "document_id": str(document_id),
+                    "completed": completed,
+                    "failed": len(sections) - completed
+                }) + "\n"
+            finally:
+                # Shared generations keep running and persist; only the fan-out stops
+                for task in tasks:
+                    task.cancel()
+        
+        return event_generator()
+    
+    @staticmethod
+    async def generate_document_from_outline(
+        db: Session,
+        document_id: UUID,
+        user_id: UUID,
+        topic: str,
+        num_sections: int = 5,
+        style: str = "professional",
+        use_cache: bool = False,
+        tier: Optional[str] = None
+    ):
+        """Generate an outline, create its sections and draft each one as soon as it is parsed, as one NDJSON event stream"""
+        from app.models import Section, Document, Project
+        from app.integrations import get_llm_client
+        from app.integrations.tokenizer import TokenUsage
+        from app.utils.export import TemplateService
+        from sqlalchemy import func
+        import asyncio
+        import json
+        
+        # Verify access
+        document = db.query(Document).join(Project).filter(
+            Document.id == document_id,
+            Project.user_id == user_id
+        ).first()
+        
+        if not document:
+            raise ValueError("Access denied")
+        
+        # New sections go after any the document already has
+        last_order = db.query(func.max(Section.section_order)).filter(Section.document_id == document_id).scalar()
+        first_order = 0 if last_order is None else last_order + 1
+        content_type = "slide" if document.document_type == "powerpoint" else "text"
+        llm_client = get_llm_client()
+        
+        events: asyncio.Queue = asyncio.Queue(maxsize=settings.STREAM_EVENT_QUEUE_SIZE)
+        tasks = []
+        
+        async def build_outline():
+            count = 0
+            # Runs alongside the drafts it starts, so it writes in a session of its own; the sections it
+            # creates are handed to those drafts and must not expire when the next one is committed
+            outline_db = Session(bind=db.get_bind(), expire_on_commit=False)
+            try:
+                usage = TokenUsage(llm_client.model)
+                # The user is watching the outline arrive, so it runs ahead of the batch drafting it feeds
+                async with quota_manager.charge(str(user_id), tier, usage), \
+                        job_scheduler.slot(LANE_INTERACTIVE_STREAM, str(user_id)):
+                    async for item in TemplateService.stream_outline_template(
+                        topic, document.document_type, num_sections, llm_client, style, usage
+                    ):
+                        title = item.get("title") if isinstance(item, dict) else str(item)
+                        description = item.get("description", "") if isinstance(item, dict) else ""
+                        section = Section(
+                            id=uuid_module.uuid4(),
+                            document_id=document_id,
+                            title=(title or f"Section {count + 1}")[:255],
+                            section_order=first_order + count,
+                            content_type=content_type,
+                            section_config_json={"description": description} if description else None
+                        )
+                        outline_db.add(section)
+                        outline_db.commit()
+                        
+                        await events.put({
+                            "type": "outline_item",
+                            "index": count,
+                            "section_id": str(section.id),
+                            "title": section.title
+                        })
+                        # Drafting starts while the rest of the outline is still streaming
+                        tasks.append(asyncio.ensure_future(GenerationService._generate_section_events(
+                            events, db, document, section, user_id, use_cache, tier
+                        )))
+                        count += 1
+                await events.put({"type": "outline_complete", "count": count})
+            except Exception as e:
+                await events.put({"type": "outline_error", "error": str(e)})
+            finally:
+                outline_db.close()
+        
+        async def event_generator():
+            outline_task = asyncio.ensure_future(build_outline())
+            outline_done = False
+            created = 0
+            remaining = 0
+            completed = 0
+            try:
+                while not outline_done or remaining:
+                    event = await events.get()
+                    if event["type"] == "outline_item":
+                        created += 1
+                        remaining += 1
+                    elif event["type"] in ("outline_complete", "outline_error"):
+                        outline_done = True
+                    elif event["type"] == "section_complete":
+                        completed += 1
+                        remaining -= 1
+                    elif event["type"] == "section_error":
+                        remaining -= 1
+                    yield json.dumps(event) + "\n"
+                
+                yield json.dumps({
+                    "type": "document_complete",
+                    "document_id": str(document_id),
+                    "completed": completed,
+                    "failed": created - completed
+                }) + "\n"
+            finally:
+                outline_task.cancel()
+                for task in tasks:
+                    task.cancel()
+        
+        return event_generator()
+    
+    @staticmethod
+    async def _generate_section_events(
+        events, db: Session, document, section, user_id: UUID, use_cache: bool, tier: Optional[str] = None
+    ):
+        """Generate one section of a document-wide job, reporting progress on the shared event queue.
+        
+        Sections run concurrently, so each generates in its own session, kept
+        open until its flight finishes.
+        """
+        from app.models import Document, Section
+        
+        section_id = str(section.id)
+        task_db = Session(bind=db.get_bind())
+        flight = None
+        try:
+            async with GenerationService._slots.slot(str(user_id)):
+                await events.put({"type": "section_started", "section_id": section_id})
+                flight = GenerationService._start_generation(
+                    task_db, task_db.get(Document, document.id), task_db.get(Section, section.id),
+                    True, use_cache, LANE_BATCH, user_id, tier
+                )
+                async for chunk in GenerationService._coalesced(flight):
+                    # Blocks while the client is behind, pausing this section's fan-out
+                    await events.put({"type": "content_chunk", "section_id": section_id, "content": chunk})
+                result = await flight.result()
+            await events.put({
+                "type": "section_complete",
+                "section_id": section_id,
+                "content_id": str(result["content_id"]),
+                "tokens_used": result["tokens_used"]
+            })
+        except Exception as e:
+            await events.put({"type": "section_error", "section_id": section_id, "error": str(e)})
+        finally:
+            if flight is None:
+                task_db.close()
+            else:
+                flight.add_done_callback(task_db.close)
+    
+    @staticmethod
+    def _coalesced(flight):
+        """Subscribe to a flight with small chunks merged before they reach the client"""
+        return coalesce_chunks(
+            flight.subscribe(),
+            max_bytes=settings.STREAM_FLUSH_MAX_BYTES,
+            max_delay=settings.STREAM_FLUSH_INTERVAL_MS / 1000
+        )
+    
+    @staticmethod
+    def _start_generation(
+        db: Session,
+        document,
+        section,
+        stream: bool,
+        use_cache: bool = False,
+        lane: str = LANE_INTERACTIVE,
+        user_id: Optional[UUID] = None,
+        tier: Optional[str] = None
+    ):
+        """Build the section prompt, route it to a model and join or start its single-flight generation"""
+        from app.integrations import PromptManager
+        import hashlib
+        
         # Build prompt
         config = document.config_json or {}
+        section_config = section.section_config_json or {}
+        focus_points = section_config.get("focus_points", "")
+        tone = config.get("tone", "professional")
+        length = config.get("length", "medium")
         prompt = PromptManager.build_content_prompt(
             section_title=section.title,
             document_type=document.document_type,
             content_type=section.content_type,
-            tone=config.get("tone", "professional"),
-            length=config.get("length", "medium")
+            tone=tone,
+            length=length,
+            focus_points=",".join(focus_points) if isinstance(focus_points, list) else focus_points,
+            # Outline-created sections carry the outline's description of what they cover
+            context=section_config.get("description", ""),
+            document_summary=DocumentSummaryService.context_for(document, section)
         )
         
+        # Long sections are written as parts in parallel instead of one long completion
+        parts = GenerationService._part_prompts(section, length, focus_points, prompt)
+        
         # Add safety guidelines
         prompt = PromptManager.add_safety_guidelines(prompt)
         
-        # Generate content
+        # Generate content, joining an identical in-flight generation if there is one
+        llm_client, *fallbacks = GenerationService._route(section, length, tone, tier)
+        # Only requests that would make the same call share it: same prompt, model and cache choice
+        flight_key = (
+            str(section.id), llm_client.provider, llm_client.model, use_cache,
+            hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        )
+        flight, _ = GenerationService._in_flight.join(
+            flight_key,
+            lambda flight: GenerationService._run_generation(
+                flight, db, section, prompt, llm_client, stream, use_cache, lane, user_id, tier,
+                fallbacks=fallbacks, parts=parts
+            )
+        )
+        return flight
+    
+    @staticmethod
+    def _part_prompts(section, length: str, focus_points, prompt: str) -> list:
+        """Prompts for the parts of a long section, or none if it is written in one call"""
+        from app.integrations import PromptManager
+        from app.utils import section_parts
+        
+        if (not settings.LONG_SECTION_SPLIT_ENABLED or settings.LONG_SECTION_PARTS < 2
+                or length not in settings.LONG_SECTION_LENGTHS
+                or section.content_type not in settings.LONG_SECTION_CONTENT_TYPES):
+            return []
+        if isinstance(focus_points, str):
+            focus_points = focus_points.split(",")
+        scopes = section_parts.plan(focus_points or [], settings.LONG_SECTION_PARTS)
+        return [
+            PromptManager.add_safety_guidelines(PromptManager.build_section_part_prompt(prompt, i, scopes))
+            for i in range(len(scopes))
+        ]
+    
+    @staticmethod
+    @asynccontextmanager
+    async def _later_parts(clients: Sequence, prompts: Sequence[str], use_cache: bool):
+        """Start a long section's parts after the first, each as its own task with its own TokenUsage.
+        
+        The tasks outlive fallbacks of the first part, so finished parts are
+        never regenerated.
+        """
+        from app.integrations.tokenizer import TokenUsage
+        import asyncio
+        
+        later = []
+        for part_prompt in prompts:
+            part_usage = TokenUsage(clients[0].model)
+            later.append((asyncio.ensure_future(
+                GenerationService._generate_part(clients, part_prompt, use_cache, part_usage)
+            ), part_usage))
+        try:
+            yield later
+        finally:
+            for task, _ in later:
+                if task.done() and not task.cancelled():
+                    # Retrieve failures of parts that were never awaited
+                    task.exception()
+                task.cancel()
+    
+    @staticmethod
+    async def _generate_part(clients: Sequence, prompt: str, use_cache: bool, usage) -> str:
+        """Write one later part of a long section, falling back to the next routed client if it fails"""
+        for attempt, client in enumerate(clients):
+            usage.model = client.model
+            try:
+                return await client.generate_content(
+                    prompt, max_tokens=settings.LONG_SECTION_PART_MAX_TOKENS, stream=False,
+                    use_cache=use_cache, usage=usage
+                )
+            except Exception as e:
+                if attempt == len(clients) - 1:
+                    raise
+                logger.warning(f"{client} failed on a section part, falling back to {clients[attempt + 1]}: {e}")
+    
+    @staticmethod
+    async def _generate_parts(llm_client, prompt: str, later: Sequence, title: str, use_cache: bool, usage):
+        """Stream a long section's first part, then the later parts (see _later_parts) in order.
+        
+        Each later part is cleaned against the text before it, so the stitched
+        section doesn't repeat its title or paragraphs where the parts meet.
+        """
+        from app.utils import section_parts
+        
+        written = []
+        async for chunk in await llm_client.generate_content(
+            prompt, max_tokens=settings.LONG_SECTION_PART_MAX_TOKENS, stream=True, use_cache=use_cache, usage=usage
+        ):
+            written.append(chunk)
+            yield chunk
+        
+        # Only the parts that weren't served from the cache are charged
+        if usage.cached:
+            usage.cached_prompt_tokens, usage.cached_completion_tokens = usage.prompt_tokens, usage.completion_tokens
+        for task, part_usage in later:
+            text = "".join(written)
+            part = section_parts.clean_part(await task, text, title)
+            usage.prompt_tokens += part_usage.prompt_tokens
+            usage.completion_tokens += part_usage.completion_tokens
+            if part_usage.cached:
+                usage.cached_prompt_tokens += part_usage.prompt_tokens
+                usage.cached_completion_tokens += part_usage.completion_tokens
+            usage.cached = usage.cached and part_usage.cached
+            if part:
+                written.append(section_parts.separator(text) + part)
+                yield written[-1]
+    
+    @staticmethod
+    def _route(section, length: str, tone: str, tier: Optional[str]) -> list:
+        """LLM clients for a section generation: the routed model, then its fallbacks"""
+        from app.integrations.routing import model_router
+        
+        return model_router.clients(
+            content_type=section.content_type,
+            length=length,
+            tone=tone,
+            tier=tier or settings.QUOTA_DEFAULT_TIER
+        )
+    
+    @staticmethod
+    def _next_version(db: Session, section_id) -> int:
+        """Version number for a section's next content row"""
+        from app.models import GeneratedContent
+        from sqlalchemy import func
+        
+        latest = db.query(func.max(GeneratedContent.version)).filter(GeneratedContent.section_id == section_id).scalar()
+        return (latest or 0) + 1
+    
+    @staticmethod
+    async def _complete_with_fallback(clients: list, prompt: str, usage, max_tokens: int = 2000, use_cache: bool = True):
+        """Non-streaming completion from the first client that succeeds; returns (content, client)"""
+        for attempt, llm_client in enumerate(clients):
+            usage.model = llm_client.model
+            try:
+                content = await llm_client.generate_content(
+                    prompt, max_tokens=max_tokens, stream=False, use_cache=use_cache, usage=usage
+                )
+                return content, llm_client
+            except Exception as e:
+                if attempt == len(clients) - 1:
+                    raise
+                logger.warning(f"{llm_client} failed, falling back to {clients[attempt + 1]}: {e}")
+    
+    @staticmethod
+    async def _run_generation(
+        flight,
+        db: Session,
+        section,
+        prompt: str,
+        llm_client,
+        stream: bool,
+        use_cache: bool,
+        lane: str = LANE_INTERACTIVE,
+        user_id: Optional[UUID] = None,
+        tier: Optional[str] = None,
+        resume_from=None,
+        fallbacks: Sequence = (),
+        parts: Sequence[str] = ()
+    ):
+        """Run one upstream generation, publish its chunks and persist the result.
+        
+        Streamed text is checkpointed as an in-progress row so an interruption
+        leaves a resumable partial. With resume_from, the output continues that
+        row's partial content. If llm_client fails before producing any output,
+        the fallback clients are tried in turn. With parts, the text is written
+        from those part prompts concurrently (see _generate_parts) and always
+        streamed, while prompt is what the row records. Later parts fall back
+        on their own and are kept when the first part falls back.
+        """
+        from app.models import GeneratedContent
+        from app.integrations.tokenizer import TokenUsage
+        from contextlib import nullcontext
+        from datetime import datetime
+        import time
+        
         start_time = time.time()
-        llm_client = get_llm_client()
+        usage = TokenUsage(llm_client.model)
+        served_by = llm_client
+        generated = resume_from
+        prefix = resume_from.content if resume_from is not None else ""
+        base = {
+            "prompt_tokens": (resume_from.prompt_tokens or 0) if resume_from is not None else 0,
+            "completion_tokens": (resume_from.completion_tokens or 0) if resume_from is not None else 0,
+            "generation_time_ms": (resume_from.generation_time_ms or 0) if resume_from is not None else 0,
+        }
         
-        if stream:
-            async def content_generator():
-                full_content = ""
-                async for chunk in llm_client.generate_content(prompt, stream=True):
-                    full_content += chunk
-                    yield json.dumps({"type": "content_chunk", "content": chunk}) + "\n"
-                
-                # Save to database
-                elapsed_ms = int((time.time() - start_time) * 1000)
+        def save(content: str, status: str):
+            nonlocal generated
+            if generated is None:
                 generated = GeneratedContent(
                     id=uuid_module.uuid4(),
-                    section_id=section_id,
-                    content=full_content,
-                    model_used=f"gemini" if "gemini" in str(get_llm_client()) else "gpt-4",
-                    prompt_used=prompt,
-                    tokens_used=len(full_content.split()) * 1.3,  # Estimate
-                    generation_time_ms=elapsed_ms
+                    section_id=section.id,
+                    version=GenerationService._next_version(db, section.id),
+                    model_used=served_by.model,
+                    prompt_used=prompt
                 )
                 db.add(generated)
-                section.is_generated = True
-                db.commit()
+            generated.content = content
+            generated.status = status
+            # Responses served from the LLM cache record no spend
+            generated.prompt_tokens = base["prompt_tokens"] + usage.spent_prompt_tokens
+            generated.completion_tokens = base["completion_tokens"] + usage.spent_completion_tokens
+            generated.cache_hit = usage.cached
+            generated.tokens_used = generated.prompt_tokens + generated.completion_tokens
+            generated.generation_time_ms = base["generation_time_ms"] + int((time.time() - start_time) * 1000)
+            generated.checkpointed_at = datetime.utcnow() if status == "in_progress" else None
+            db.commit()
+        
+        # Spend is charged to whoever started the flight; callers that join it pay nothing
+        charge = quota_manager.charge(str(user_id), tier, usage, prompt) if user_id is not None else nullcontext()
+        clients = [llm_client, *fallbacks]
+        later_parts = GenerationService._later_parts(clients, parts[1:], use_cache)
+        async with charge, job_scheduler.slot(lane, str(user_id)), later_parts as later:
+            for attempt, served_by in enumerate(clients):
+                usage.model = served_by.model
+                try:
+                    if stream or parts:
+                        checkpointed_tokens = 0
+                        last_checkpoint = time.monotonic()
+                        # Kept joined as it grows so checkpoints don't re-join every chunk so far
+                        streamed = prefix
+                        try:
+                            if parts:
+                                source = GenerationService._generate_parts(
+                                    served_by, parts[0], later, section.title, use_cache, usage
+                                )
+                            else:
+                                source = await served_by.generate_content(prompt, stream=True, use_cache=use_cache, usage=usage)
+                            async for chunk in source:
+                                flight.publish(chunk)
+                                streamed += chunk
+                                if (usage.completion_tokens - checkpointed_tokens >= settings.GENERATION_CHECKPOINT_TOKENS
+                                        or time.monotonic() - last_checkpoint >= settings.GENERATION_CHECKPOINT_SECONDS):
+                                    save(streamed, "in_progress")
+                                    checkpointed_tokens = usage.completion_tokens
+                                    last_checkpoint = time.monotonic()
+                        except BaseException:
+                            if flight.chunks:
+                                # Keep what was streamed so the generation can be resumed instead of repaid
+                                db.rollback()
+                                save(streamed, "interrupted")
+                            raise
+                        content = streamed
+                    else:
+                        content = await served_by.generate_content(prompt, stream=False, use_cache=use_cache, usage=usage)
+                        # Streaming callers that joined a non-streaming flight get the whole text as one chunk
+                        flight.publish(content)
+                    break
+                except Exception as e:
+                    # Output already sent to subscribers can't be swapped for another model's
+                    if flight.chunks or attempt == len(clients) - 1:
+                        raise
+                    logger.warning(f"{served_by} failed, falling back to {clients[attempt + 1]}: {e}")
+        
+        # Save to database
+        save(content, "completed")
+        section.is_generated = True
+        db.commit()
+        DocumentSummaryService.record_section(db, section, generated)
+        return {
+            "content_id": generated.id,
+            "prompt_tokens": generated.prompt_tokens,
+            "completion_tokens": generated.completion_tokens,
+            "tokens_used": generated.tokens_used
+        }
+    
+    @staticmethod
+    def recover_interrupted(db: Session, content_id: Optional[UUID] = None) -> int:
+        """Mark in-progress rows whose checkpoints stopped (e.g. the process died) as interrupted.
+        
+        Sweeps the whole table (at startup and in workers), or only content_id's row.
+        """
+        from app.models import GeneratedContent
+        from datetime import datetime, timedelta
+        
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.GENERATION_CHECKPOINT_STALE_SECONDS)
+        query = db.query(GeneratedContent).filter(
+            GeneratedContent.status == "in_progress",
+            GeneratedContent.checkpointed_at < cutoff
+        )
+        if content_id is not None:
+            query = query.filter(GeneratedContent.id == content_id)
+        recovered = query.update({GeneratedContent.status: "interrupted"}, synchronize_session=False)
+        db.commit()
+        return recovered
+    
+    @staticmethod
+    async def resume_generation(
+        db: Session,
+        content_id: UUID,
+        user_id: UUID,
+        mode: str = "continue",
+        stream: bool = False,
+        tier: Optional[str] = None
+    ):
+        """Finish an interrupted generation with a continuation prompt, or keep its partial text as a draft"""
+        from app.models import Section, Document, Project, GeneratedContent
+        from app.integrations import PromptManager
+        import json
+        
+        if mode not in ("continue", "keep"):
+            raise ValueError(f"Unsupported resume mode: {mode}")
+        
+        content = db.query(GeneratedContent).join(Section).join(Document).join(Project).filter(
+            GeneratedContent.id == content_id,
+            Project.user_id == user_id
+        ).first()
+        
+        if not content:
+            raise ValueError("Content not found")
+        
+        if content.status == "in_progress":
+            GenerationService.recover_interrupted(db, content.id)
+            db.refresh(content)
+        if content.status != "interrupted":
+            raise ValueError(f"Content is {content.status}, not interrupted")
+        
+        if mode == "keep":
+            content.status = "draft"
+            db.commit()
+            return content
+        
+        offset = len(content.content)
+        prompt = PromptManager.build_continuation_prompt(content.prompt_used or "", content.content)
+        section = content.section
+        config = section.document.config_json or {}
+        llm_client, *fallbacks = GenerationService._route(
+            section, config.get("length", "medium"), config.get("tone", "professional"), tier
+        )
+        lane = LANE_INTERACTIVE_STREAM if stream else LANE_INTERACTIVE
+        # Concurrent resumes of the same row share one continuation
+        flight, _ = GenerationService._in_flight.join(
+            ("resume", str(content.id)),
+            lambda flight: GenerationService._run_generation(
+                flight, db, section, prompt, llm_client, True, False, lane, user_id, tier,
+                resume_from=content, fallbacks=fallbacks
+            )
+        )
+        
+        if stream:
+            async def content_generator():
+                yield json.dumps({"type": "resume_started", "content_id": str(content.id), "offset": offset}) + "\n"
+                async for chunk in GenerationService._coalesced(flight):
+                    yield json.dumps({"type": "content_chunk", "content": chunk}) + "\n"
                 
-                yield json.dumps({"type": "generation_complete", "content_id": str(generated.id)}) + "\n"
+                result = await flight.result()
+                yield json.dumps({
+                    "type": "generation_complete",
+                    "content_id": str(result["content_id"]),
+                    "prompt_tokens": result["prompt_tokens"],
+                    "completion_tokens": result["completion_tokens"],
+                    "tokens_used": result["tokens_used"]
+                }) + "\n"
             
             return content_generator()
-        else:
-            content = await llm_client.generate_content(prompt, stream=False)
-            elapsed_ms = int((time.time() - start_time) * 1000)
+        
+        await flight.result()
+        db.refresh(content)
+        return content
+    
+    @staticmethod
+    def approve_content(db: Session, content_id: UUID, user_id: UUID):
+        """Mark a version as its section's approved content and fold it into the document summary"""
+        from app.models import Section, Document, Project, GeneratedContent
+        
+        content = db.query(GeneratedContent).join(Section).join(Document).join(Project).filter(
+            GeneratedContent.id == content_id,
+            Project.user_id == user_id
+        ).first()
+        
+        if not content:
+            raise ValueError("Content not found")
+        if content.status != "completed":
+            raise ValueError(f"Content is {content.status}, only completed content can be approved")
+        
+        # One approved version per section
+        db.query(GeneratedContent).filter(
+            GeneratedContent.section_id == content.section_id,
+            GeneratedContent.id != content.id
+        ).update({GeneratedContent.is_approved: False}, synchronize_session=False)
+        content.is_approved = True
+        db.commit()
+        DocumentSummaryService.record_section(db, content.section, content)
+        return content
+
+
+class GenerationJobService:
+    """Durable background generation jobs run by worker processes"""
+    
+    @staticmethod
+    async def enqueue(
+        db: Session,
+        user_id: UUID,
+        document_id: UUID,
+        section_id: UUID,
+        use_cache: bool = False,
+        queue=None,
+        tier: Optional[str] = None
+    ):
+        """Record a generation job and hand it to the job queue"""
+        from app.models import Section, Document, Project, GenerationJob
+        from app.utils.job_queue import get_job_queue
+        
+        # Verify access
+        document = db.query(Document).join(Project).filter(
+            Document.id == document_id,
+            Project.user_id == user_id
+        ).first()
+        
+        if not document:
+            raise ValueError("Access denied")
+        
+        section = db.query(Section).filter(Section.id == section_id).first()
+        if not section or section.document_id != document_id:
+            raise ValueError("Section not found")
+        
+        job = GenerationJob(
+            id=uuid_module.uuid4(),
+            user_id=user_id,
+            document_id=document_id,
+            section_id=section_id,
+            status="queued",
+            params_json={"use_cache": use_cache, "tier": tier}
+        )
+        db.add(job)
+        db.commit()
+        
+        if queue is not None:
+            await queue.enqueue(job.id)
+            return job
+        
+        queue = get_job_queue()
+        try:
+            await queue.enqueue(job.id)
+        finally:
+            await queue.aclose()
+        return job
+    
+    @staticmethod
+    def get_job(db: Session, job_id: UUID, user_id: UUID):
+        """Get a job owned by the user"""
+        from app.models import GenerationJob
+        
+        job = db.query(GenerationJob).filter(
+            GenerationJob.id == job_id,
+            GenerationJob.user_id == user_id
+        ).first()
+        
+        if not job:
+            raise ValueError("Job not found")
+        return job
+    
+    @staticmethod
+    async def stream_job(db: Session, job_id: UUID, user_id: UUID, offset: int = 0):
+        """Re-attach to a job: replay its content from offset, then follow it until it finishes"""
+        from app.models import GeneratedContent
+        import asyncio
+        import json
+        
+        job = GenerationJobService.get_job(db, job_id, user_id)
+        
+        async def event_generator():
+            sent = offset
+            while True:
+                db.refresh(job)
+                if job.status == "completed":
+                    content = db.query(GeneratedContent).filter(GeneratedContent.id == job.content_id).first()
+                    text = content.content if content else ""
+                elif job.status == "failed":
+                    yield json.dumps({"type": "job_failed", "job_id": str(job.id), "error": job.error_message}) + "\n"
+                    return
+                else:
+                    text = job.partial_content or ""
+                
+                if len(text) > sent:
+                    yield json.dumps({"type": "content_chunk", "offset": sent, "content": text[sent:]}) + "\n"
+                    sent = len(text)
+                
+                if job.status == "completed":
+                    yield json.dumps({
+                        "type": "generation_complete",
+                        "job_id": str(job.id),
+                        "content_id": str(job.content_id)
+                    }) + "\n"
+                    return
+                # End the read transaction so the next refresh sees the worker's commits
+                db.commit()
+                await asyncio.sleep(settings.JOB_POLL_INTERVAL_SECONDS)
+        
+        return event_generator()
+    
+    @staticmethod
+    def claim(db: Session, job_id: UUID, worker_id: str) -> bool:
+        """Atomically move a queued job that is not backing off to running for this worker"""
+        from app.models import GenerationJob
+        from datetime import datetime
+        from sqlalchemy import or_
+        
+        now = datetime.utcnow()
+        claimed = db.query(GenerationJob).filter(
+            GenerationJob.id == job_id,
+            GenerationJob.status == "queued",
+            or_(GenerationJob.available_at == None, GenerationJob.available_at <= now)
+        ).update({
+            GenerationJob.status: "running",
+            GenerationJob.worker_id: worker_id,
+            GenerationJob.attempts: GenerationJob.attempts + 1,
+            GenerationJob.started_at: now,
+            GenerationJob.heartbeat_at: now
+        }, synchronize_session=False)
+        db.commit()
+        return claimed == 1
+    
+    @staticmethod
+    async def run_job(job_id: UUID, worker_id: str, session_factory=None) -> Optional[str]:
+        """Claim and run one job in a worker, checkpointing streamed text.
+        
+        Returns the job's resulting status ("queued" also for a job still backing
+        off from a failed attempt), or None if another worker claimed it.
+        """
+        from app.models import Document, Section, GenerationJob
+        from datetime import datetime, timedelta
+        import asyncio
+        import time
+        
+        if session_factory is None:
+            from app.database import SessionLocal
+            session_factory = SessionLocal
+        
+        db = session_factory()
+        try:
+            if not await asyncio.to_thread(GenerationJobService.claim, db, job_id, worker_id):
+                backing_off = db.query(GenerationJob.id).filter(
+                    GenerationJob.id == job_id, GenerationJob.status == "queued"
+                ).first()
+                return "queued" if backing_off else None
             
-            # Save to database
-            generated = GeneratedContent(
-                id=uuid_module.uuid4(),
-                section_id=section_id,
-                content=content,
-                model_used="gemini" if "gemini" in str(get_llm_client()) else "gpt-4",
-                prompt_used=prompt,
-                tokens_used=len(content.split()) * 1.3,
-                generation_time_ms=elapsed_ms
+            job = db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
+            
+            async def heartbeat():
+                # Keeps the lease while the job waits on the scheduler or a slow first token
+                while True:
+                    await asyncio.sleep(settings.JOB_LEASE_SECONDS / 3)
+                    try:
+                        await asyncio.to_thread(GenerationJobService._renew_lease, session_factory, job_id)
+                    except Exception as e:
+                        logger.warning(f"Heartbeat for job {job_id} failed: {e}")
+            
+            beat = asyncio.ensure_future(heartbeat())
+            try:
+                document = db.query(Document).filter(Document.id == job.document_id).first()
+                section = db.query(Section).filter(Section.id == job.section_id).first()
+                if not document or not section:
+                    raise ValueError("Section not found")
+                
+                params = job.params_json or {}
+                flight = GenerationService._start_generation(
+                    db, document, section, True, params.get("use_cache", False), LANE_BATCH,
+                    job.user_id, params.get("tier")
+                )
+                last_checkpoint = time.monotonic()
+                partial = ""
+                async for chunk in flight.subscribe():
+                    partial += chunk
+                    if time.monotonic() - last_checkpoint >= settings.JOB_PROGRESS_FLUSH_SECONDS:
+                        job.partial_content = partial
+                        db.commit()
+                        last_checkpoint = time.monotonic()
+                result = await flight.result()
+                
+                job.status = "completed"
+                job.content_id = result["content_id"]
+                job.partial_content = None
+                job.finished_at = datetime.utcnow()
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                # Transient failures go back on the queue, after an exponential backoff, until attempts run out
+                job.status = "queued" if job.attempts < settings.JOB_MAX_ATTEMPTS else "failed"
+                job.available_at = datetime.utcnow() + timedelta(seconds=min(
+                    settings.JOB_RETRY_BACKOFF_SECONDS * 2 ** (job.attempts - 1),
+                    settings.JOB_RETRY_BACKOFF_MAX_SECONDS
+                )) if job.status == "queued" else None
+                job.error_message = str(e)
+                job.finished_at = datetime.utcnow() if job.status == "failed" else None
+                db.commit()
+            finally:
+                beat.cancel()
+            return job.status
+        finally:
+            db.close()
+    
+    @staticmethod
+    def retry_delay(db: Session, job_id: UUID) -> float:
+        """Seconds until a queued job's backoff ends (0 if it can be claimed now)"""
+        from app.models import GenerationJob
+        from datetime import datetime
+        
+        row = db.query(GenerationJob.available_at).filter(GenerationJob.id == job_id).first()
+        if row is None or row.available_at is None:
+            return 0.0
+        return max(0.0, (row.available_at - datetime.utcnow()).total_seconds())
+    
+    @staticmethod
+    def _renew_lease(session_factory, job_id: UUID):
+        """Bump a running job's heartbeat in a session of its own, apart from the one generating"""
+        from app.models import GenerationJob
+        from datetime import datetime
+        
+        db = session_factory()
+        try:
+            db.query(GenerationJob).filter(GenerationJob.id == job_id).update(
+                {GenerationJob.heartbeat_at: datetime.utcnow()}, synchronize_session=False
             )
-            db.add(generated)
-            section.is_generated = True
             db.commit()
-            db.refresh(generated)
-            return generated
+        finally:
+            db.close()
+    
+    @staticmethod
+    def requeue_stale(db: Session) -> list:
+        """Job ids to offer to the queue again: running jobs whose worker stopped heartbeating, and
+        queued jobs left unclaimed for a lease (e.g. popped from Redis by a worker that then died).
+        
+        available_at is set to now on requeued jobs, so a job still waiting in a
+        long queue is offered again at most once per lease; claim drops duplicates.
+        """
+        from app.models import GenerationJob
+        from app.utils.job_queue import lease_cutoff
+        from datetime import datetime
+        from sqlalchemy import and_, func, or_
+        
+        cutoff = lease_cutoff()
+        stale = db.query(GenerationJob).filter(or_(
+            and_(GenerationJob.status == "running", GenerationJob.heartbeat_at < cutoff),
+            and_(
+                GenerationJob.status == "queued",
+                func.coalesce(GenerationJob.available_at, GenerationJob.created_at) < cutoff
+            )
+        )).all()
+        now = datetime.utcnow()
+        for job in stale:
+            job.status = "queued"
+            job.available_at = now
+        db.commit()
+        return [job.id for job in stale]
 
 
 class RefinementService:
@@ -325,3 +1337,444 @@ class RefinementService:
         db.commit()
         db.refresh(refinement)
         return refinement
+    
+    @staticmethod
+    def _feedback(db: Session, content, refinement_ids: Optional[List[UUID]] = None) -> list:
+        """Unprocessed refinements to apply to content: the given ids, or all of them, oldest first.
+        
+        Refinements already applied are never applied again, even when asked for by id.
+        """
+        from app.models import Refinement
+        
+        query = db.query(Refinement).filter(
+            Refinement.generated_content_id == content.id,
+            Refinement.is_processed == False
+        )
+        if refinement_ids:
+            query = query.filter(Refinement.id.in_(refinement_ids))
+        return query.order_by(Refinement.created_at).all()
+    
+    @staticmethod
+    def _merge_feedback(refinements: list) -> dict:
+        """Combine several refinements into the arguments of one refinement prompt.
+        
+        Only exact repeats (ignoring case, spacing and trailing punctuation) are
+        dropped, so every refinement marked processed is in the prompt; feedback
+        that merely shares words with other feedback may mean something else.
+        """
+        def unique(texts):
+            normalized = {}
+            for text in texts:
+                key = " ".join(text.lower().split()).rstrip(".!?")
+                if key and key not in normalized:
+                    normalized[key] = text.strip()
+            return list(normalized.values())
+        
+        def listing(items):
+            return items[0] if len(items) == 1 else "\n".join(f"{i}. {item}" for i, item in enumerate(items, 1))
+        
+        feedback = unique(r.feedback_text for r in refinements if r.feedback_text)
+        suggestions = unique(r.suggested_changes for r in refinements if r.suggested_changes)
+        reasons = list(dict.fromkeys(r.refinement_reason for r in refinements if r.refinement_reason))
+        types = {r.feedback_type for r in refinements}
+        return {
+            # Any dislike means the content has to change, whatever else was said
+            "feedback_type": next((t for t in ("dislike", "comment", "like") if t in types), "comment"),
+            "user_feedback": listing(feedback) if feedback else "None",
+            "suggested_changes": listing(suggestions) if suggestions else "",
+            "refinement_reason": ", ".join(reasons) or "other",
+        }
+    
+    @staticmethod
+    def _mark_applied(db: Session, refinements: list, content_id) -> None:
+        for refinement in refinements:
+            refinement.is_processed = True
+            refinement.regenerated_content_id = content_id
+            refinement.error_message = None
+        db.commit()
+    
+    @staticmethod
+    def _locate_span(text: str, start: int, end: int, selected: Optional[str] = None):
+        """Validate a character span, re-finding the selected text if the offsets no longer match it"""
+        import re
+        
+        if selected is not None and text[start:end] != selected:
+            matches = [m.start() for m in re.finditer(re.escape(selected), text)] if selected else []
+            if not matches:
+                raise ValueError("Selected text was not found in the content")
+            # Prefer the occurrence nearest the given offsets
+            start = min(matches, key=lambda i: abs(i - start))
+            end = start + len(selected)
+        if not 0 <= start < end <= len(text):
+            raise ValueError(f"Span {start}-{end} is outside the content ({len(text)} characters)")
+        return start, end
+    
+    @staticmethod
+    async def refine_span(
+        db: Session,
+        content_id: UUID,
+        user_id: UUID,
+        start: int,
+        end: int,
+        selected: Optional[str] = None,
+        refinement_ids: Optional[List[UUID]] = None,
+        tier: Optional[str] = None
+    ):
+        """Rewrite one span of a content version from its feedback and save the spliced text as a new version.
+        
+        Only the span and a little neighbouring text are sent to the model.
+        Returns the new version and the span's offsets within it.
+        """
+        from app.models import Section, Document, Project, GeneratedContent
+        from app.integrations import PromptManager
+        from app.integrations.tokenizer import TokenUsage, count_tokens
+        import time
+        
+        content = db.query(GeneratedContent).join(Section).join(Document).join(Project).filter(
+            GeneratedContent.id == content_id,
+            Project.user_id == user_id
+        ).first()
+        
+        if not content:
+            raise ValueError("Content not found")
+        if content.status not in ("completed", "draft"):
+            raise ValueError(f"Content is {content.status} and cannot be refined")
+        
+        refinements = RefinementService._feedback(db, content, refinement_ids)
+        if not refinements:
+            raise ValueError("No feedback to apply")
+        
+        text = content.content
+        start, end = RefinementService._locate_span(text, start, end, selected)
+        span = text[start:end]
+        context_chars = settings.REFINEMENT_SPAN_CONTEXT_CHARS
+        prompt = PromptManager.build_span_refinement_prompt(
+            span=span,
+            before=text[max(0, start - context_chars):start],
+            after=text[end:end + context_chars],
+            **RefinementService._merge_feedback(refinements)
+        )
+        prompt = PromptManager.add_safety_guidelines(prompt)
+        
+        # A small edit goes to the short-form route and only needs room for about the span's length
+        section = content.section
+        config = section.document.config_json or {}
+        clients = GenerationService._route(section, "short", config.get("tone", "professional"), tier)
+        max_tokens = min(settings.REFINEMENT_SPAN_MAX_TOKENS, max(64, 2 * count_tokens(span) + 32))
+        
+        start_time = time.time()
+        usage = TokenUsage(clients[0].model)
+        async with quota_manager.charge(str(user_id), tier, usage, prompt), \
+                job_scheduler.slot(LANE_INTERACTIVE, str(user_id)):
+            # Asking again for the same edit should give a fresh rewrite, not the cached one
+            replacement, served_by = await GenerationService._complete_with_fallback(
+                clients, prompt, usage, max_tokens=max_tokens, use_cache=False
+            )
+        
+        # Keep the span's own leading and trailing whitespace so paragraphs stay separated
+        replacement = replacement.strip()
+        leading = span[:len(span) - len(span.lstrip())]
+        trailing = span[len(span.rstrip()):]
+        new_start = start + len(leading)
+        refined = GeneratedContent(
+            id=uuid_module.uuid4(),
+            section_id=section.id,
+            content=text[:start] + leading + replacement + trailing + text[end:],
+            content_format=content.content_format,
+            version=GenerationService._next_version(db, section.id),
+            model_used=served_by.model,
+            prompt_used=prompt,
+            prompt_tokens=usage.prompt_tokens,
+            completion_tokens=usage.completion_tokens,
+            tokens_used=usage.total_tokens,
+            generation_time_ms=int((time.time() - start_time) * 1000),
+            status="completed"
+        )
+        db.add(refined)
+        RefinementService._mark_applied(db, refinements, refined.id)
+        DocumentSummaryService.record_section(db, section, refined)
+        return refined, (new_start, new_start + len(replacement))
+    
+    @staticmethod
+    def _start_refinement(
+        db: Session,
+        content,
+        refinements: list,
+        stream: bool,
+        use_cache: bool,
+        lane: str,
+        user_id: UUID,
+        tier: Optional[str] = None
+    ):
+        """Build the merged refinement prompt for content and join or start its single-flight regeneration"""
+        from app.integrations import PromptManager
+        
+        prompt = PromptManager.build_refinement_prompt(
+            content.content, **RefinementService._merge_feedback(refinements)
+        )
+        prompt = PromptManager.add_safety_guidelines(prompt)
+        section = content.section
+        config = section.document.config_json or {}
+        llm_client, *fallbacks = GenerationService._route(
+            section, config.get("length", "medium"), config.get("tone", "professional"), tier
+        )
+        
+        async def run(flight):
+            result = await GenerationService._run_generation(
+                flight, db, section, prompt, llm_client, stream, use_cache, lane, user_id, tier, fallbacks=fallbacks
+            )
+            RefinementService._mark_applied(db, refinements, result["content_id"])
+            return result
+        
+        # Repeated clicks on the same feedback share one refinement
+        flight, _ = GenerationService._in_flight.join(
+            ("refine", str(content.id), tuple(sorted(str(r.id) for r in refinements))), run
+        )
+        return flight
+    
+    @staticmethod
+    async def refine_content(
+        db: Session,
+        content_id: UUID,
+        user_id: UUID,
+        refinement_ids: Optional[List[UUID]] = None,
+        stream: bool = False,
+        tier: Optional[str] = None
+    ):
+        """Apply a content version's feedback in one refinement call, producing the section's next version.
+        
+        The given refinements (or all unprocessed ones) are merged into a single
+        prompt, then marked processed and linked to the new version.
+        """
+        from app.models import Section, Document, Project, GeneratedContent
+        import json
+        
+        content = db.query(GeneratedContent).join(Section).join(Document).join(Project).filter(
+            GeneratedContent.id == content_id,
+            Project.user_id == user_id
+        ).first()
+        
+        if not content:
+            raise ValueError("Content not found")
+        if content.status not in ("completed", "draft"):
+            raise ValueError(f"Content is {content.status} and cannot be refined")
+        
+        refinements = RefinementService._feedback(db, content, refinement_ids)
+        if not refinements:
+            raise ValueError("No feedback to apply")
+        
+        lane = LANE_INTERACTIVE_STREAM if stream else LANE_INTERACTIVE
+        applied = [str(r.id) for r in refinements]
+        flight = RefinementService._start_refinement(db, content, refinements, stream, False, lane, user_id, tier)
+        
+        if stream:
+            async def content_generator():
+                async for chunk in GenerationService._coalesced(flight):
+                    yield json.dumps({"type": "content_chunk", "content": chunk}) + "\n"
+                
+                result = await flight.result()
+                yield json.dumps({
+                    "type": "generation_complete",
+                    "content_id": str(result["content_id"]),
+                    "refinement_ids": applied,
+                    "prompt_tokens": result["prompt_tokens"],
+                    "completion_tokens": result["completion_tokens"],
+                    "tokens_used": result["tokens_used"]
+                }) + "\n"
+            
+            return content_generator()
+        
+        result = await flight.result()
+        return db.query(GeneratedContent).filter(GeneratedContent.id == result["content_id"]).first()
+    
+    @staticmethod
+    def create_bulk_job(
+        db: Session,
+        document_id: UUID,
+        user_id: UUID,
+        instruction: str,
+        refinement_reason: Optional[str] = None,
+        use_cache: bool = False
+    ):
+        """Record one instruction as a refinement of every approved section in a document"""
+        from app.models import Section, Document, Project, GeneratedContent, Refinement, RefinementJob
+        
+        # Verify access
+        document = db.query(Document).join(Project).filter(
+            Document.id == document_id,
+            Project.user_id == user_id
+        ).first()
+        
+        if not document:
+            raise ValueError("Access denied")
+        
+        contents = db.query(GeneratedContent).join(Section).filter(
+            Section.document_id == document_id,
+            GeneratedContent.is_approved == True,
+            GeneratedContent.status.in_(("completed", "draft"))
+        ).order_by(Section.section_order).all()
+        
+        if not contents:
+            raise ValueError("No approved content to refine")
+        
+        job = RefinementJob(
+            id=uuid_module.uuid4(),
+            user_id=user_id,
+            document_id=document_id,
+            instruction=instruction,
+            status="pending",
+            params_json={"use_cache": use_cache}
+        )
+        db.add(job)
+        db.add_all([
+            Refinement(
+                id=uuid_module.uuid4(),
+                generated_content_id=content.id,
+                feedback_type="comment",
+                feedback_text=instruction,
+                refinement_reason=refinement_reason or "other",
+                job_id=job.id
+            )
+            for content in contents
+        ])
+        db.commit()
+        return job
+    
+    @staticmethod
+    def get_bulk_job(db: Session, job_id: UUID, user_id: UUID):
+        """Get a bulk refinement job owned by the user"""
+        from app.models import RefinementJob
+        
+        job = db.query(RefinementJob).filter(
+            RefinementJob.id == job_id,
+            RefinementJob.user_id == user_id
+        ).first()
+        
+        if not job:
+            raise ValueError("Job not found")
+        return job
+    
+    @staticmethod
+    async def run_bulk_job(db: Session, job_id: UUID, user_id: UUID, tier: Optional[str] = None):
+        """Refine a job's unfinished sections concurrently as one NDJSON event stream.
+        
+        Sections already refined are skipped, so running a job again retries only
+        the sections that failed or never ran.
+        """
+        from app.models import Section, GeneratedContent, Refinement
+        import asyncio
+        import json
+        
+        job = RefinementService.get_bulk_job(db, job_id, user_id)
+        pending = db.query(Refinement).join(
+            GeneratedContent, Refinement.generated_content_id == GeneratedContent.id
+        ).join(Section).filter(
+            Refinement.job_id == job.id,
+            Refinement.is_processed == False
+        ).order_by(Section.section_order).all()
+        
+        if not pending:
+            raise ValueError("Job has no sections left to refine")
+        pending_ids = [refinement.id for refinement in pending]
+        
+        use_cache = (job.params_json or {}).get("use_cache", False)
+        events: asyncio.Queue = asyncio.Queue(maxsize=settings.STREAM_EVENT_QUEUE_SIZE)
+        
+        async def event_generator():
+            job.status = "running"
+            job.finished_at = None
+            db.commit()
+            yield json.dumps({
+                "type": "job_started",
+                "job_id": str(job.id),
+                "document_id": str(job.document_id),
+                "pending": len(pending),
+                "skipped": len(job.refinements) - len(pending)
+            }) + "\n"
+            
+            tasks = [
+                asyncio.ensure_future(RefinementService._refine_section_events(
+                    events, db, refinement_id, use_cache, user_id, tier
+                ))
+                for refinement_id in pending_ids
+            ]
+            remaining = len(tasks)
+            completed = 0
+            try:
+                while remaining:
+                    event = await events.get()
+                    if event["type"] == "section_complete":
+                        completed += 1
+                        remaining -= 1
+                    elif event["type"] == "section_error":
+                        remaining -= 1
+                    yield json.dumps(event) + "\n"
+                
+                RefinementService._finish_bulk_job(db, job)
+                yield json.dumps({
+                    "type": "job_complete",
+                    "job_id": str(job.id),
+                    "status": job.status,
+                    "completed": completed,
+                    "failed": len(pending) - completed
+                }) + "\n"
+            finally:
+                # Refinements already under way keep running and persist; only the fan-out stops
+                for task in tasks:
+                    task.cancel()
+                if job.status == "running":
+                    RefinementService._finish_bulk_job(db, job)
+        
+        return event_generator()
+    
+    @staticmethod
+    async def _refine_section_events(
+        events, db: Session, refinement_id: UUID, use_cache: bool, user_id: UUID, tier: Optional[str] = None
+    ):
+        """Apply one section's share of a bulk job, reporting the outcome on the shared event queue.
+        
+        Sections run concurrently, so each refines in its own session, kept
+        open until its flight finishes.
+        """
+        from app.models import GeneratedContent, Refinement
+        
+        task_db = Session(bind=db.get_bind())
+        flight = None
+        refinement = task_db.get(Refinement, refinement_id)
+        content = refinement.generated_content
+        ids = {"section_id": str(content.section_id), "refinement_id": str(refinement.id)}
+        try:
+            async with GenerationService._slots.slot(str(user_id)):
+                await events.put({"type": "section_started", **ids})
+                flight = RefinementService._start_refinement(
+                    task_db, content, [refinement], False, use_cache, LANE_BATCH, user_id, tier
+                )
+                result = await flight.result()
+            refined = task_db.query(GeneratedContent).filter(GeneratedContent.id == result["content_id"]).first()
+            await events.put({
+                "type": "section_complete",
+                **ids,
+                "content_id": str(refined.id),
+                "version": refined.version,
+                "content": refined.content,
+                "tokens_used": result["tokens_used"]
+            })
+        except Exception as e:
+            refinement.error_message = str(e)
+            task_db.commit()
+            await events.put({"type": "section_error", **ids, "error": str(e)})
+        finally:
+            if flight is None:
+                task_db.close()
+            else:
+                flight.add_done_callback(task_db.close)
+    
+    @staticmethod
+    def _finish_bulk_job(db: Session, job) -> None:
+        from datetime import datetime
+        
+        # The sections were refined in their own sessions, so reload what this one holds
+        db.expire_all()
+        job.status = "completed" if all(r.is_processed for r in job.refinements) else "failed"
+        job.finished_at = datetime.utcnow()
+        db.commit()
@@ -0,0 +1,47 @@
+"""Concurrency limiting helpers"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Hashable
+
+
+class ConcurrencyLimiter:
+    """Caps concurrent work globally and per key (e.g. per user)"""
+
+    def __init__(self, global_limit: int, per_key_limit: int):
+        self.global_limit = global_limit
+        self.per_key_limit = per_key_limit
+        self._global: asyncio.Semaphore = None
+        self._global_loop = None
+        self._per_key: Dict[Hashable, asyncio.Semaphore] = {}
+        self._holders: Dict[Hashable, int] = {}
+
+    def _global_semaphore(self) -> asyncio.Semaphore:
+        # Semaphores bind to the loop that first waits on them
+        loop = asyncio.get_running_loop()
+        if self._global is None or self._global_loop is not loop:
+            self._global = asyncio.Semaphore(self.global_limit)
+            self._global_loop = loop
+        return self._global
+
+    @asynccontextmanager
+    async def slot(self, key: Hashable):
+        """Hold one per-key slot and one global slot for the duration of the block"""
+        semaphore = self._per_key.get(key)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_key_limit)
+            self._per_key[key] = semaphore
+        self._holders[key] = self._holders.get(key, 0) + 1
+        try:
+            async with semaphore:
+                async with self._global_semaphore():
+                    yield
+        finally:
+            self._holders[key] -= 1
+            if not self._holders[key]:
+                # Drop idle per-key semaphores so the map doesn't grow with every user
+                del self._holders[key]
+                del self._per_key[key]
+
+    def active_keys(self) -> int:
+        """Number of keys currently holding or waiting for a slot"""
+        return len(self._per_key)
@@ -13,6 +13,9 @@ from pptx.util import Inches, Pt as PptPt
 from pptx.enum.text import PP_ALIGN
 from pptx.dml.color import RGBColor as PptRGBColor
 
+from app.core.config import settings
+from app.utils.swr_cache import StaleWhileRevalidateCache
+
 
 class WordExporter:
     """Export to Word (.docx) format"""
@@ -217,70 +220,178 @@ class ExportService:
 class TemplateService:
     """Service for AI-generated templates (bonus feature)"""
     
+    # Parsed templates by normalized request; popular topics skip the LLM entirely
+    _cache = StaleWhileRevalidateCache(
+        max_entries=settings.TEMPLATE_CACHE_MAX_ENTRIES,
+        ttl_seconds=settings.TEMPLATE_CACHE_TTL_SECONDS,
+        stale_seconds=settings.TEMPLATE_CACHE_STALE_SECONDS
+    )
+    
+    @staticmethod
+    def _normalize(value: str) -> str:
+        """Case- and whitespace-insensitive form of a template parameter"""
+        return " ".join(value.lower().split())
+    
+    @staticmethod
+    def _outline_request(topic: str, document_type: str, num_sections: int, llm_client, style: str):
+        """Prompt and cache key for an outline"""
+        from app.integrations import PromptManager
+        
+        prompt = PromptManager.build_outline_prompt(topic, document_type, num_sections, style)
+        key = (
+            "outline", str(llm_client), TemplateService._normalize(topic),
+            TemplateService._normalize(document_type), num_sections, TemplateService._normalize(style)
+        )
+        return prompt, key
+    
+    @staticmethod
+    def _slide_titles_request(topic: str, num_slides: int, llm_client, audience: str):
+        """Prompt and cache key for slide titles"""
+        from app.integrations import PromptManager
+        
+        prompt = PromptManager.build_slide_title_prompt(topic, num_slides, audience)
+        key = (
+            "slide_titles", str(llm_client), TemplateService._normalize(topic),
+            num_slides, TemplateService._normalize(audience)
+        )
+        return prompt, key
+    
+    @staticmethod
+    def _fallback_outline(num_sections: int) -> list:
+        return [
+            {"title": f"Section {i+1}", "description": f"Content for section {i+1}"}
+            for i in range(num_sections)
+        ]
+    
+    @staticmethod
+    def _fallback_slide_titles(topic: str, num_slides: int) -> list:
+        return [f"Slide {i+1}: {topic}" for i in range(num_slides)]
+    
+    @staticmethod
+    async def _request_json_list(prompt: str, llm_client, limit: Optional[int] = None, usage=None) -> Optional[list]:
+        """Ask the LLM for a JSON array; None when nothing in the response parses"""
+        from app.utils.json_stream import parse_json_array
+        
+        # Templates are cached parsed, here; background refreshes must reach the LLM
+        response = await llm_client.generate_content(prompt, use_cache=False, usage=usage)
+        items = parse_json_array(response)
+        return items[:limit] if items and limit else items
+    
+    @staticmethod
+    async def _stream_json_list(prompt: str, key, llm_client, limit: Optional[int] = None, usage=None):
+        """Yield array elements as soon as each is complete in the LLM stream, caching the full list"""
+        from app.utils.json_stream import JSONArrayStreamParser
+        
+        cached = TemplateService._cache.peek(
+            key, lambda: TemplateService._request_json_list(prompt, llm_client, limit)
+        )
+        if cached is not None:
+            for item in cached:
+                yield item
+            return
+        
+        parser = JSONArrayStreamParser()
+        items = []
+        
+        def take(completed: list) -> list:
+            return completed[:max(limit - len(items), 0)] if limit else completed
+        
+        stream = await llm_client.generate_content(prompt, stream=True, use_cache=False, usage=usage)
+        try:
+            async for chunk in stream:
+                for item in take(parser.feed(chunk)):
+                    items.append(item)
+                    yield item
+                if parser.done or (limit and len(items) >= limit):
+                    break
+            # A response cut off mid-array still yields its last complete-enough element
+            for item in take(parser.finish()):
+                items.append(item)
+                yield item
+        finally:
+            await stream.aclose()
+        
+        if items:
+            TemplateService._cache.set(key, items)
+    
     @staticmethod
-    def generate_outline_template(
+    async def generate_outline_template(
         topic: str,
         document_type: str,
         num_sections: int,
         llm_client,
-        style: str = "professional"
+        style: str = "professional",
+        usage=None
     ):
-        """Generate AI-suggested outline"""
-        from app.integrations import PromptManager
-        import json
-        import asyncio
+        """Generate AI-suggested outline; usage collects the tokens of an LLM call made for this request"""
+        prompt, key = TemplateService._outline_request(topic, document_type, num_sections, llm_client, style)
         
-        prompt = PromptManager.build_outline_prompt(
-            topic, document_type, num_sections, style
+        outline = await TemplateService._cache.get_or_load(
+            key, lambda: TemplateService._request_json_list(prompt, llm_client, usage=usage)
         )
+        if outline is not None:
+            return outline
         
-        # Get response from LLM
-        loop = asyncio.get_event_loop()
-        response = loop.run_until_complete(llm_client.generate_content(prompt))
+        # Fallback: return structured outline
+        return TemplateService._fallback_outline(num_sections)
+    
+    @staticmethod
+    async def stream_outline_template(
+        topic: str,
+        document_type: str,
+        num_sections: int,
+        llm_client,
+        style: str = "professional",
+        usage=None
+    ):
+        """Yield outline items one by one as the LLM produces them"""
+        prompt, key = TemplateService._outline_request(topic, document_type, num_sections, llm_client, style)
         
-        # Parse JSON response
-        try:
-            import re
-            json_match = re.search(r'\[.*\]', response, re.DOTALL)
-            if json_match:
-                outline = json.loads(json_match.group())
-                return outline
-        except json.JSONDecodeError:
-            pass
+        produced = False
+        async for item in TemplateService._stream_json_list(prompt, key, llm_client, usage=usage):
+            produced = True
+            yield item
         
-        # Fallback: return structured outline
-        return [
-            {"title": f"Section {i+1}", "description": f"Content for section {i+1}"}
-            for i in range(num_sections)
-        ]
+        if not produced:
+            for item in TemplateService._fallback_outline(num_sections):
+                yield item
     
     @staticmethod
-    def generate_slide_titles_template(
+    async def generate_slide_titles_template(
         topic: str,
         num_slides: int,
         llm_client,
-        audience: str = "general"
+        audience: str = "general",
+        usage=None
     ):
-        """Generate AI-suggested slide titles"""
-        from app.integrations import PromptManager
-        import json
-        import asyncio
+        """Generate AI-suggested slide titles; usage collects the tokens of an LLM call made for this request"""
+        prompt, key = TemplateService._slide_titles_request(topic, num_slides, llm_client, audience)
         
-        prompt = PromptManager.build_slide_title_prompt(topic, num_slides, audience)
+        titles = await TemplateService._cache.get_or_load(
+            key, lambda: TemplateService._request_json_list(prompt, llm_client, num_slides, usage)
+        )
+        if titles is not None:
+            return titles
         
-        # Get response from LLM
-        loop = asyncio.get_event_loop()
-        response = loop.run_until_complete(llm_client.generate_content(prompt))
+        # Fallback: return basic slide titles
+        return TemplateService._fallback_slide_titles(topic, num_slides)
+    
+    @staticmethod
+    async def stream_slide_titles_template(
+        topic: str,
+        num_slides: int,
+        llm_client,
+        audience: str = "general",
+        usage=None
+    ):
+        """Yield slide titles one by one as the LLM produces them"""
+        prompt, key = TemplateService._slide_titles_request(topic, num_slides, llm_client, audience)
         
-        # Parse JSON response
-        try:
-            import re
-            json_match = re.search(r'\[.*\]', response, re.DOTALL)
-            if json_match:
-                titles = json.loads(json_match.group())
-                return titles[:num_slides]
-        except json.JSONDecodeError:
-            pass
+        produced = False
+        async for title in TemplateService._stream_json_list(prompt, key, llm_client, num_slides, usage):
+            produced = True
+            yield title
         
-        # Fallback: return basic slide titles
-        return [f"Slide {i+1}: {topic}" for i in range(num_slides)]
+        if not produced:
+            for title in TemplateService._fallback_slide_titles(topic, num_slides):
+                yield title
@@ -0,0 +1,98 @@
+"""Durable queues handing generation job ids from API nodes to worker processes"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+from uuid import UUID
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _default_session_factory():
+    from app.database import SessionLocal
+    return SessionLocal
+
+
+class DatabaseJobQueue:
+    """Uses the generation_jobs table itself as the queue; workers poll for queued rows"""
+
+    def __init__(self, session_factory: Optional[Callable] = None, poll_interval: float = 1.0):
+        self.session_factory = session_factory
+        self.poll_interval = poll_interval
+
+    def _session(self):
+        if self.session_factory is None:
+            self.session_factory = _default_session_factory()
+        return self.session_factory()
+
+    async def enqueue(self, job_id: UUID):
+        """Nothing to do: the queued row is the queue entry"""
+
+    def _next_queued(self) -> Optional[UUID]:
+        from app.models import GenerationJob
+        from sqlalchemy import or_
+
+        db = self._session()
+        try:
+            row = db.query(GenerationJob.id).filter(
+                GenerationJob.status == "queued",
+                or_(GenerationJob.available_at == None, GenerationJob.available_at <= datetime.utcnow())
+            ).order_by(GenerationJob.created_at).first()
+            return row.id if row else None
+        finally:
+            db.close()
+
+    async def dequeue(self, timeout: float) -> Optional[UUID]:
+        """Oldest queued job id that is not backing off, waiting up to timeout; callers still have to claim it"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            job_id = await loop.run_in_executor(None, self._next_queued)
+            if job_id is not None:
+                return job_id
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+            await asyncio.sleep(min(self.poll_interval, remaining))
+
+    async def aclose(self):
+        pass
+
+
+class RedisJobQueue:
+    """Redis list of job ids; rows in generation_jobs stay the source of truth"""
+
+    KEY = "generation:jobs"
+
+    def __init__(self, redis_url: str):
+        import redis.asyncio as aioredis
+
+        self._redis = aioredis.from_url(redis_url, decode_responses=True)
+
+    async def enqueue(self, job_id: UUID):
+        await self._redis.lpush(self.KEY, str(job_id))
+
+    async def dequeue(self, timeout: float) -> Optional[UUID]:
+        item = await self._redis.brpop(self.KEY, timeout=max(1, int(timeout)))
+        return UUID(item[1]) if item else None
+
+    async def aclose(self):
+        await self._redis.close()
+
+
+def get_job_queue(session_factory: Optional[Callable] = None):
+    """Queue for the configured JOB_QUEUE_BACKEND"""
+    if settings.JOB_QUEUE_BACKEND == "redis":
+        if not settings.REDIS_URL:
+            raise ValueError("JOB_QUEUE_BACKEND=redis requires REDIS_URL")
+        return RedisJobQueue(settings.REDIS_URL)
+    if settings.JOB_QUEUE_BACKEND != "database":
+        raise ValueError(f"Unsupported job queue backend: {settings.JOB_QUEUE_BACKEND}")
+    return DatabaseJobQueue(session_factory, settings.JOB_POLL_INTERVAL_SECONDS)
+
+
+def lease_cutoff() -> datetime:
+    """Running jobs whose heartbeat is older than this are presumed lost with their worker"""
+    return datetime.utcnow() - timedelta(seconds=settings.JOB_LEASE_SECONDS)
@@ -0,0 +1,159 @@
+"""Incremental parsing and repair of JSON arrays streamed by LLMs"""
+import json
+import logging
+import re
+from typing import Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+_UNQUOTED_KEY = re.compile(r'([{,]\s*)([A-Za-z_][\w\-]*)\s*:')
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+
+
+def _close_open_structures(text: str) -> str:
+    """Terminate an unfinished string and close unbalanced brackets (truncated output)"""
+    stack = []
+    in_string = False
+    escape = False
+    for ch in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+    if in_string:
+        text += '"'
+    return text + "".join(reversed(stack))
+
+
+def repair_json(text: str) -> str:
+    """Fix the JSON defects LLMs commonly produce.
+
+    Handles code fences, smart or single quotes, unquoted keys, trailing
+    commas and output cut off mid-value.
+    """
+    text = _FENCE.sub("", text.translate(_SMART_QUOTES)).strip()
+    if '"' not in text and "'" in text:
+        text = text.replace("'", '"')
+    text = _UNQUOTED_KEY.sub(r'\1"\2":', text)
+    text = _close_open_structures(text)
+    return _TRAILING_COMMA.sub(r"\1", text)
+
+
+def loads_lenient(text: str) -> Any:
+    """json.loads, retried once after repair_json; raises ValueError if both fail"""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return json.loads(repair_json(text))
+
+
+class JSONArrayStreamParser:
+    """Parses a top-level JSON array fed in arbitrary chunks, returning each element once it is complete.
+
+    Text before the opening bracket (prose, code fences) is skipped. A bracket
+    whose first element does not parse was prose too (e.g. "Note [draft]:"),
+    so the search moves on to the next one. Later elements that do not parse
+    are repaired, and dropped if they still fail.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.done = False
+        self.items: List[Any] = []
+        self._element: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> List[Any]:
+        """Consume a chunk and return the elements it completed"""
+        completed: List[Any] = []
+        for ch in text:
+            if self.done:
+                break
+            if not self.started:
+                self.started = ch == "["
+                continue
+
+            if self._in_string:
+                self._element.append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 0:
+                        self._end_element(completed)
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._element.append(ch)
+            elif ch in "{[":
+                self._depth += 1
+                self._element.append(ch)
+            elif ch in "}]":
+                if self._depth == 0:
+                    # Closing bracket of the top-level array
+                    self._end_element(completed)
+                    self.done = self.started
+                else:
+                    self._depth -= 1
+                    self._element.append(ch)
+                    if self._depth == 0:
+                        self._end_element(completed)
+            elif ch == "," and self._depth == 0:
+                self._end_element(completed)
+            else:
+                self._element.append(ch)
+        return completed
+
+    def finish(self) -> List[Any]:
+        """Flush a final element left open by a truncated stream"""
+        completed: List[Any] = []
+        if self.started and not self.done:
+            self._emit(completed)
+            self.done = True
+        return completed
+
+    def _end_element(self, completed: List[Any]):
+        self._emit(completed)
+        if not self.items:
+            # Nothing parsed from this bracket yet: it was prose, so look for the next one
+            self.started = False
+
+    def _emit(self, completed: List[Any]):
+        text = "".join(self._element).strip()
+        self._element.clear()
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        if not text:
+            return
+        try:
+            item = loads_lenient(text)
+        except ValueError:
+            logger.warning(f"Dropping unparsable JSON array element: {text[:200]!r}")
+            return
+        self.items.append(item)
+        completed.append(item)
+
+
+def parse_json_array(text: str) -> Optional[List[Any]]:
+    """Parse the first JSON array in an LLM response, repairing defects; None when nothing parses"""
+    parser = JSONArrayStreamParser()
+    parser.feed(text)
+    parser.finish()
+    return parser.items or None
@@ -0,0 +1,127 @@
+"""Bounded replay buffers letting streaming clients reconnect and several viewers share one generation"""
+import asyncio
+import json
+import time
+from collections import deque
+from typing import AsyncGenerator, Callable, Deque, Dict, Hashable, Optional, Tuple
+from uuid import uuid4
+
+
+class ReplayBuffer:
+    """Ring buffer of numbered events for one generation; viewers resume after any id still held"""
+
+    def __init__(self, generation_id: str, owner: Hashable, capacity: int = 512):
+        self.generation_id = generation_id
+        self.owner = owner
+        self.last_id = 0
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None  # producer filling the buffer
+        self._events: Deque[Tuple[int, dict]] = deque(maxlen=capacity)
+        self._updated = asyncio.Event()
+
+    @property
+    def first_id(self) -> int:
+        """Oldest event id still buffered (last_id + 1 when empty)"""
+        return self._events[0][0] if self._events else self.last_id + 1
+
+    def append(self, event: dict) -> int:
+        """Number and buffer an event, evicting the oldest once full, and wake every viewer"""
+        self.last_id += 1
+        self._events.append((self.last_id, event))
+        self._notify()
+        return self.last_id
+
+    def close(self):
+        self.done = True
+        self.finished_at = time.monotonic()
+        self._notify()
+
+    def _notify(self):
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    async def subscribe(
+        self,
+        after: int = 0,
+        keepalive: Optional[float] = None
+    ) -> AsyncGenerator[Tuple[int, Optional[dict]], None]:
+        """Yield (id, event) for every event after the given id, then live ones until the buffer closes.
+
+        If events after the given id were already evicted, a replay_gap event
+        (id 0) comes first. With keepalive set, (0, None) is yielded whenever
+        no event arrives for that many seconds.
+        """
+        if after + 1 < self.first_id:
+            yield 0, {"type": "replay_gap", "missed_from": after + 1, "resumed_at": self.first_id}
+        cursor = after
+        while True:
+            for event_id, event in list(self._events):
+                if event_id > cursor:
+                    cursor = event_id
+                    yield event_id, event
+            if self.done and cursor >= self.last_id:
+                return
+            updated = self._updated
+            if keepalive is None:
+                await updated.wait()
+                continue
+            try:
+                await asyncio.wait_for(updated.wait(), keepalive)
+            except asyncio.TimeoutError:
+                yield 0, None
+
+
+class ReplayRegistry:
+    """Live and recently finished replay buffers, by generation id and by the work they follow"""
+
+    def __init__(self, capacity: int = 512, retention_seconds: float = 300):
+        self.capacity = capacity
+        self.retention_seconds = retention_seconds
+        self._by_id: Dict[str, ReplayBuffer] = {}
+        self._by_key: Dict[Hashable, ReplayBuffer] = {}
+
+    def get(self, generation_id: str) -> Optional[ReplayBuffer]:
+        self._evict_expired()
+        return self._by_id.get(generation_id)
+
+    def join(self, key: Hashable, owner: Hashable, start: Callable[[ReplayBuffer], None]) -> Tuple[ReplayBuffer, bool]:
+        """Return the live buffer for key, or create one and call start(buffer) to begin filling it.
+
+        Returns the buffer and whether this caller created it.
+        """
+        self._evict_expired()
+        buffer = self._by_key.get(key)
+        if buffer is not None and not buffer.done and buffer.owner == owner:
+            return buffer, False
+
+        buffer = ReplayBuffer(str(uuid4()), owner, self.capacity)
+        self._by_id[buffer.generation_id] = buffer
+        self._by_key[key] = buffer
+        start(buffer)
+        return buffer, True
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for generation_id, buffer in list(self._by_id.items()):
+            if buffer.done and now - buffer.finished_at >= self.retention_seconds:
+                del self._by_id[generation_id]
+        for key, buffer in list(self._by_key.items()):
+            if buffer.done:
+                del self._by_key[key]
+
+    def stats(self) -> dict:
+        self._evict_expired()
+        return {
+            "live": sum(1 for b in self._by_id.values() if not b.done),
+            "retained": sum(1 for b in self._by_id.values() if b.done),
+        }
+
+
+def format_sse(event_id: int, event: Optional[dict]) -> str:
+    """Encode one event as a Server-Sent Events frame; None encodes a keep-alive comment"""
+    if event is None:
+        return ": keep-alive\n\n"
+    frame = f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    # Id-less frames (e.g. replay_gap) leave the client's Last-Event-ID unchanged
+    return f"id: {event_id}\n{frame}" if event_id else frame
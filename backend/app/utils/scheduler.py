@@ -0,0 +1,190 @@
+"""Priority-aware scheduling of LLM jobs across lanes and users"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Hashable, Optional
+
+from app.core.config import settings
+
+# Lanes, highest priority first
+LANE_INTERACTIVE_STREAM = "interactive_stream"
+LANE_INTERACTIVE = "interactive"
+LANE_BATCH = "batch"
+LANES = (LANE_INTERACTIVE_STREAM, LANE_INTERACTIVE, LANE_BATCH)
+
+
+class _Waiter:
+    def __init__(self, lane: "_Lane", user: Hashable, future: asyncio.Future):
+        self.lane = lane
+        self.user = user
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class _Lane:
+    """One priority lane: fair queuing across users, FIFO within a user"""
+
+    WAIT_SAMPLES = 500
+
+    def __init__(self, name: str, weight: int):
+        self.name = name
+        self.weight = max(1, weight)
+        self.pass_value = 0.0  # stride-scheduling position among lanes
+        self.running = 0
+        self.admitted = 0
+        self._queues: "OrderedDict[Hashable, Deque[_Waiter]]" = OrderedDict()
+        self._user_vtime: Dict[Hashable, float] = {}
+        self._vtime = 0.0
+        self._waits: Deque[float] = deque(maxlen=self.WAIT_SAMPLES)
+
+    @property
+    def queued(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def push(self, waiter: _Waiter):
+        queue = self._queues.get(waiter.user)
+        if queue is None:
+            queue = self._queues[waiter.user] = deque()
+            # Users with nothing queued start level with the lane rather than ahead of it
+            self._user_vtime[waiter.user] = self._vtime
+        queue.append(waiter)
+
+    def pop(self) -> Optional[_Waiter]:
+        """Next waiter from the user with the least service so far"""
+        while self._queues:
+            user = min(self._queues, key=self._user_vtime.__getitem__)
+            queue = self._queues[user]
+            waiter = queue.popleft()
+            self._vtime = self._user_vtime[user]
+            self._user_vtime[user] += 1.0
+            if not queue:
+                del self._queues[user]
+                del self._user_vtime[user]
+            if not waiter.future.done():
+                return waiter
+        return None
+
+    def remove(self, waiter: _Waiter):
+        queue = self._queues.get(waiter.user)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            return
+        if not queue:
+            del self._queues[waiter.user]
+            del self._user_vtime[waiter.user]
+
+    def record_wait(self, seconds: float):
+        self._waits.append(seconds)
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+
+        def pct(p):
+            return round(waits[min(len(waits) - 1, int(p / 100 * len(waits)))] * 1000) if waits else None
+
+        oldest = min((q[0].enqueued_at for q in self._queues.values() if q), default=None)
+        return {
+            "weight": self.weight,
+            "queued": self.queued,
+            "running": self.running,
+            "admitted": self.admitted,
+            "queued_users": len(self._queues),
+            "oldest_wait_ms": round((time.monotonic() - oldest) * 1000) if oldest is not None else 0,
+            "wait_ms_p50": pct(50),
+            "wait_ms_p95": pct(95),
+        }
+
+
+class JobScheduler:
+    """Admits at most max_concurrent jobs; waiting jobs are picked by weighted lane share, then per-user fairness"""
+
+    def __init__(self, max_concurrent: int, lane_weights: Dict[str, int]):
+        self.max_concurrent = max_concurrent
+        self.running = 0
+        self._lanes: Dict[str, _Lane] = {
+            name: _Lane(name, lane_weights.get(name, 1)) for name in LANES
+        }
+
+    @classmethod
+    def from_settings(cls) -> "JobScheduler":
+        return cls(settings.SCHEDULER_MAX_CONCURRENT_JOBS, settings.SCHEDULER_LANE_WEIGHTS)
+
+    def _lane(self, name: str) -> _Lane:
+        lane = self._lanes.get(name)
+        if lane is None:
+            raise ValueError(f"Unknown scheduler lane: {name}")
+        return lane
+
+    @asynccontextmanager
+    async def slot(self, lane_name: str, user: Hashable):
+        """Wait for admission in a lane, then hold one job slot for the block"""
+        lane = self._lane(lane_name)
+        await self._acquire(lane, user)
+        try:
+            yield
+        finally:
+            lane.running -= 1
+            self.running -= 1
+            self._dispatch()
+
+    async def _acquire(self, lane: _Lane, user: Hashable):
+        if self.running < self.max_concurrent and not any(l.queued for l in self._lanes.values()):
+            self._admit(lane, 0.0)
+            return
+
+        waiter = _Waiter(lane, user, asyncio.get_running_loop().create_future())
+        if not lane.queued:
+            # A lane waking from idle joins at the current position, not with banked share
+            lane.pass_value = max(lane.pass_value, self._min_pass())
+        lane.push(waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Admitted just as we were cancelled; hand the slot on
+                lane.running -= 1
+                self.running -= 1
+                self._dispatch()
+            else:
+                lane.remove(waiter)
+            raise
+
+    def _admit(self, lane: _Lane, waited: float):
+        lane.running += 1
+        lane.admitted += 1
+        self.running += 1
+        lane.record_wait(waited)
+
+    def _min_pass(self) -> float:
+        active = [l.pass_value for l in self._lanes.values() if l.queued]
+        return min(active) if active else max(l.pass_value for l in self._lanes.values())
+
+    def _dispatch(self):
+        while self.running < self.max_concurrent:
+            candidates = [l for l in self._lanes.values() if l.queued]
+            if not candidates:
+                return
+            # Stride scheduling: each lane advances by 1/weight per admission
+            lane = min(candidates, key=lambda l: (l.pass_value, LANES.index(l.name)))
+            waiter = lane.pop()
+            if waiter is None:
+                continue
+            lane.pass_value += 1.0 / lane.weight
+            self._admit(lane, time.monotonic() - waiter.enqueued_at)
+            waiter.future.set_result(None)
+
+    def stats(self) -> dict:
+        """Queue depth, running jobs and admission wait times per lane"""
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": self.running,
+            "lanes": {name: lane.stats() for name, lane in self._lanes.items()},
+        }
+
+
+job_scheduler = JobScheduler.from_settings()
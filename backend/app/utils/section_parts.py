@@ -0,0 +1,64 @@
+"""Long sections written as parts: planning what each part covers and stitching the parts back together"""
+import re
+from typing import List, Sequence
+
+# What each part covers when the section has too few focus points to divide
+_OPENING = "Introduce the topic and set out why it matters"
+_BODY = "Develop the main points in depth, with concrete examples"
+_CLOSING = "Draw out the implications and conclude the section"
+
+_HEADING = re.compile(r"^\s*#+\s*(.+?)\s*#*\s*$")
+
+
+def plan(focus_points: Sequence[str], parts: int) -> List[List[str]]:
+    """What each of (at least two) parts covers: the focus points in contiguous groups, or opening/body/close"""
+    focus_points = [fp.strip() for fp in focus_points if fp and fp.strip()]
+    if len(focus_points) >= 2:
+        parts = min(parts, len(focus_points))
+        size, extra = divmod(len(focus_points), parts)
+        groups, start = [], 0
+        for i in range(parts):
+            end = start + size + (1 if i < extra else 0)
+            groups.append(focus_points[start:end])
+            start = end
+        return groups
+    # The focus points, if any, are in every part's prompt already
+    bodies = parts - 2
+    middle = [[_BODY]] if bodies == 1 else [[f"{_BODY} (body part {i} of {bodies})"] for i in range(1, bodies + 1)]
+    return [[_OPENING], *middle, [_CLOSING]]
+
+
+def _key(paragraph: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", paragraph.lower()).split())
+
+
+def _heading(paragraph: str) -> str:
+    match = _HEADING.match(paragraph.splitlines()[0]) if paragraph.strip() else None
+    return _key(match.group(1)) if match else ""
+
+
+def clean_part(part: str, written: str, title: str = "") -> str:
+    """A later part with what the text so far already has removed.
+
+    Parts are written without seeing each other, so they tend to restate the
+    section title and repeat paragraphs at their edges; those are dropped.
+    """
+    seen = {_key(p) for p in re.split(r"\n\s*\n", written) if p.strip()}
+    headings = {_heading(p) for p in re.split(r"\n\s*\n", written)} | {_key(title)}
+    kept = []
+    for paragraph in re.split(r"\n\s*\n", part.strip()):
+        paragraph = paragraph.strip()
+        if not paragraph or _key(paragraph) in seen:
+            continue
+        if not kept and _heading(paragraph) in headings - {""} and len(paragraph.splitlines()) == 1:
+            continue
+        kept.append(paragraph)
+        seen.add(_key(paragraph))
+    return "\n\n".join(kept)
+
+
+def separator(written: str) -> str:
+    """Whitespace that starts a new paragraph after the text so far"""
+    if not written or written.endswith("\n\n"):
+        return ""
+    return "\n" if written.endswith("\n") else "\n\n"
@@ -0,0 +1,93 @@
+"""Single-flight coalescing of identical concurrent work"""
+import asyncio
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class Flight:
+    """One in-flight unit of work shared by every caller with the same key"""
+
+    def __init__(self, key: Hashable):
+        self.key = key
+        self.chunks: List[str] = []
+        self.waiters = 1
+        self.done = False
+        self._result: Any = None
+        self._error: Optional[BaseException] = None
+        self._updated = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def publish(self, chunk: str):
+        """Append a chunk and wake every subscriber"""
+        self.chunks.append(chunk)
+        self._notify()
+
+    def _finish(self, result: Any = None, error: Optional[BaseException] = None):
+        self._result = result
+        self._error = error
+        self.done = True
+        self._notify()
+
+    def _notify(self):
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    async def subscribe(self) -> AsyncGenerator[str, None]:
+        """Yield every chunk from the start, then live chunks until the work finishes"""
+        index = 0
+        while True:
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.done:
+                if self._error is not None:
+                    raise self._error
+                return
+            await self._updated.wait()
+
+    def add_done_callback(self, callback: Callable[[], Any]):
+        """Call callback once the shared work has finished, even if every waiter has gone"""
+        self._task.add_done_callback(lambda _: callback())
+
+    async def result(self) -> Any:
+        """Wait for the shared work; cancelling one waiter does not cancel the work"""
+        await asyncio.shield(self._task)
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution"""
+
+    def __init__(self):
+        self._flights: Dict[Hashable, Flight] = {}
+
+    def join(self, key: Hashable, work: Callable[[Flight], Awaitable[Any]]) -> Tuple[Flight, bool]:
+        """Join the flight for key, starting work(flight) if none is running.
+
+        Returns the flight and whether this caller started it.
+        """
+        flight = self._flights.get(key)
+        if flight is not None:
+            flight.waiters += 1
+            return flight, False
+
+        flight = Flight(key)
+        self._flights[key] = flight
+        flight._task = asyncio.ensure_future(self._execute(flight, work))
+        return flight, True
+
+    async def _execute(self, flight: Flight, work: Callable[[Flight], Awaitable[Any]]):
+        try:
+            flight._finish(result=await work(flight))
+        except asyncio.CancelledError as e:
+            flight._finish(error=e)
+            raise
+        except Exception as e:
+            flight._finish(error=e)
+        finally:
+            self._flights.pop(flight.key, None)
+
+    def in_flight(self) -> int:
+        """Number of distinct keys currently executing"""
+        return len(self._flights)
@@ -0,0 +1,60 @@
+"""Chunk coalescing for streamed responses"""
+import asyncio
+from typing import AsyncGenerator, AsyncIterable, List
+
+
+async def coalesce_chunks(
+    chunks: AsyncIterable[str],
+    max_bytes: int = 512,
+    max_delay: float = 0.05
+) -> AsyncGenerator[str, None]:
+    """Merge small chunks, flushing once max_bytes are buffered or the oldest has waited max_delay seconds.
+
+    At most one upstream chunk is read ahead of the consumer, so a slow reader
+    pauses the pipeline instead of buffering the whole stream.
+    """
+    loop = asyncio.get_running_loop()
+    iterator = chunks.__aiter__()
+    buffer: List[str] = []
+    size = 0
+    deadline = None
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+
+            if done:
+                try:
+                    chunk = pending.result()
+                except StopAsyncIteration:
+                    pending = None
+                    break
+                pending = None
+                buffer.append(chunk)
+                size += len(chunk)
+                if deadline is None:
+                    deadline = loop.time() + max_delay
+
+            if buffer and (size >= max_bytes or loop.time() >= deadline):
+                # One join per flush keeps accumulation linear in the output size
+                text = "".join(buffer)
+                buffer.clear()
+                size = 0
+                deadline = None
+                yield text
+
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if pending is not None:
+            pending.cancel()
+            try:
+                await pending
+            except (asyncio.CancelledError, StopAsyncIteration, Exception):
+                pass
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
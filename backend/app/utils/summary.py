@@ -0,0 +1,62 @@
+"""Rolling per-document summaries: one short extractive digest per section, kept within a token budget"""
+import re
+from typing import Dict, List, Optional
+
+from app.integrations.tokenizer import count_tokens
+
+# Sentence ends, or paragraph breaks (slides and bullets often have no full stops)
+_SENTENCES = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+# Markdown decoration that carries no meaning in a summary
+_MARKUP = re.compile(r"^\s*(?:#+|[-*+•]|\d+[.)])\s+", re.MULTILINE)
+
+
+def digest(content: str, max_tokens: int, model: str = "gpt-4") -> str:
+    """Leading sentences of a section, up to max_tokens; the first sentence is cut to fit if needed"""
+    text = _MARKUP.sub("", content or "")
+    picked: List[str] = []
+    used = 0
+    for sentence in _SENTENCES.split(text):
+        sentence = " ".join(sentence.split())
+        if not sentence:
+            continue
+        tokens = count_tokens(sentence, model)
+        if used + tokens > max_tokens:
+            if not picked:
+                picked.append(_truncate(sentence, max_tokens, model))
+            break
+        picked.append(sentence)
+        used += tokens
+    return " ".join(picked)
+
+
+def _truncate(text: str, max_tokens: int, model: str) -> str:
+    words = text.split()
+    while len(words) > 1 and count_tokens(" ".join(words) + "…", model) > max_tokens:
+        words = words[:len(words) * 3 // 4]
+    return " ".join(words) + "…"
+
+
+def _line(entry: dict) -> str:
+    return f"- {entry['title']}: {entry['digest']}"
+
+
+def fit_to_budget(entries: Dict[str, dict], budget_tokens: int, model: str = "gpt-4") -> Dict[str, dict]:
+    """Shrink every digest to an equal share of the budget once the summary outgrows it"""
+    total = sum(count_tokens(_line(e), model) for e in entries.values())
+    if total <= budget_tokens or not entries:
+        return entries
+    share = max(8, budget_tokens // len(entries))
+    for entry in entries.values():
+        overhead = count_tokens(_line({**entry, "digest": ""}), model)
+        entry["digest"] = digest(entry["digest"], max(1, share - overhead), model)
+    return entries
+
+
+def render(entries: Dict[str, dict], exclude: Optional[str] = None) -> str:
+    """The summary as prompt context, in document order, leaving out the section being written"""
+    lines = [
+        _line(entry)
+        for section_id, entry in sorted(entries.items(), key=lambda item: item[1]["order"])
+        if section_id != exclude and entry["digest"]
+    ]
+    return "\n".join(lines)
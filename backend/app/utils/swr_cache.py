@@ -0,0 +1,89 @@
+"""In-process cache with stale-while-revalidate refresh"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional, Tuple
+
+from app.utils.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class StaleWhileRevalidateCache:
+    """LRU cache whose entries are fresh for ttl_seconds, then served stale for stale_seconds while refreshed in the background"""
+
+    def __init__(self, max_entries: int = 500, ttl_seconds: float = 3600, stale_seconds: float = 86400):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._loads = SingleFlight()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def peek(self, key: Hashable, loader: Optional[Callable[[], Awaitable[Any]]] = None) -> Any:
+        """Return the cached value for key without loading on a miss.
+
+        A stale value is still returned, and refreshed in the background when a loader is given.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        age = time.monotonic() - stored_at
+        if age < self.ttl_seconds:
+            self.hits += 1
+        elif age < self.ttl_seconds + self.stale_seconds:
+            self.stale_hits += 1
+            if loader is not None:
+                self._loads.join(("refresh", key), lambda flight: self._refresh(key, loader))
+        else:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        """Store a value loaded outside get_or_load"""
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for key, loading it on a miss.
+
+        Concurrent misses share one load; a None result is returned but not cached.
+        """
+        value = self.peek(key, loader)
+        if value is not None:
+            return value
+
+        self.misses += 1
+        flight, _ = self._loads.join(key, lambda flight: self._load(key, loader))
+        return await flight.result()
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        value = await loader()
+        if value is not None:
+            self.set(key, value)
+        return value
+
+    async def _refresh(self, key: Hashable, loader: Callable[[], Awaitable[Any]]):
+        try:
+            await self._load(key, loader)
+        except Exception as e:
+            # The stale value keeps being served until a refresh succeeds or it expires
+            logger.warning(f"Background refresh failed for {key!r}: {e}")
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+        }
@@ -0,0 +1,115 @@
+"""Background generation worker process"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+
+from app.core.config import settings
+from app.database import SessionLocal, init_db
+from app.integrations import llm_registry
+from app.integrations.ledger import latency_ledger
+from app.services import GenerationJobService, GenerationService
+from app.utils.job_queue import get_job_queue
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def run_worker(concurrency: int):
+    """Pull generation jobs from the queue and run up to concurrency of them at once"""
+    queue = get_job_queue()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    slots = asyncio.Semaphore(concurrency)
+    stopping = asyncio.Event()
+    running = set()
+    backing_off = {}
+    
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except NotImplementedError:
+            pass
+    
+    async def run(job_id):
+        try:
+            status = await GenerationJobService.run_job(job_id, worker_id)
+            if status == "queued":
+                # Failed attempt with retries left; offer it again once its backoff ends
+                task = asyncio.ensure_future(requeue_later(job_id))
+                backing_off[task] = job_id
+                task.add_done_callback(lambda t: backing_off.pop(t, None))
+        except Exception as e:
+            logger.error(f"Job {job_id} crashed: {e}")
+        finally:
+            slots.release()
+    
+    async def requeue_later(job_id):
+        db = SessionLocal()
+        try:
+            delay = await asyncio.to_thread(GenerationJobService.retry_delay, db, job_id)
+        finally:
+            db.close()
+        await asyncio.sleep(max(delay, settings.JOB_POLL_INTERVAL_SECONDS))
+        await queue.enqueue(job_id)
+    
+    async def recover_stale():
+        while not stopping.is_set():
+            db = SessionLocal()
+            try:
+                for job_id in await asyncio.to_thread(GenerationJobService.requeue_stale, db):
+                    logger.warning(f"Requeued job {job_id} after it went unclaimed or its worker stopped heartbeating")
+                    await queue.enqueue(job_id)
+                # Generations whose process died mid-stream become resumable
+                interrupted = await asyncio.to_thread(GenerationService.recover_interrupted, db)
+                if interrupted:
+                    logger.info(f"Marked {interrupted} interrupted generations as resumable")
+            except Exception as e:
+                logger.error(f"Stale job recovery failed: {e}")
+            finally:
+                db.close()
+            try:
+                await asyncio.wait_for(stopping.wait(), timeout=settings.JOB_LEASE_SECONDS / 2)
+            except asyncio.TimeoutError:
+                pass
+    
+    logger.info(f"Worker {worker_id} started ({settings.JOB_QUEUE_BACKEND} queue, concurrency {concurrency})")
+    recovery = asyncio.ensure_future(recover_stale())
+    try:
+        while not stopping.is_set():
+            await slots.acquire()
+            job_id = await queue.dequeue(timeout=settings.JOB_POLL_INTERVAL_SECONDS * 5)
+            if job_id is None:
+                slots.release()
+                continue
+            task = asyncio.ensure_future(run(job_id))
+            running.add(task)
+            task.add_done_callback(running.discard)
+    finally:
+        recovery.cancel()
+        # Hand jobs still backing off back to the queue so another worker picks them up
+        for task, job_id in list(backing_off.items()):
+            task.cancel()
+            await queue.enqueue(job_id)
+        # Let jobs in progress finish so their results are persisted
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+        await queue.aclose()
+        await llm_registry.aclose()
+        await latency_ledger.aclose()
+        logger.info(f"Worker {worker_id} stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a background generation worker")
+    parser.add_argument("--concurrency", type=int, default=settings.JOB_WORKER_CONCURRENCY)
+    args = parser.parse_args()
+    
+    init_db()
+    asyncio.run(run_worker(args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Shared test fixtures
+"""
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("LLM_LEDGER_ENABLED", "false")
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.main import app
+from app.database import get_db
+from app.models import Base
+
+
+@compiles(UUID, "sqlite")
+def compile_uuid_for_sqlite(type_, compiler, **kw):
+    """Store PostgreSQL UUID columns as CHAR(32) in the SQLite test database"""
+    return "CHAR(32)"
+
+
+@pytest.fixture
+def db_session(tmp_path):
+    """Isolated SQLite database wired into the app's get_db dependency"""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'test.db'}",
+        poolclass=NullPool,
+        connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(bind=engine)
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = TestingSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    session = TestingSessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        app.dependency_overrides.pop(get_db, None)
+        engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def reset_circuit_breakers():
+    """Provider failures injected by one test must not leave a circuit open for the next"""
+    from app.integrations import circuit_breaker
+
+    circuit_breaker._breakers.clear()
+    yield
+    circuit_breaker._breakers.clear()
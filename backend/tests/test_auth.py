@@ -128,6 +128,17 @@ class TestTokenRefresh:
         data = response.json()
         assert "access_token" in data["data"]
     
+    def test_refresh_picks_up_tier_change(self, valid_refresh_token: str, refresh_user: User, db_session: Session):
+        """A new access token carries the user's current tier, not the one in the refresh token"""
+        refresh_user.tier = "pro"
+        db_session.commit()
+        
+        response = client.post("/api/auth/refresh", json={"refresh_token": valid_refresh_token})
+        
+        assert response.status_code == 200
+        payload = SecurityUtils.verify_token(response.json()["data"]["access_token"])
+        assert payload["tier"] == "pro"
+    
     def test_refresh_invalid_token(self):
         """Test refresh with invalid token"""
         response = client.post(
@@ -198,6 +209,15 @@ class TestAuthenticationFlow:
 
 # Fixtures
 @pytest.fixture
-def valid_refresh_token():
+def refresh_user(db_session: Session):
+    """A stored user to refresh tokens for"""
+    user = User(email="refresh@example.com", password_hash="not-used", tier="free")
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+@pytest.fixture
+def valid_refresh_token(refresh_user: User):
     """Generate a valid refresh token for testing"""
-    return SecurityUtils.create_refresh_token({"sub": "test-user-id"})
+    return SecurityUtils.create_refresh_token({"sub": str(refresh_user.id), "tier": "free"})
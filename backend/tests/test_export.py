@@ -120,6 +120,163 @@ class TestExportAPI:
         assert response.status_code in [200, 404]
 
 
+class TestTemplateGeneration:
+    """Test outline and slide-title templates"""
+    
+    @pytest.fixture
+    def mock_client(self):
+        from app.integrations import MockLLMClient, llm_registry
+        from app.utils.export import TemplateService
+        
+        TemplateService._cache.clear()
+        llm_client = MockLLMClient(ttft_ms=0, tokens_per_second=0)
+        with llm_registry.override(llm_client):
+            yield llm_client
+        TemplateService._cache.clear()
+    
+    def test_outline_endpoint(self, mock_client):
+        """The outline route awaits the service inside the running loop"""
+        from app.core.security import SecurityUtils
+        token = SecurityUtils.create_access_token({"sub": "test-user"})
+        
+        response = client.post(
+            "/api/export/templates/outline",
+            params={"topic": "AI in healthcare", "document_type": "report", "num_sections": 4},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        
+        assert response.status_code == 200
+        assert len(response.json()["data"]["outline"]) == 4
+    
+    @pytest.mark.asyncio
+    async def test_normalized_requests_share_cache(self, mock_client):
+        """Requests differing only in case and spacing are served from cache"""
+        from unittest.mock import patch
+        from app.utils.export import TemplateService
+        
+        with patch.object(mock_client, "generate_content", wraps=mock_client.generate_content) as calls:
+            first = await TemplateService.generate_outline_template("AI in Healthcare", "report", 4, mock_client)
+            second = await TemplateService.generate_outline_template("  ai in  healthcare ", "Report", 4, mock_client)
+            await TemplateService.generate_outline_template("AI in Healthcare", "report", 6, mock_client)
+        
+        assert first == second
+        assert calls.call_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_stale_entries_are_served_and_refreshed(self):
+        """Stale values return immediately while one refresh runs in the background"""
+        import asyncio
+        from app.utils.swr_cache import StaleWhileRevalidateCache
+        
+        cache = StaleWhileRevalidateCache(ttl_seconds=0, stale_seconds=60)
+        loads = []
+        
+        async def loader():
+            loads.append(len(loads))
+            await asyncio.sleep(0.01)
+            return len(loads)
+        
+        assert await cache.get_or_load("key", loader) == 1
+        assert await cache.get_or_load("key", loader) == 1
+        assert await cache.get_or_load("key", loader) == 1
+        await asyncio.sleep(0.05)
+        
+        assert len(loads) == 2
+        assert cache.stats()["stale_hits"] == 2
+
+    
+    def test_outline_stream_endpoint(self, mock_client):
+        """The streaming variant emits each outline item as its own event"""
+        import json
+        from app.core.security import SecurityUtils
+        token = SecurityUtils.create_access_token({"sub": "test-user"})
+        
+        response = client.post(
+            "/api/export/templates/outline/stream",
+            params={"topic": "AI in healthcare", "document_type": "report", "num_sections": 4},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        
+        events = [json.loads(line) for line in response.text.splitlines()]
+        assert [e["type"] for e in events] == ["outline_item"] * 4 + ["outline_complete"]
+        assert [e["index"] for e in events[:4]] == [0, 1, 2, 3]
+        assert "title" in events[0]["item"]
+    
+    @pytest.mark.asyncio
+    async def test_first_item_arrives_before_stream_ends(self):
+        """Items are emitted while the rest of the response is still streaming"""
+        import asyncio
+        from app.integrations import MockLLMClient
+        from app.utils.export import TemplateService
+        
+        TemplateService._cache.clear()
+        llm_client = MockLLMClient(ttft_ms=0, tokens_per_second=200)
+        start = asyncio.get_running_loop().time()
+        arrivals = []
+        async for _ in TemplateService.stream_outline_template("Cloud costs", "report", 5, llm_client):
+            arrivals.append(asyncio.get_running_loop().time() - start)
+        TemplateService._cache.clear()
+        
+        assert len(arrivals) == 5
+        assert arrivals[0] < arrivals[-1] / 2
+
+
+class TestJSONStreamParser:
+    """Test incremental parsing and repair of LLM JSON arrays"""
+    
+    def test_items_complete_across_chunk_boundaries(self):
+        """Each element is returned by the chunk that completes it"""
+        from app.utils.json_stream import JSONArrayStreamParser
+        
+        parser = JSONArrayStreamParser()
+        text = 'Here is the outline:\n[{"title": "Intro, and [scope]", "description": "a \\"quoted\\" bit"}, {"title": "Next"}]'
+        emitted = []
+        for i in range(0, len(text), 7):
+            emitted.append(parser.feed(text[i:i + 7]))
+        
+        items = [item for chunk in emitted for item in chunk]
+        assert items == [{"title": "Intro, and [scope]", "description": 'a "quoted" bit'}, {"title": "Next"}]
+        assert parser.done
+        # The first item was complete long before the end of the text
+        assert next(i for i, chunk in enumerate(emitted) if chunk) < len(emitted) - 2
+    
+    def test_repairs_common_defects(self):
+        """Fences, single quotes, unquoted keys, trailing commas and truncation are repaired"""
+        from app.utils.json_stream import parse_json_array
+        
+        assert parse_json_array("```json\n['One', 'Two',]\n```") == ["One", "Two"]
+        assert parse_json_array('[{title: "A", description: "B",}]') == [{"title": "A", "description": "B"}]
+        assert parse_json_array('[{"title": "A"}, {"title": "Truncat') == [{"title": "A"}, {"title": "Truncat"}]
+        assert parse_json_array("No JSON here") is None
+    
+    def test_brackets_in_leading_prose_are_skipped(self):
+        """A bracket in prose before the array doesn't hide the array itself"""
+        from app.utils.json_stream import JSONArrayStreamParser, parse_json_array
+        
+        assert parse_json_array('Note [draft]: ["One", "Two"]') == ["One", "Two"]
+        assert parse_json_array('See [the brief, section 2] and [] first:\n[{"title": "A"}]') == [{"title": "A"}]
+        
+        parser = JSONArrayStreamParser()
+        text = 'Outline [v2, revised]:\n["Intro", "Costs"]'
+        items = [item for i in range(0, len(text), 3) for item in parser.feed(text[i:i + 3])]
+        assert items == ["Intro", "Costs"]
+        assert parser.done
+    
+    @pytest.mark.asyncio
+    async def test_malformed_response_does_not_fall_back(self):
+        """A repairable response is used instead of placeholder titles"""
+        from unittest.mock import AsyncMock
+        from app.utils.export import TemplateService
+        
+        TemplateService._cache.clear()
+        llm_client = AsyncMock()
+        llm_client.generate_content = AsyncMock(return_value="['Why', 'How', 'What next',]")
+        titles = await TemplateService.generate_slide_titles_template("Robots", 3, llm_client)
+        TemplateService._cache.clear()
+        
+        assert titles == ["Why", "How", "What next"]
+
+
 # Performance tests
 class TestExportPerformance:
     """Test export performance"""
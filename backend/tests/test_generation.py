@@ -5,7 +5,12 @@ import pytest
 from fastapi.testclient import TestClient
 from app.main import app
 from unittest.mock import patch, AsyncMock
+from types import SimpleNamespace
+import asyncio
+import httpx
 import json
+import time
+from uuid import UUID, uuid4
 
 client = TestClient(app)
 
@@ -56,6 +61,1214 @@ class TestContentGeneration:
         )
         
         assert response.status_code == 403
+    
+    def test_regeneration_writes_a_fresh_draft(self, seeded_section: dict):
+        """Regenerating a section calls the provider again; a cached reuse is opt-in and records no spend"""
+        from app.integrations import llm_registry
+        from app.integrations.cache import LLMResponseCache
+        
+        llm_client = TestSpanRefinement._client("A draft.")
+        request = {"document_id": seeded_section["document_id"], "section_id": seeded_section["section_id"]}
+        with llm_registry.override(llm_client), patch("app.integrations.response_cache", LLMResponseCache()):
+            drafts = [
+                client.post("/api/generation/generate", json=request, headers=seeded_section["headers"]).json()["data"]
+                for _ in range(2)
+            ]
+            assert len(llm_client.prompts) == 2
+            reused = [
+                client.post("/api/generation/generate", json={**request, "use_cache": True},
+                            headers=seeded_section["headers"]).json()["data"]
+                for _ in range(2)
+            ]
+        
+        assert len(llm_client.prompts) == 3
+        assert [d["cache_hit"] for d in drafts + reused] == [False, False, False, True]
+        assert reused[0]["tokens_used"] > 0
+        assert reused[1]["tokens_used"] == 0
+
+
+class TestConcurrentGeneration:
+    """Test that generation requests do not block each other"""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_generations_overlap(self, seeded_section: dict):
+        """Concurrent /generate calls should take about as long as one call"""
+        from app.core.config import settings
+        from app.integrations import OpenAIClient, llm_registry
+        
+        delay = 0.3
+        
+        async def slow_completion(**kwargs):
+            await asyncio.sleep(delay)
+            message = SimpleNamespace(content="Generated content text")
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+        
+        with patch.object(settings, "OPENAI_API_KEY", "test-key"):
+            llm_client = OpenAIClient()
+        llm_client.client.chat.completions.create = slow_completion
+        
+        with llm_registry.override(llm_client):
+            async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+                start = time.perf_counter()
+                responses = await asyncio.gather(*[
+                    async_client.post(
+                        "/api/generation/generate",
+                        json={
+                            "document_id": seeded_section["document_id"],
+                            "section_id": section_id,
+                            "stream": False,
+                            "use_cache": False
+                        },
+                        headers=seeded_section["headers"]
+                    )
+                    for section_id in seeded_section["section_ids"]
+                ])
+                elapsed = time.perf_counter() - start
+        
+        assert all(r.status_code == 200 for r in responses)
+        # Serialized calls would take len(section_ids) * delay
+        assert elapsed < delay * 2
+    
+    @pytest.mark.asyncio
+    async def test_identical_requests_are_coalesced(self, seeded_section: dict, db_session):
+        """Concurrent requests for the same section share one LLM call and one row"""
+        from app.integrations import LLMClient, llm_registry
+        from app.models import GeneratedContent
+        
+        class SlowCountingClient(LLMClient):
+            provider = "test"
+            calls = 0
+            
+            async def _complete(self, prompt, max_tokens, temperature, usage):
+                SlowCountingClient.calls += 1
+                await asyncio.sleep(0.2)
+                return "Shared content"
+            
+            async def _stream(self, prompt, max_tokens, temperature, usage):
+                SlowCountingClient.calls += 1
+                for word in ["Shared ", "content"]:
+                    await asyncio.sleep(0.1)
+                    yield word
+        
+        generation_data = {
+            "document_id": seeded_section["document_id"],
+            "section_id": seeded_section["section_id"],
+            "use_cache": False
+        }
+        
+        with llm_registry.override(SlowCountingClient("test-model")):
+            async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+                responses = await asyncio.gather(
+                    async_client.post("/api/generation/generate", json={**generation_data, "stream": True},
+                                      headers=seeded_section["headers"]),
+                    async_client.post("/api/generation/generate", json={**generation_data, "stream": False},
+                                      headers=seeded_section["headers"]),
+                    async_client.post("/api/generation/generate", json={**generation_data, "stream": False},
+                                      headers=seeded_section["headers"]),
+                )
+        
+        assert SlowCountingClient.calls == 1
+        assert db_session.query(GeneratedContent).count() == 1
+        
+        events = [json.loads(line) for line in responses[0].text.splitlines()]
+        streamed = "".join(e["content"] for e in events if e["type"] == "content_chunk")
+        stream_content_id = events[-1]["content_id"]
+        assert streamed == "Shared content"
+        
+        for response in responses[1:]:
+            data = response.json()["data"]
+            assert data["content"] == "Shared content"
+            assert data["content_id"] == stream_content_id
+    
+    @pytest.mark.asyncio
+    async def test_requests_for_different_calls_are_not_coalesced(self, seeded_section: dict):
+        """Requests that differ in cache choice or routed model each make their own call"""
+        from app.integrations import LLMClient, llm_registry
+        from app.services import GenerationService
+        
+        class SlowClient(LLMClient):
+            provider = "test"
+            models = []
+            
+            async def _complete(self, prompt, max_tokens, temperature, usage):
+                SlowClient.models.append(self.model)
+                await asyncio.sleep(0.1)
+                return f"Written by {self.model}"
+        
+        generation_data = {"document_id": seeded_section["document_id"], "section_id": seeded_section["section_id"]}
+        
+        async def generate_pair(first: dict, second: dict) -> list:
+            async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+                responses = await asyncio.gather(*[
+                    async_client.post("/api/generation/generate", json={**generation_data, **extra},
+                                      headers=seeded_section["headers"])
+                    for extra in (first, second)
+                ])
+            return [response.json()["data"]["content"] for response in responses]
+        
+        with llm_registry.override(SlowClient("test-model")):
+            await generate_pair({"use_cache": False}, {"use_cache": True})
+        assert SlowClient.models == ["test-model", "test-model"]
+        
+        SlowClient.models = []
+        with patch.object(GenerationService, "_route", side_effect=[[SlowClient("fast")], [SlowClient("strong")]]):
+            contents = await generate_pair({}, {})
+        assert sorted(SlowClient.models) == ["fast", "strong"]
+        assert sorted(contents) == ["Written by fast", "Written by strong"]
+
+
+class TestDocumentGeneration:
+    """Test whole-document parallel generation"""
+    
+    @staticmethod
+    def slow_client(delay: float):
+        from app.integrations import LLMClient
+        
+        class SlowClient(LLMClient):
+            provider = "test"
+            
+            async def _stream(self, prompt, max_tokens, temperature, usage):
+                await asyncio.sleep(delay)
+                yield "Section text"
+        
+        return SlowClient("test-model")
+    
+    async def _generate_document(self, seeded_section: dict) -> list:
+        async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+            response = await async_client.post(
+                "/api/generation/generate-document",
+                json={"document_id": seeded_section["document_id"], "use_cache": False},
+                headers=seeded_section["headers"]
+            )
+        assert response.status_code == 200
+        return [json.loads(line) for line in response.text.splitlines()]
+    
+    @pytest.mark.asyncio
+    async def test_sections_generate_concurrently(self, seeded_section: dict):
+        """Every section completes in about the time of the slowest one"""
+        from app.integrations import llm_registry
+        
+        delay = 0.3
+        with llm_registry.override(self.slow_client(delay)):
+            start = time.perf_counter()
+            events = await self._generate_document(seeded_section)
+            elapsed = time.perf_counter() - start
+        
+        completed = {e["section_id"] for e in events if e["type"] == "section_complete"}
+        assert completed == set(seeded_section["section_ids"])
+        assert all("section_id" in e for e in events if e["type"] == "content_chunk")
+        assert events[-1]["type"] == "document_complete"
+        assert events[-1]["completed"] == len(seeded_section["section_ids"])
+        assert elapsed < delay * 2
+    
+    @pytest.mark.asyncio
+    async def test_sections_generate_in_their_own_sessions(self, seeded_section: dict):
+        """Concurrent sections never share a session, and each is closed once its generation ends"""
+        from app.integrations import llm_registry
+        from app.services import GenerationService
+        
+        sessions = []
+        start_generation = GenerationService._start_generation
+        
+        def recording(db, *args, **kwargs):
+            sessions.append(db)
+            return start_generation(db, *args, **kwargs)
+        
+        with llm_registry.override(self.slow_client(0.05)), \
+                patch.object(GenerationService, "_start_generation", recording):
+            events = await self._generate_document(seeded_section)
+        
+        assert events[-1]["completed"] == len(seeded_section["section_ids"])
+        assert len({id(db) for db in sessions}) == len(seeded_section["section_ids"])
+        await asyncio.sleep(0)
+        # Closing a session empties its identity map
+        assert not any(db.identity_map for db in sessions)
+    
+    @pytest.mark.asyncio
+    async def test_per_user_concurrency_cap(self, seeded_section: dict):
+        """Sections beyond the per-user cap wait for a free slot"""
+        from app.integrations import llm_registry
+        from app.services import GenerationService
+        from app.utils.concurrency import ConcurrencyLimiter
+        
+        delay = 0.2
+        with llm_registry.override(self.slow_client(delay)), \
+                patch.object(GenerationService, "_slots", ConcurrencyLimiter(16, 2)):
+            start = time.perf_counter()
+            events = await self._generate_document(seeded_section)
+            elapsed = time.perf_counter() - start
+        
+        assert events[-1]["completed"] == len(seeded_section["section_ids"])
+        # Four sections through two slots need at least two rounds
+        assert elapsed >= delay * 2
+    
+    @pytest.mark.asyncio
+    async def test_outline_pipeline_overlaps_stages(self, seeded_section: dict, db_session):
+        """Sections are created and drafted while the outline is still streaming"""
+        from app.integrations import MockLLMClient, llm_registry
+        from app.models import Section
+        from app.utils.export import TemplateService
+        
+        TemplateService._cache.clear()
+        with llm_registry.override(MockLLMClient(ttft_ms=0, tokens_per_second=1000)):
+            async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+                response = await async_client.post(
+                    "/api/generation/generate-from-outline",
+                    json={"document_id": seeded_section["document_id"], "topic": "Edge AI", "num_sections": 3},
+                    headers=seeded_section["headers"]
+                )
+        TemplateService._cache.clear()
+        
+        events = [json.loads(line) for line in response.text.splitlines()]
+        types = [e["type"] for e in events]
+        assert types.count("outline_item") == 3
+        assert types.index("section_started") < types.index("outline_complete")
+        assert events[-1] == {
+            "type": "document_complete",
+            "document_id": seeded_section["document_id"],
+            "completed": 3,
+            "failed": 0
+        }
+        
+        created = db_session.query(Section).filter(
+            Section.id.in_([UUID(e["section_id"]) for e in events if e["type"] == "outline_item"])
+        ).order_by(Section.section_order).all()
+        # Appended after the four seeded sections
+        assert [s.section_order for s in created] == [4, 5, 6]
+        assert all(s.is_generated for s in created)
+
+
+class TestGenerationJobs:
+    """Test durable background generation jobs"""
+    
+    @pytest.fixture
+    def session_factory(self, db_session):
+        from sqlalchemy.orm import sessionmaker
+        return sessionmaker(bind=db_session.get_bind())
+    
+    async def _enqueue(self, async_client, seeded_section: dict) -> str:
+        response = await async_client.post(
+            "/api/generation/jobs",
+            json={
+                "document_id": seeded_section["document_id"],
+                "section_id": seeded_section["section_id"],
+                "use_cache": False
+            },
+            headers=seeded_section["headers"]
+        )
+        assert response.status_code == 202
+        return response.json()["data"]["job_id"]
+    
+    @pytest.mark.asyncio
+    async def test_worker_runs_queued_job(self, seeded_section: dict, session_factory):
+        """A queued job is claimed once, persisted and reported as completed"""
+        from app.integrations import MockLLMClient, llm_registry
+        from app.services import GenerationJobService
+        from app.utils.job_queue import DatabaseJobQueue
+        
+        queue = DatabaseJobQueue(session_factory)
+        with llm_registry.override(MockLLMClient(ttft_ms=0, tokens_per_second=0)):
+            async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+                job_id = await self._enqueue(async_client, seeded_section)
+                
+                dequeued = await queue.dequeue(timeout=0)
+                assert str(dequeued) == job_id
+                assert await GenerationJobService.run_job(dequeued, "worker-1", session_factory) == "completed"
+                assert await GenerationJobService.run_job(dequeued, "worker-2", session_factory) is None
+                assert await queue.dequeue(timeout=0) is None
+                
+                job = (await async_client.get(f"/api/generation/jobs/{job_id}", headers=seeded_section["headers"])).json()["data"]
+                stream = await async_client.get(f"/api/generation/jobs/{job_id}/stream", headers=seeded_section["headers"])
+                content = await async_client.get(f"/api/generation/generated-content/{job['content_id']}",
+                                                 headers=seeded_section["headers"])
+        
+        assert job["status"] == "completed"
+        assert job["attempts"] == 1
+        events = [json.loads(line) for line in stream.text.splitlines()]
+        assert events[-1]["type"] == "generation_complete"
+        assert "".join(e["content"] for e in events if e["type"] == "content_chunk") == content.json()["data"]["content"]
+    
+    @pytest.mark.asyncio
+    async def test_client_reattaches_mid_generation(self, seeded_section: dict, session_factory):
+        """A client attaching while the worker streams gets checkpointed text, then the rest"""
+        from app.core.config import settings
+        from app.integrations import MockLLMClient, llm_registry
+        from app.services import GenerationJobService
+        
+        with llm_registry.override(MockLLMClient(ttft_ms=0, tokens_per_second=1000)), \
+                patch.object(settings, "JOB_PROGRESS_FLUSH_SECONDS", 0.02), \
+                patch.object(settings, "JOB_POLL_INTERVAL_SECONDS", 0.02):
+            async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+                job_id = await self._enqueue(async_client, seeded_section)
+                worker = asyncio.ensure_future(GenerationJobService.run_job(UUID(job_id), "worker-1", session_factory))
+                await asyncio.sleep(0.1)
+                
+                stream = await async_client.get(f"/api/generation/jobs/{job_id}/stream", headers=seeded_section["headers"])
+                assert await worker == "completed"
+        
+        events = [json.loads(line) for line in stream.text.splitlines()]
+        chunks = [e for e in events if e["type"] == "content_chunk"]
+        assert len(chunks) > 1
+        assert chunks[0]["offset"] == 0
+        assert events[-1]["type"] == "generation_complete"
+    
+    @pytest.mark.asyncio
+    async def test_failed_attempts_are_retried_then_failed(self, seeded_section: dict, session_factory, db_session):
+        """Errors requeue the job after a backoff until JOB_MAX_ATTEMPTS, then mark it failed"""
+        from datetime import datetime, timedelta
+        from app.core.config import settings
+        from app.integrations import MockLLMClient, llm_registry
+        from app.models import GenerationJob
+        from app.services import GenerationJobService
+        from app.utils.job_queue import DatabaseJobQueue
+        
+        with llm_registry.override(MockLLMClient(ttft_ms=0, error_rate=1.0)), \
+                patch.object(settings, "JOB_MAX_ATTEMPTS", 2):
+            async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+                job_id = UUID(await self._enqueue(async_client, seeded_section))
+                assert await GenerationJobService.run_job(job_id, "worker-1", session_factory) == "queued"
+                
+                # Still backing off: not handed out by the queue and not claimable
+                assert GenerationJobService.retry_delay(db_session, job_id) > 0
+                assert await DatabaseJobQueue(session_factory).dequeue(timeout=0) is None
+                assert await GenerationJobService.run_job(job_id, "worker-1", session_factory) == "queued"
+                db_session.expire_all()
+                assert db_session.get(GenerationJob, job_id).attempts == 1
+                
+                db_session.get(GenerationJob, job_id).available_at = datetime.utcnow() - timedelta(seconds=1)
+                db_session.commit()
+                assert await GenerationJobService.run_job(job_id, "worker-1", session_factory) == "failed"
+    
+    @pytest.mark.asyncio
+    async def test_heartbeat_uses_its_own_session(self, seeded_section: dict, session_factory, db_session):
+        """Lease renewals are committed apart from the generation's session while the job runs"""
+        from app.core.config import settings
+        from app.integrations import MockLLMClient, llm_registry
+        from app.models import GenerationJob
+        from app.services import GenerationJobService
+        
+        with llm_registry.override(MockLLMClient(ttft_ms=300, tokens_per_second=0)), \
+                patch.object(settings, "JOB_LEASE_SECONDS", 0.15):
+            async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+                job_id = UUID(await self._enqueue(async_client, seeded_section))
+                worker = asyncio.ensure_future(GenerationJobService.run_job(job_id, "worker-1", session_factory))
+                await asyncio.sleep(0.05)
+                started = db_session.get(GenerationJob, job_id).heartbeat_at
+                await asyncio.sleep(0.2)
+                db_session.expire_all()
+                renewed = db_session.get(GenerationJob, job_id).heartbeat_at
+                assert await worker == "completed"
+        
+        assert renewed > started
+    
+    def test_stale_running_jobs_are_requeued(self, seeded_section: dict, db_session):
+        """Jobs whose worker stopped heartbeating go back on the queue"""
+        from datetime import datetime, timedelta
+        from app.models import GenerationJob
+        from app.services import GenerationJobService
+        
+        job = GenerationJob(
+            user_id=UUID(seeded_section["user_id"]),
+            document_id=UUID(seeded_section["document_id"]),
+            section_id=UUID(seeded_section["section_id"]),
+            status="running",
+            heartbeat_at=datetime.utcnow() - timedelta(hours=1)
+        )
+        db_session.add(job)
+        db_session.commit()
+        
+        assert GenerationJobService.requeue_stale(db_session) == [job.id]
+        assert job.status == "queued"
+    
+    def test_unclaimed_queued_jobs_are_offered_again(self, seeded_section: dict, db_session):
+        """A queued job whose id was lost from the queue (e.g. popped by a crashed worker) is re-offered once per lease"""
+        from datetime import datetime, timedelta
+        from app.models import GenerationJob
+        from app.services import GenerationJobService
+        
+        lost, backing_off, fresh = [
+            GenerationJob(
+                user_id=UUID(seeded_section["user_id"]),
+                document_id=UUID(seeded_section["document_id"]),
+                section_id=UUID(seeded_section["section_id"]),
+                status="queued",
+                created_at=datetime.utcnow() - timedelta(hours=1),
+                available_at=available_at
+            )
+            for available_at in (None, datetime.utcnow() + timedelta(minutes=5), datetime.utcnow())
+        ]
+        db_session.add_all([lost, backing_off, fresh])
+        db_session.commit()
+        
+        assert GenerationJobService.requeue_stale(db_session) == [lost.id]
+        assert lost.status == "queued"
+        # Offered again now, so not again until another lease has passed
+        assert GenerationJobService.requeue_stale(db_session) == []
+
+
+class TestUserQuotaEnforcement:
+    """Test tier budgets on generation endpoints"""
+    
+    def test_budget_exceeded_returns_429(self, seeded_section: dict):
+        """Once the tier's request budget is spent, generation is refused with a clear reason"""
+        from app.integrations import MockLLMClient, llm_registry
+        from app.integrations.quota import quota_manager
+        
+        generation_data = {
+            "document_id": seeded_section["document_id"],
+            "section_id": seeded_section["section_id"],
+            "use_cache": False
+        }
+        with llm_registry.override(MockLLMClient(ttft_ms=0, tokens_per_second=0)), \
+                patch.object(quota_manager, "tiers", {"free": {"requests": 1, "tokens": 0}}):
+            first = client.post("/api/generation/generate", json=generation_data, headers=seeded_section["headers"])
+            second = client.post("/api/generation/generate", json=generation_data, headers=seeded_section["headers"])
+            usage = client.get("/api/generation/quota", headers=seeded_section["headers"]).json()["data"]
+        
+        assert first.status_code == 200
+        assert second.status_code == 429
+        assert "Quota exceeded for tier 'free'" in second.json()["detail"]
+        assert int(second.headers["Retry-After"]) > 0
+        assert usage["tier"] == "free"
+        assert usage["requests"] == {"used": 1, "limit": 1}
+        assert usage["tokens"]["used"] == first.json()["data"]["tokens_used"]
+
+
+class TestModelRouting:
+    """Test per-section model routing and fallback"""
+    
+    @staticmethod
+    def _router(failing: tuple = ()):
+        from app.integrations import LLMClientRegistry, MockLLMClient
+        from app.integrations.routing import ModelRouter
+        from app.core.config import settings
+        
+        registry = LLMClientRegistry()
+        registry.register_provider(
+            "stub",
+            lambda model, http_client: MockLLMClient(
+                model=model, ttft_ms=0, tokens_per_second=0, error_rate=1.0 if model in failing else 0.0
+            ),
+            "stub-strong",
+            fast_model="stub-fast"
+        )
+        return ModelRouter(settings.LLM_ROUTING_RULES, settings.LLM_ROUTING_FALLBACKS, provider="stub", registry=registry)
+    
+    def test_rules_pick_model_by_section_and_tier(self):
+        """Short slides and bullets go to the fast model; long-form and enterprise work to the strong one"""
+        router = self._router()
+        
+        slide = router.route(content_type="slide", length="medium", tone="professional", tier="free")
+        assert slide.rule == "short-slides"
+        assert slide.targets == [("stub", "stub-fast"), ("stub", None)]
+        
+        assert router.route(content_type="text", length="long", tier="free").targets == [("stub", None)]
+        assert router.route(content_type="text", length="short", tier="free").rule == "short-text"
+        assert router.route(content_type="bullet_points", length="short", tier="enterprise").rule == "enterprise"
+        assert [c.model for c in router.clients(content_type="slide", length="short")] == ["stub-fast", "stub-strong"]
+        assert router.stats()["routed"]["short-slides"] == 2
+    
+    def test_disabled_router_uses_default_model(self):
+        """With routing off every request goes to the provider's default model"""
+        router = self._router()
+        router.enabled = False
+        
+        assert [c.model for c in router.clients(content_type="slide", length="short")] == ["stub-strong"]
+    
+    def test_unknown_rule_attribute_is_rejected(self):
+        """A misspelt rule condition fails at startup instead of matching everything"""
+        from app.integrations.routing import ModelRouter
+        
+        with pytest.raises(ValueError):
+            ModelRouter([{"model": "fast", "content": "slide"}])
+    
+    def test_model_used_records_routed_model(self, seeded_section: dict, db_session):
+        """Each section's content row records the model that actually generated it"""
+        from app.integrations import routing
+        from app.models import Section
+        
+        slide_id, text_id = seeded_section["section_ids"][:2]
+        db_session.query(Section).filter(Section.id == UUID(slide_id)).update({"content_type": "slide"})
+        db_session.commit()
+        
+        with patch.object(routing, "model_router", self._router()):
+            models = {
+                section_id: client.post(
+                    "/api/generation/generate",
+                    json={"document_id": seeded_section["document_id"], "section_id": section_id, "use_cache": False},
+                    headers=seeded_section["headers"]
+                ).json()["data"]["model_used"]
+                for section_id in (slide_id, text_id)
+            }
+        
+        assert models == {slide_id: "stub-fast", text_id: "stub-strong"}
+    
+    def test_failed_model_falls_back(self, seeded_section: dict, db_session):
+        """A fast-model failure before any output is retried on the strong model"""
+        from app.integrations import routing
+        from app.models import GeneratedContent, Section
+        
+        section_id = seeded_section["section_id"]
+        db_session.query(Section).filter(Section.id == UUID(section_id)).update({"content_type": "bullet_points"})
+        db_session.commit()
+        
+        with patch.object(routing, "model_router", self._router(failing=("stub-fast",))):
+            response = client.post(
+                "/api/generation/generate",
+                json={"document_id": seeded_section["document_id"], "section_id": section_id,
+                      "stream": True, "use_cache": False},
+                headers=seeded_section["headers"]
+            )
+        
+        events = [json.loads(line) for line in response.text.splitlines()]
+        assert events[-1]["type"] == "generation_complete"
+        assert any(e["type"] == "content_chunk" for e in events)
+        content = db_session.query(GeneratedContent).filter(
+            GeneratedContent.id == UUID(events[-1]["content_id"])
+        ).first()
+        assert content.model_used == "stub-strong"
+        assert content.status == "completed"
+
+    
+    def test_open_circuit_fails_over_to_other_provider(self, seeded_section: dict, db_session):
+        """While the primary provider's circuit is open, generations go to the failover provider"""
+        from app.integrations import LLMClientRegistry, MockLLMClient, routing
+        from app.integrations.circuit_breaker import get_circuit_breaker
+        from app.integrations.routing import ModelRouter
+        
+        class PrimaryClient(MockLLMClient):
+            provider = "primary"
+        
+        class BackupClient(MockLLMClient):
+            provider = "backup"
+        
+        registry = LLMClientRegistry()
+        for name, cls in (("primary", PrimaryClient), ("backup", BackupClient)):
+            registry.register_provider(
+                name, lambda model, http_client, cls=cls: cls(model=model, ttft_ms=0, tokens_per_second=0), f"{name}-llm"
+            )
+        router = ModelRouter([], provider="primary", failover_providers=["backup"], registry=registry)
+        get_circuit_breaker("primary")._trip()
+        
+        with patch.object(routing, "model_router", router):
+            assert [c.model for c in router.clients(content_type="text")] == ["backup-llm", "primary-llm"]
+            response = client.post(
+                "/api/generation/generate",
+                json={"document_id": seeded_section["document_id"], "section_id": seeded_section["section_id"],
+                      "use_cache": False},
+                headers=seeded_section["headers"]
+            )
+        
+        assert response.status_code == 200
+        assert response.json()["data"]["model_used"] == "backup-llm"
+        assert get_circuit_breaker("primary").stats()["rejected_calls"] == 0
+
+
+class TestDocumentSummary:
+    """Test the rolling document summary used as cross-section context"""
+    
+    @staticmethod
+    def _client():
+        """Answers each section with one distinctive sentence and a long tail, recording its prompts"""
+        from app.integrations import LLMClient
+        import re
+        
+        class PromptRecordingClient(LLMClient):
+            provider = "test"
+            
+            def __init__(self):
+                super().__init__("test-model")
+                self.prompts = []
+            
+            async def _complete(self, prompt, max_tokens, temperature, usage):
+                self.prompts.append(prompt)
+                title = re.search(r"Section Title: (.+)", prompt).group(1)
+                return f"{title} explains point {len(self.prompts)}. It then goes into " + "much more detail " * 40
+        
+        return PromptRecordingClient()
+    
+    def _generate(self, seeded_section: dict, section_id: str) -> dict:
+        response = client.post(
+            "/api/generation/generate",
+            json={"document_id": seeded_section["document_id"], "section_id": section_id, "use_cache": False},
+            headers=seeded_section["headers"]
+        )
+        assert response.status_code == 200
+        return response.json()["data"]
+    
+    def test_digest_and_budget(self):
+        """Digests keep leading sentences, and the summary shrinks evenly to fit its budget"""
+        from app.integrations.tokenizer import count_tokens
+        from app.utils.summary import digest, fit_to_budget, render
+        
+        text = "## Heading\n\nFirst point is short. Second point follows here. " + "Third rambles on " * 40
+        assert digest(text, 12) == "Heading First point is short."
+        assert digest("One enormous sentence " * 30, 6).endswith("…")
+        
+        entries = {
+            str(i): {"order": i, "title": f"Part {i}", "digest": digest(text, 80)}
+            for i in range(6)
+        }
+        fitted = fit_to_budget(entries, 60)
+        summary = render(fitted, exclude="0")
+        assert count_tokens(render(fitted)) <= 70
+        assert summary.splitlines()[0].startswith("- Part 1:")
+        assert "Part 0" not in summary
+    
+    def test_later_sections_see_earlier_ones(self, seeded_section: dict, db_session):
+        """A section generated after another is prompted with its digest, never its own"""
+        from app.integrations import llm_registry
+        
+        first, second = seeded_section["section_ids"][:2]
+        llm_client = self._client()
+        with llm_registry.override(llm_client):
+            self._generate(seeded_section, first)
+            self._generate(seeded_section, second)
+            self._generate(seeded_section, first)
+        
+        assert "Summary of the Other Sections:\nNone" in llm_client.prompts[0]
+        assert "- Section 0: Section 0 explains point 1." in llm_client.prompts[1]
+        assert "much more detail" not in llm_client.prompts[1]
+        # Regenerating the first section sees the second, but not its own earlier version
+        assert "- Section 1: Section 1 explains point 2." in llm_client.prompts[2]
+        assert "- Section 0:" not in llm_client.prompts[2]
+        
+        summary = client.get(
+            f"/api/documents/{seeded_section['document_id']}/summary", headers=seeded_section["headers"]
+        ).json()["data"]
+        assert summary["summary"].splitlines() == [
+            "- Section 0: Section 0 explains point 3.",
+            "- Section 1: Section 1 explains point 2.",
+        ]
+        assert 0 < summary["tokens"] <= summary["budget_tokens"]
+    
+    def test_approved_version_stays_in_summary(self, seeded_section: dict, db_session):
+        """Once a version is approved, newer unapproved drafts don't replace it in the summary"""
+        from app.integrations import llm_registry
+        from app.models import GeneratedContent
+        
+        section_id = seeded_section["section_id"]
+        with llm_registry.override(self._client()):
+            approved_id = self._generate(seeded_section, section_id)["content_id"]
+            self._generate(seeded_section, section_id)
+            response = client.post(
+                f"/api/generation/generated-content/{approved_id}/approve", headers=seeded_section["headers"]
+            )
+            self._generate(seeded_section, section_id)
+        
+        assert response.status_code == 200
+        approved = db_session.query(GeneratedContent).filter(GeneratedContent.is_approved == True).all()
+        assert [str(c.id) for c in approved] == [approved_id]
+        summary = client.get(
+            f"/api/documents/{seeded_section['document_id']}/summary", headers=seeded_section["headers"]
+        ).json()["data"]["summary"]
+        assert summary == "- Section 0: Section 0 explains point 1."
+
+
+class TestGenerationCheckpoints:
+    """Test checkpointing of streamed content and resuming interrupted generations"""
+    
+    @staticmethod
+    def _client(words, fail_after=None, delay=0.0):
+        from app.integrations import LLMClient
+        
+        class ScriptedClient(LLMClient):
+            provider = "test"
+            prompts = []
+            
+            async def _complete(self, prompt, max_tokens, temperature, usage):
+                raise AssertionError("checkpointed generations stream")
+            
+            async def _stream(self, prompt, max_tokens, temperature, usage):
+                ScriptedClient.prompts.append(prompt)
+                for i, word in enumerate(words):
+                    if i == fail_after:
+                        raise RuntimeError("upstream connection reset")
+                    await asyncio.sleep(delay)
+                    yield word
+        
+        return ScriptedClient("test-model")
+    
+    @pytest.mark.asyncio
+    async def test_stream_checkpoints_in_progress_content(self, seeded_section: dict, db_session):
+        """Partial text is saved as an in-progress row while the stream is still running"""
+        from app.core.config import settings
+        from app.integrations import llm_registry
+        from app.models import GeneratedContent
+        
+        words = [f"word{i} " for i in range(6)]
+        with llm_registry.override(self._client(words, delay=0.05)), \
+                patch.object(settings, "GENERATION_CHECKPOINT_TOKENS", 2):
+            async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+                request = async_client.post(
+                    "/api/generation/generate",
+                    json={
+                        "document_id": seeded_section["document_id"],
+                        "section_id": seeded_section["section_id"],
+                        "stream": True,
+                        "use_cache": False
+                    },
+                    headers=seeded_section["headers"]
+                )
+                response = asyncio.ensure_future(request)
+                await asyncio.sleep(0.2)
+                db_session.expire_all()
+                checkpoint = db_session.query(GeneratedContent).one()
+                partial_status, partial_content = checkpoint.status, checkpoint.content
+                await response
+        
+        assert partial_status == "in_progress"
+        assert partial_content and "".join(words).startswith(partial_content)
+        db_session.expire_all()
+        final = db_session.query(GeneratedContent).one()
+        assert final.status == "completed"
+        assert final.content == "".join(words)
+        assert final.checkpointed_at is None
+    
+    @pytest.mark.asyncio
+    async def test_interrupted_generation_resumes_with_continuation(self, seeded_section: dict, db_session):
+        """A stream that fails midway keeps its partial text, and resuming only generates the rest"""
+        from app.core.config import settings
+        from app.integrations import llm_registry
+        from app.models import GeneratedContent
+        
+        generation_data = {
+            "document_id": seeded_section["document_id"],
+            "section_id": seeded_section["section_id"],
+            "stream": True,
+            "use_cache": False
+        }
+        with patch.object(settings, "GENERATION_CHECKPOINT_TOKENS", 1):
+            async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+                with llm_registry.override(self._client(["First ", "half. ", "lost"], fail_after=2)):
+                    failed = await async_client.post("/api/generation/generate", json=generation_data,
+                                                     headers=seeded_section["headers"])
+                
+                interrupted = db_session.query(GeneratedContent).one()
+                assert interrupted.status == "interrupted"
+                assert interrupted.content == "First half. "
+                
+                continuation = self._client(["Second ", "half."])
+                with llm_registry.override(continuation):
+                    resumed = await async_client.post(
+                        f"/api/generation/generated-content/{interrupted.id}/resume",
+                        json={"stream": True},
+                        headers=seeded_section["headers"]
+                    )
+                    again = await async_client.post(
+                        f"/api/generation/generated-content/{interrupted.id}/resume",
+                        json={},
+                        headers=seeded_section["headers"]
+                    )
+        
+        assert json.loads(failed.text.splitlines()[-1]) == {"error": "upstream connection reset"}
+        events = [json.loads(line) for line in resumed.text.splitlines()]
+        assert events[0] == {"type": "resume_started", "content_id": str(interrupted.id), "offset": 12}
+        assert "".join(e["content"] for e in events if e["type"] == "content_chunk") == "Second half."
+        assert events[-1]["content_id"] == str(interrupted.id)
+        assert "First half. " in continuation.prompts[0]
+        
+        db_session.expire_all()
+        final = db_session.query(GeneratedContent).one()
+        assert final.status == "completed"
+        assert final.content == "First half. Second half."
+        assert again.status_code == 409
+    
+    def test_stale_generation_kept_as_draft(self, seeded_section: dict, db_session):
+        """In-progress rows left by a dead process become interrupted and can be kept as drafts"""
+        from datetime import datetime, timedelta
+        from app.models import GeneratedContent
+        from app.services import GenerationService
+        
+        row, other = [
+            GeneratedContent(
+                section_id=UUID(section_id),
+                content="Partial draft",
+                prompt_used="prompt",
+                status="in_progress",
+                checkpointed_at=datetime.utcnow() - timedelta(hours=1)
+            )
+            for section_id in seeded_section["section_ids"][:2]
+        ]
+        db_session.add_all([row, other])
+        db_session.commit()
+        
+        response = client.post(
+            f"/api/generation/generated-content/{row.id}/resume",
+            json={"mode": "keep"},
+            headers=seeded_section["headers"]
+        )
+        
+        assert response.status_code == 200
+        assert response.json()["data"]["status"] == "draft"
+        assert response.json()["data"]["content"] == "Partial draft"
+        # Resuming one row leaves the table-wide sweep to startup and the workers
+        db_session.refresh(other)
+        assert other.status == "in_progress"
+        assert GenerationService.recover_interrupted(db_session) == 1
+        db_session.refresh(other)
+        assert other.status == "interrupted"
+
+
+def _parse_sse(text: str) -> list:
+    """(id, event) pairs from an SSE body, skipping comments and retry hints"""
+    frames = []
+    for block in text.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line and not line.startswith(":"))
+        if "data" in fields:
+            frames.append((int(fields.get("id", 0)), json.loads(fields["data"])))
+    return frames
+
+
+class TestReplayableStreams:
+    """Test SSE generation streams with Last-Event-ID replay"""
+    
+    @pytest.mark.asyncio
+    async def test_buffer_replays_then_follows_live_events(self):
+        """A subscriber resuming mid-stream gets the missed events, live ones, and a gap marker past eviction"""
+        from app.utils.replay import ReplayBuffer
+        
+        buffer = ReplayBuffer("gen", "user", capacity=3)
+        for i in range(4):
+            buffer.append({"type": "content_chunk", "content": str(i)})
+        
+        async def follow(after):
+            return [(event_id, event["type"]) async for event_id, event in buffer.subscribe(after)]
+        
+        resumed = asyncio.ensure_future(follow(3))
+        stale = asyncio.ensure_future(follow(0))
+        await asyncio.sleep(0)
+        buffer.append({"type": "generation_complete"})
+        buffer.close()
+        
+        assert await resumed == [(4, "content_chunk"), (5, "generation_complete")]
+        assert await stale == [(0, "replay_gap"), (2, "content_chunk"), (3, "content_chunk"), (4, "content_chunk"),
+                                (5, "generation_complete")]
+    
+    @pytest.mark.asyncio
+    async def test_reconnect_replays_after_last_event_id(self, seeded_section: dict):
+        """Reconnecting with Last-Event-ID returns exactly the events after it"""
+        from app.core.config import settings
+        from app.integrations import MockLLMClient, llm_registry
+        
+        sse_headers = {**seeded_section["headers"], "Accept": "text/event-stream"}
+        with llm_registry.override(MockLLMClient(ttft_ms=0, tokens_per_second=0)), \
+                patch.object(settings, "STREAM_FLUSH_MAX_BYTES", 1):
+            async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+                response = await async_client.post(
+                    "/api/generation/generate",
+                    json={
+                        "document_id": seeded_section["document_id"],
+                        "section_id": seeded_section["section_id"],
+                        "stream": True,
+                        "use_cache": False
+                    },
+                    headers=sse_headers
+                )
+                generation_id = response.headers["X-Generation-Id"]
+                resumed = await async_client.get(
+                    f"/api/generation/streams/{generation_id}",
+                    headers={**sse_headers, "Last-Event-ID": "2"}
+                )
+                missing = await async_client.get("/api/generation/streams/unknown", headers=sse_headers)
+        
+        assert response.headers["content-type"].startswith("text/event-stream")
+        frames = _parse_sse(response.text)
+        assert frames[0][1] == {"type": "generation_started", "generation_id": generation_id}
+        assert frames[-1][1]["type"] == "generation_complete"
+        assert [event_id for event_id, _ in frames] == list(range(1, len(frames) + 1))
+        assert len(frames) > 3
+        
+        assert _parse_sse(resumed.text) == frames[2:]
+        assert missing.status_code == 404
+    
+    def test_stream_errors_get_status_codes(self, seeded_section: dict):
+        """Streamed generations that can't start answer 404 or 503 instead of 500"""
+        from app.integrations.circuit_breaker import CircuitOpenError
+        from app.services import GenerationService
+        
+        request = {"document_id": str(uuid4()), "section_id": seeded_section["section_id"], "stream": True}
+        sse = {**seeded_section["headers"], "Accept": "text/event-stream"}
+        denied_sse = client.post("/api/generation/generate", json=request, headers=sse)
+        denied_ndjson = client.post("/api/generation/generate", json=request, headers=seeded_section["headers"])
+        
+        with patch.object(GenerationService, "start_replayable_stream", side_effect=CircuitOpenError("Circuit open", "test", 4)):
+            circuit_open = client.post(
+                "/api/generation/generate",
+                json={**request, "document_id": seeded_section["document_id"]},
+                headers=sse
+            )
+        
+        assert denied_sse.status_code == denied_ndjson.status_code == 404
+        assert denied_ndjson.json()["detail"] == "Access denied"
+        assert circuit_open.status_code == 503
+        assert circuit_open.headers["Retry-After"] == "5"
+    
+    @pytest.mark.asyncio
+    async def test_viewers_share_one_generation(self, seeded_section: dict):
+        """Concurrent SSE requests for the same section share a generation id and one LLM call"""
+        from app.integrations import LLMClient, llm_registry
+        
+        class CountingClient(LLMClient):
+            provider = "test"
+            calls = 0
+            
+            async def _complete(self, prompt, max_tokens, temperature, usage):
+                raise AssertionError("SSE generations stream")
+            
+            async def _stream(self, prompt, max_tokens, temperature, usage):
+                CountingClient.calls += 1
+                for word in ["Shared ", "content"]:
+                    await asyncio.sleep(0.1)
+                    yield word
+        
+        request = {
+            "document_id": seeded_section["document_id"],
+            "section_id": seeded_section["section_id"],
+            "stream": True,
+            "use_cache": False
+        }
+        sse_headers = {**seeded_section["headers"], "Accept": "text/event-stream"}
+        with llm_registry.override(CountingClient("test-model")):
+            async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+                responses = await asyncio.gather(*[
+                    async_client.post("/api/generation/generate", json=request, headers=sse_headers)
+                    for _ in range(3)
+                ])
+        
+        assert CountingClient.calls == 1
+        assert len({r.headers["X-Generation-Id"] for r in responses}) == 1
+        for response in responses:
+            events = [event for _, event in _parse_sse(response.text)]
+            assert "".join(e["content"] for e in events if e["type"] == "content_chunk") == "Shared content"
+            assert events[-1]["type"] == "generation_complete"
+
+
+class TestJobScheduler:
+    """Test lane priority and per-user fairness of the job scheduler"""
+    
+    @staticmethod
+    async def admission_order(scheduler, jobs):
+        """Queue (lane, user) jobs behind a held slot and return the order they are admitted in"""
+        order = []
+        release = asyncio.Event()
+        
+        async def job(lane, user, name):
+            async with scheduler.slot(lane, user):
+                order.append(name)
+                await asyncio.sleep(0)
+        
+        async def blocker():
+            async with scheduler.slot("batch", "blocker"):
+                await release.wait()
+        
+        held = asyncio.ensure_future(blocker())
+        await asyncio.sleep(0)
+        tasks = []
+        for i, (lane, user) in enumerate(jobs):
+            tasks.append(asyncio.ensure_future(job(lane, user, i)))
+            await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(held, *tasks)
+        return order
+    
+    @pytest.mark.asyncio
+    async def test_interactive_jumps_batch_backlog(self):
+        """An interactive job queued behind a batch backlog is admitted first"""
+        from app.utils.scheduler import JobScheduler
+        
+        scheduler = JobScheduler(1, {"interactive_stream": 8, "interactive": 4, "batch": 1})
+        order = await self.admission_order(scheduler, [("batch", "bulk")] * 5 + [("interactive_stream", "clicker")])
+        
+        assert order[0] == 5
+    
+    @pytest.mark.asyncio
+    async def test_batch_is_not_starved(self):
+        """Lower-weight lanes still get their share under sustained interactive load"""
+        from app.utils.scheduler import JobScheduler
+        
+        scheduler = JobScheduler(1, {"interactive_stream": 8, "interactive": 4, "batch": 1})
+        jobs = [("batch", "bulk")] * 5 + [("interactive", f"user-{i}") for i in range(10)]
+        order = await self.admission_order(scheduler, jobs)
+        
+        assert any(name < 5 for name in order[:5])
+    
+    @pytest.mark.asyncio
+    async def test_users_share_a_lane_fairly(self):
+        """A user's backlog does not delay another user's single job in the same lane"""
+        from app.utils.scheduler import JobScheduler
+        
+        scheduler = JobScheduler(1, {})
+        order = await self.admission_order(scheduler, [("batch", "heavy")] * 4 + [("batch", "light")])
+        
+        assert order.index(4) <= 1
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_waiters_leave_the_queue(self):
+        """Cancelling a queued job frees its place and keeps metrics accurate"""
+        from app.utils.scheduler import JobScheduler
+        
+        scheduler = JobScheduler(1, {})
+        
+        async def wait_for_slot():
+            async with scheduler.slot("interactive", "user"):
+                pass
+        
+        async with scheduler.slot("batch", "other"):
+            waiter = asyncio.ensure_future(wait_for_slot())
+            await asyncio.sleep(0)
+            assert scheduler.stats()["lanes"]["interactive"]["queued"] == 1
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            assert scheduler.stats()["lanes"]["interactive"]["queued"] == 0
+        
+        assert scheduler.running == 0
+
+
+class TestLLMClientRegistry:
+    """Test the shared LLM client registry"""
+    
+    def test_client_is_reused(self):
+        """Repeated lookups return the same long-lived client"""
+        from app.core.config import settings
+        from app.integrations import LLMClientRegistry
+        
+        registry = LLMClientRegistry()
+        with patch.object(settings, "OPENAI_API_KEY", "test-key"):
+            first = registry.get("openai")
+            second = registry.get("openai")
+        
+        assert first is second
+        assert first.model == "gpt-4"
+        assert registry.get("openai", "gpt-4") is first
+    
+    def test_override_swaps_client(self):
+        """A stand-in client is served while the override is active"""
+        from app.integrations import LLMClientRegistry
+        
+        registry = LLMClientRegistry()
+        stand_in = AsyncMock()
+        with registry.override(stand_in):
+            assert registry.get("gemini") is stand_in
+            assert registry.get("openai") is stand_in
+    
+    def test_unsupported_provider(self):
+        """Unknown providers are rejected"""
+        from app.integrations import LLMClientRegistry
+        
+        with pytest.raises(ValueError):
+            LLMClientRegistry().get("unknown")
+
+
+class TestStreamCoalescing:
+    """Test merging of streamed chunks before they reach the client"""
+
+    @staticmethod
+    async def chunks(items, delay=0.0, pulled=None):
+        for item in items:
+            if delay:
+                await asyncio.sleep(delay)
+            if pulled is not None:
+                pulled.append(item)
+            yield item
+
+    @pytest.mark.asyncio
+    async def test_flushes_by_size(self):
+        """Tiny chunks are merged into flushes of about max_bytes"""
+        from app.utils.streaming import coalesce_chunks
+
+        out = [c async for c in coalesce_chunks(self.chunks(["ab"] * 50), max_bytes=10, max_delay=10)]
+
+        assert "".join(out) == "ab" * 50
+        assert len(out) == 10
+
+    @pytest.mark.asyncio
+    async def test_flushes_by_time_window(self):
+        """A partial buffer is flushed once the window elapses"""
+        from app.utils.streaming import coalesce_chunks
+
+        out = [c async for c in coalesce_chunks(self.chunks(["a", "b", "c"], delay=0.03), max_bytes=1000, max_delay=0.01)]
+
+        assert out == ["a", "b", "c"]
+
+    @pytest.mark.asyncio
+    async def test_slow_reader_applies_backpressure(self):
+        """The upstream is read at most one chunk ahead of the consumer"""
+        from app.utils.streaming import coalesce_chunks
+
+        pulled = []
+        stream = coalesce_chunks(self.chunks([str(i) for i in range(100)], pulled=pulled), max_bytes=1, max_delay=10)
+        first = await stream.__anext__()
+        await asyncio.sleep(0.05)
+
+        assert first == "0"
+        assert len(pulled) <= 2
+        await stream.aclose()
+
+
+class TestLatencyLedger:
+    """Test the per-call latency ledger and its admin summary"""
+    
+    @pytest.mark.asyncio
+    async def test_generation_calls_are_summarized(self, seeded_section: dict, db_session):
+        """Calls made by /generate are written to llm_calls and summarized per model"""
+        from sqlalchemy.orm import sessionmaker
+        from app.core.config import settings
+        from app.integrations import MockLLMClient, llm_registry
+        from app.integrations.ledger import LatencyLedger
+        from app.models import LLMCall
+        
+        ledger = LatencyLedger(session_factory=sessionmaker(bind=db_session.get_bind()))
+        with llm_registry.override(MockLLMClient(ttft_ms=20, tokens_per_second=2000)), \
+                patch("app.integrations.ledger.latency_ledger", ledger), \
+                patch.object(settings, "ADMIN_USER_IDS", [seeded_section["user_id"]]):
+            async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+                for section_id in seeded_section["section_ids"]:
+                    response = await async_client.post(
+                        "/api/generation/generate",
+                        json={
+                            "document_id": seeded_section["document_id"],
+                            "section_id": section_id,
+                            "stream": True,
+                            "use_cache": False
+                        },
+                        headers=seeded_section["headers"]
+                    )
+                    assert response.status_code == 200
+                await ledger.aclose()
+                
+                response = await async_client.get("/api/generation/latency", headers=seeded_section["headers"])
+        
+        calls = db_session.query(LLMCall).all()
+        assert len(calls) == 4
+        assert all(c.outcome == "success" and c.streamed for c in calls)
+        assert all(20 <= c.ttft_ms <= c.total_ms for c in calls)
+        assert all(c.completion_tokens > 0 and c.tokens_per_second for c in calls)
+        
+        assert response.status_code == 200
+        summary = response.json()["data"]["models"]
+        assert summary[0]["model"] == "mock-llm"
+        assert summary[0]["calls"] == 4
+        assert summary[0]["ttft_ms"]["p50"] <= summary[0]["ttft_ms"]["p99"]
+    
+    def test_summary_requires_admin(self, seeded_section: dict):
+        """Non-admin users cannot read the ledger"""
+        response = client.get("/api/generation/latency", headers=seeded_section["headers"])
+        
+        assert response.status_code == 403
+    
+    def test_operational_endpoints_require_admin(self, seeded_section: dict):
+        """Process-wide cache, limiter, breaker, scheduler and routing state is admin-only too"""
+        from app.core.config import settings
+        
+        paths = ["cache/stats", "rate-limits", "circuit-breakers", "scheduler", "routing"]
+        denied = [client.get(f"/api/generation/{path}", headers=seeded_section["headers"]).status_code for path in paths]
+        with patch.object(settings, "ADMIN_USER_IDS", [seeded_section["user_id"]]):
+            allowed = [client.get(f"/api/generation/{path}", headers=seeded_section["headers"]).status_code for path in paths]
+        
+        assert denied == [403] * len(paths)
+        assert allowed == [200] * len(paths)
 
 
 class TestContentRetrieval:
@@ -73,7 +1286,604 @@ class TestContentRetrieval:
         assert response.status_code in [200, 404]
 
 
+class TestSpanRefinement:
+    """Test feedback applied to a selected span of a content version"""
+    
+    INTRO = "Opening paragraph about the market. " * 12
+    MIDDLE = "The middle paragraph is wordy and repeats itself, and repeats itself again."
+    CLOSING = "Closing paragraph with the outlook. " * 12
+    
+    @staticmethod
+    def _client(reply: str):
+        from app.integrations import LLMClient
+        
+        class RecordingClient(LLMClient):
+            provider = "test"
+            
+            def __init__(self):
+                super().__init__("test-model")
+                self.prompts = []
+            
+            async def _complete(self, prompt, max_tokens, temperature, usage):
+                self.prompts.append((prompt, max_tokens))
+                return reply
+            
+            async def _stream(self, prompt, max_tokens, temperature, usage):
+                self.prompts.append((prompt, max_tokens))
+                yield reply
+        
+        return RecordingClient()
+    
+    def _seed(self, seeded_section: dict, db_session):
+        from app.models import GeneratedContent, Refinement
+        
+        original = GeneratedContent(
+            section_id=UUID(seeded_section["section_id"]),
+            content=f"{self.INTRO.strip()}\n\n{self.MIDDLE}\n\n{self.CLOSING.strip()}",
+            version=1,
+            model_used="test-model",
+            status="completed"
+        )
+        db_session.add(original)
+        db_session.flush()
+        feedback = Refinement(
+            generated_content_id=original.id,
+            feedback_type="dislike",
+            feedback_text="Tighten this paragraph",
+            refinement_reason="too_long"
+        )
+        db_session.add(feedback)
+        db_session.commit()
+        return original, feedback
+    
+    def test_span_is_rewritten_into_new_version(self, seeded_section: dict, db_session):
+        """Only the span and its neighbourhood reach the model; the rewrite is spliced into version 2"""
+        from app.integrations import llm_registry
+        from app.models import GeneratedContent, Refinement
+        
+        original, feedback = self._seed(seeded_section, db_session)
+        start = original.content.index(self.MIDDLE)
+        llm_client = self._client("  The middle paragraph, tightened.\n")
+        with llm_registry.override(llm_client):
+            response = client.post(
+                "/api/refinement/apply-feedback",
+                json={
+                    "content_id": str(original.id),
+                    "span": {"start": start, "end": start + len(self.MIDDLE), "text": self.MIDDLE}
+                },
+                headers=seeded_section["headers"]
+            )
+        
+        assert response.status_code == 200
+        data = response.json()["data"]
+        expected = original.content.replace(self.MIDDLE, "The middle paragraph, tightened.")
+        assert data["content"] == expected
+        assert data["version"] == 2
+        assert expected[data["span"]["start"]:data["span"]["end"]] == "The middle paragraph, tightened."
+        
+        prompt, max_tokens = llm_client.prompts[0]
+        assert self.MIDDLE in prompt and "Tighten this paragraph" in prompt and "too_long" in prompt
+        # Neighbouring text is trimmed to the context window rather than sent whole
+        assert prompt.count("Opening paragraph about the market.") < 12
+        assert max_tokens < 200
+        
+        db_session.expire_all()
+        assert db_session.get(GeneratedContent, original.id).content == original.content
+        refinement = db_session.get(Refinement, feedback.id)
+        assert refinement.is_processed
+        assert str(refinement.regenerated_content_id) == data["content_id"]
+    
+    def test_drifted_offsets_are_refound(self, seeded_section: dict, db_session):
+        """If the offsets no longer match the selected text, the nearest occurrence is used"""
+        from app.integrations import llm_registry
+        
+        original, _ = self._seed(seeded_section, db_session)
+        with llm_registry.override(self._client("Short.")):
+            response = client.post(
+                "/api/refinement/apply-feedback",
+                json={"content_id": str(original.id), "span": {"start": 0, "end": 10, "text": self.MIDDLE}},
+                headers=seeded_section["headers"]
+            )
+        
+        assert response.status_code == 200
+        assert "\n\nShort.\n\n" in response.json()["data"]["content"]
+    
+    def test_invalid_span_is_rejected(self, seeded_section: dict, db_session):
+        """Spans outside the content, or selections that aren't in it, are refused before any LLM call"""
+        from app.integrations import llm_registry
+        
+        original, _ = self._seed(seeded_section, db_session)
+        llm_client = self._client("unused")
+        with llm_registry.override(llm_client):
+            outside = client.post(
+                "/api/refinement/apply-feedback",
+                json={"content_id": str(original.id), "span": {"start": 5, "end": 100000}},
+                headers=seeded_section["headers"]
+            )
+            missing = client.post(
+                "/api/refinement/apply-feedback",
+                json={"content_id": str(original.id), "span": {"start": 0, "end": 5, "text": "not in the text"}},
+                headers=seeded_section["headers"]
+            )
+        
+        assert outside.status_code == 422
+        assert missing.status_code == 422
+        assert llm_client.prompts == []
+
+
+class TestBatchedRefinement:
+    """Test applying several refinements to a content version in one call"""
+    
+    @staticmethod
+    def _seed(seeded_section: dict, db_session, feedback: list):
+        from app.models import GeneratedContent, Refinement
+        
+        original = GeneratedContent(
+            section_id=UUID(seeded_section["section_id"]),
+            content="Original section text.",
+            version=1,
+            model_used="test-model",
+            status="completed"
+        )
+        db_session.add(original)
+        db_session.flush()
+        refinements = [
+            Refinement(generated_content_id=original.id, feedback_type=kind, feedback_text=text, refinement_reason=reason)
+            for kind, text, reason in feedback
+        ]
+        db_session.add_all(refinements)
+        db_session.commit()
+        return original, [str(r.id) for r in refinements]
+    
+    def test_overlapping_feedback_is_merged(self):
+        """Repeated feedback is asked for once, overlapping feedback is kept; any dislike makes the batch a dislike"""
+        from app.services import RefinementService
+        
+        merged = RefinementService._merge_feedback([
+            SimpleNamespace(feedback_type="comment", feedback_text="Make it shorter.",
+                            suggested_changes=None, refinement_reason="too_long"),
+            SimpleNamespace(feedback_type="dislike", feedback_text="make it   SHORTER",
+                            suggested_changes="Cut the intro", refinement_reason="too_long"),
+            SimpleNamespace(feedback_type="comment", feedback_text="Please make it shorter and add numbers",
+                            suggested_changes=None, refinement_reason="unclear"),
+            SimpleNamespace(feedback_type="like", feedback_text="Good tone", suggested_changes=None,
+                            refinement_reason=None),
+            SimpleNamespace(feedback_type="comment", feedback_text="Use a table", suggested_changes="Add data",
+                            refinement_reason=None),
+            SimpleNamespace(feedback_type="comment", feedback_text="Do not use a table of contents",
+                            suggested_changes="Add database migration examples", refinement_reason=None),
+        ])
+        
+        assert merged == {
+            "feedback_type": "dislike",
+            "user_feedback": "1. Make it shorter.\n2. Please make it shorter and add numbers\n3. Good tone\n"
+                             "4. Use a table\n5. Do not use a table of contents",
+            "suggested_changes": "1. Cut the intro\n2. Add data\n3. Add database migration examples",
+            "refinement_reason": "too_long, unclear",
+        }
+    
+    def test_selected_refinements_applied_in_one_call(self, seeded_section: dict, db_session):
+        """Only the chosen refinements are applied, with one LLM call, and each is linked to the new version"""
+        from app.integrations import llm_registry
+        from app.models import Refinement
+        
+        original, ids = self._seed(seeded_section, db_session, [
+            ("dislike", "Too vague", "unclear"),
+            ("comment", "Add a concrete example", "other"),
+            ("comment", "Use British spelling", "other"),
+        ])
+        llm_client = TestSpanRefinement._client("Refined section text.")
+        with llm_registry.override(llm_client):
+            response = client.post(
+                "/api/refinement/apply-feedback",
+                json={"content_id": str(original.id), "refinement_ids": ids[:2]},
+                headers=seeded_section["headers"]
+            )
+            reapplied = client.post(
+                "/api/refinement/apply-feedback",
+                json={"content_id": str(original.id), "refinement_ids": ids[:1]},
+                headers=seeded_section["headers"]
+            )
+        
+        assert response.status_code == 200
+        # Feedback that was already applied isn't applied a second time
+        assert reapplied.status_code == 422
+        data = response.json()["data"]
+        assert data["content"] == "Refined section text."
+        assert data["version"] == 2
+        assert sorted(data["refinement_ids"]) == sorted(ids[:2])
+        assert len(llm_client.prompts) == 1
+        prompt = llm_client.prompts[0][0]
+        assert "Original section text." in prompt
+        assert "1. Too vague\n2. Add a concrete example" in prompt
+        assert "British" not in prompt
+        
+        db_session.expire_all()
+        states = {str(r.id): (r.is_processed, r.regenerated_content_id) for r in db_session.query(Refinement)}
+        assert states[ids[0]] == states[ids[1]] == (True, UUID(data["content_id"]))
+        assert states[ids[2]] == (False, None)
+    
+    def test_unprocessed_feedback_streamed(self, seeded_section: dict, db_session):
+        """Without ids, every unprocessed refinement is applied; streaming ends with the new version's id"""
+        from app.integrations import llm_registry
+        from app.models import GeneratedContent
+        
+        original, ids = self._seed(seeded_section, db_session, [
+            ("dislike", "Too long", "too_long"),
+            ("comment", "Too long!", "too_long"),
+        ])
+        with llm_registry.override(TestSpanRefinement._client("Shorter text.")):
+            response = client.post(
+                "/api/refinement/apply-feedback",
+                json={"content_id": str(original.id), "stream": True},
+                headers=seeded_section["headers"]
+            )
+            again = client.post(
+                "/api/refinement/apply-feedback",
+                json={"content_id": str(original.id)},
+                headers=seeded_section["headers"]
+            )
+        
+        events = [json.loads(line) for line in response.text.splitlines()]
+        assert "".join(e["content"] for e in events if e["type"] == "content_chunk") == "Shorter text."
+        assert sorted(events[-1]["refinement_ids"]) == sorted(ids)
+        refined = db_session.get(GeneratedContent, UUID(events[-1]["content_id"]))
+        assert refined.version == 2
+        assert "Too long!" not in refined.prompt_used
+        # Nothing is left to apply once the feedback has been processed
+        assert again.status_code == 422
+
+
+class TestBulkRefinement:
+    """Test document-wide refinement jobs"""
+    
+    @staticmethod
+    def _approve(seeded_section: dict, db_session, label: str, count: int):
+        from app.models import GeneratedContent
+        
+        for i, section_id in enumerate(seeded_section["section_ids"]):
+            db_session.add(GeneratedContent(
+                section_id=UUID(section_id),
+                content=f"{label} body {i}.",
+                version=1,
+                model_used="test-model",
+                status="completed",
+                is_approved=i < count
+            ))
+        db_session.commit()
+    
+    @staticmethod
+    def _events(response) -> list:
+        assert response.status_code == 200
+        return [json.loads(line) for line in response.text.splitlines()]
+    
+    def test_retry_reruns_only_failed_sections(self, seeded_section: dict, db_session):
+        """A failed section is retried on its own; the sections that finished are not refined again"""
+        from app.integrations import LLMClient, llm_registry
+        from app.integrations.circuit_breaker import LLMProviderError
+        
+        class FlakyClient(LLMClient):
+            provider = "test"
+            
+            def __init__(self):
+                super().__init__("test-model")
+                self.prompts = []
+                self.failed = False
+            
+            async def _complete(self, prompt, max_tokens, temperature, usage):
+                self.prompts.append(prompt)
+                if "Flaky body 1." in prompt and not self.failed:
+                    self.failed = True
+                    raise LLMProviderError("upstream error", self.provider)
+                return "Refined " + prompt.split("Flaky body ")[1][:2]
+        
+        self._approve(seeded_section, db_session, "Flaky", 3)
+        llm_client = FlakyClient()
+        with llm_registry.override(llm_client):
+            first = self._events(client.post(
+                "/api/refinement/bulk",
+                json={"document_id": seeded_section["document_id"], "instruction": "Make it shorter"},
+                headers=seeded_section["headers"]
+            ))
+            job_id = first[0]["job_id"]
+            status_after_failure = client.get(f"/api/refinement/bulk/{job_id}", headers=seeded_section["headers"])
+            retry = self._events(client.post(f"/api/refinement/bulk/{job_id}/retry", headers=seeded_section["headers"]))
+            nothing_left = client.post(f"/api/refinement/bulk/{job_id}/retry", headers=seeded_section["headers"])
+        
+        section_ids = seeded_section["section_ids"]
+        assert first[0]["type"] == "job_started" and first[0]["pending"] == 3
+        assert {e["section_id"] for e in first if e["type"] == "section_complete"} == {section_ids[0], section_ids[2]}
+        assert [e["section_id"] for e in first if e["type"] == "section_error"] == [section_ids[1]]
+        assert first[-1] == {"type": "job_complete", "job_id": job_id, "status": "failed", "completed": 2, "failed": 1}
+        
+        sections = status_after_failure.json()["data"]["sections"]
+        assert [s["error"] is not None for s in sections] == [False, True, False]
+        
+        assert retry[0]["pending"] == 1 and retry[0]["skipped"] == 2
+        refined = [e for e in retry if e["type"] == "section_complete"]
+        assert [(e["section_id"], e["content"], e["version"]) for e in refined] == [(section_ids[1], "Refined 1.", 2)]
+        assert retry[-1]["status"] == "completed"
+        # Three sections, plus the one retried
+        assert len(llm_client.prompts) == 4
+        assert all("Make it shorter" in prompt for prompt in llm_client.prompts)
+        assert nothing_left.status_code == 422
+    
+    def test_sections_share_bounded_slots(self, seeded_section: dict, db_session):
+        """No more sections are refined at once than the per-user cap allows, each in its own session"""
+        from app.integrations import LLMClient, llm_registry
+        from app.services import GenerationService, RefinementService
+        from app.utils.concurrency import ConcurrencyLimiter
+        
+        class SlowClient(LLMClient):
+            provider = "test"
+            active = 0
+            peak = 0
+            
+            def __init__(self):
+                super().__init__("test-model")
+            
+            async def _complete(self, prompt, max_tokens, temperature, usage):
+                SlowClient.active += 1
+                SlowClient.peak = max(SlowClient.peak, SlowClient.active)
+                await asyncio.sleep(0.05)
+                SlowClient.active -= 1
+                return "Shorter."
+        
+        sessions = []
+        start_refinement = RefinementService._start_refinement
+        
+        def recording(db, *args, **kwargs):
+            sessions.append(db)
+            return start_refinement(db, *args, **kwargs)
+        
+        self._approve(seeded_section, db_session, "Bounded", 4)
+        with llm_registry.override(SlowClient()), \
+                patch.object(GenerationService, "_slots", ConcurrencyLimiter(16, 2)), \
+                patch.object(RefinementService, "_start_refinement", recording):
+            events = self._events(client.post(
+                "/api/refinement/bulk",
+                json={"document_id": seeded_section["document_id"], "instruction": "More formal", "use_cache": False},
+                headers=seeded_section["headers"]
+            ))
+        
+        assert events[-1]["completed"] == 4
+        assert events[-1]["status"] == "completed"
+        assert SlowClient.peak == 2
+        assert len({id(db) for db in sessions}) == 4
+    
+    def test_document_without_approved_content(self, seeded_section: dict):
+        """There is nothing to refine until sections have approved versions"""
+        response = client.post(
+            "/api/refinement/bulk",
+            json={"document_id": seeded_section["document_id"], "instruction": "Make it shorter"},
+            headers=seeded_section["headers"]
+        )
+        
+        assert response.status_code == 422
+
+
+class TestLongSections:
+    """Test long sections written as parallel parts"""
+    
+    @staticmethod
+    def _make_long(seeded_section: dict, db_session, focus_points=None):
+        from app.models import Document, Section
+        
+        document = db_session.get(Document, UUID(seeded_section["document_id"]))
+        document.config_json = {"length": "long"}
+        if focus_points:
+            section = db_session.get(Section, UUID(seeded_section["section_id"]))
+            section.section_config_json = {"focus_points": focus_points}
+        db_session.commit()
+    
+    def test_part_plan(self):
+        """Focus points are shared out in order; without them the parts open, develop and close"""
+        from app.integrations import PromptManager
+        from app.utils.section_parts import clean_part, plan
+        
+        assert plan(["a", "b", "c", "d"], 3) == [["a", "b"], ["c"], ["d"]]
+        assert plan(["a", "b"], 3) == [["a"], ["b"]]
+        assert [len(scope) for scope in plan([], 3)] == [1, 1, 1]
+        
+        prompt = PromptManager.build_section_part_prompt("Content:", 1, plan(["a", "b", "c"], 3))
+        assert "Write only part 2 of 3, which covers:\n- b" in prompt
+        assert "Part 1: a\nPart 3: c" in prompt
+        assert prompt.endswith("Content:")
+        
+        written = "# Overview\n\nCosts fell.\n\nMargins rose."
+        assert clean_part("## Overview\n\nMargins rose!\n\nHiring slowed.", written, "Overview") == "Hiring slowed."
+    
+    @pytest.mark.asyncio
+    async def test_first_part_streams_while_others_generate(self, seeded_section: dict, db_session):
+        """The parts run at once, the first streams first, and the stitched text drops repeats at the seams"""
+        from app.integrations import LLMClient, llm_registry
+        from app.integrations.tokenizer import count_tokens
+        from app.models import GeneratedContent
+        
+        delay = 0.3
+        
+        class PartsClient(LLMClient):
+            provider = "test"
+            
+            def __init__(self):
+                super().__init__("test-model")
+                self.prompts = []
+                self.finished = []
+            
+            async def _stream(self, prompt, max_tokens, temperature, usage):
+                self.prompts.append(prompt)
+                for chunk in ["## Pricing\n\n", "Prices rose. "]:
+                    await asyncio.sleep(delay / 2)
+                    yield chunk
+                self.finished.append(1)
+            
+            async def _complete(self, prompt, max_tokens, temperature, usage):
+                self.prompts.append(prompt)
+                await asyncio.sleep(delay)
+                part = int(prompt.split("Write only part ")[1][0])
+                self.finished.append(part)
+                if part == 2:
+                    return "## Pricing\n\nPrices rose.\n\nDemand held up."
+                return "Margins widened."
+        
+        self._make_long(seeded_section, db_session, ["pricing", "demand", "margins"])
+        llm_client = PartsClient()
+        with llm_registry.override(llm_client):
+            start = time.perf_counter()
+            async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+                response = await async_client.post(
+                    "/api/generation/generate",
+                    json={"document_id": seeded_section["document_id"], "section_id": seeded_section["section_id"],
+                          "stream": True, "use_cache": False},
+                    headers=seeded_section["headers"]
+                )
+            elapsed = time.perf_counter() - start
+        
+        events = [json.loads(line) for line in response.text.splitlines()]
+        streamed = "".join(e["content"] for e in events if e["type"] == "content_chunk")
+        assert streamed == "## Pricing\n\nPrices rose. \n\nDemand held up.\n\nMargins widened."
+        assert len(llm_client.prompts) == 3
+        assert ["- pricing", "- demand", "- margins"] == [p.split("which covers:\n")[1].split("\n")[0] for p in llm_client.prompts]
+        # Every part takes the same time, so the section takes about as long as one of them
+        assert elapsed < delay * 2
+        
+        content = db_session.get(GeneratedContent, UUID(events[-1]["content_id"]))
+        assert content.content == streamed
+        assert "Write only part" not in content.prompt_used
+        # Every part's tokens are counted
+        assert content.prompt_tokens == sum(count_tokens(p, "test-model") for p in llm_client.prompts)
+    
+    @pytest.mark.asyncio
+    async def test_failed_parts_fall_back_alone(self, seeded_section: dict, db_session):
+        """A failed part is retried on the fallback model, and parts that already succeeded are kept"""
+        from app.integrations import LLMClient, llm_registry
+        from app.models import GeneratedContent
+        from app.services import GenerationService
+        
+        class PartsClient(LLMClient):
+            provider = "test"
+            
+            def __init__(self, model, failing):
+                super().__init__(model)
+                self.failing = failing
+                self.parts = []
+            
+            async def _stream(self, prompt, max_tokens, temperature, usage):
+                self.parts.append(1)
+                if 1 in self.failing:
+                    raise RuntimeError("provider down")
+                yield "Pricing first."
+            
+            async def _complete(self, prompt, max_tokens, temperature, usage):
+                part = int(prompt.split("Write only part ")[1][0])
+                self.parts.append(part)
+                if part in self.failing:
+                    raise RuntimeError("provider down")
+                return {2: "Demand second.", 3: "Margins third."}[part]
+        
+        self._make_long(seeded_section, db_session, ["pricing", "demand", "margins"])
+        primary = PartsClient("primary-model", failing=(1, 3))
+        fallback = PartsClient("fallback-model", failing=())
+        with llm_registry.override(primary), \
+                patch.object(GenerationService, "_route", lambda *args: [primary, fallback]):
+            async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+                response = await async_client.post(
+                    "/api/generation/generate",
+                    json={"document_id": seeded_section["document_id"], "section_id": seeded_section["section_id"],
+                          "use_cache": False},
+                    headers=seeded_section["headers"]
+                )
+        
+        data = response.json()["data"]
+        assert data["content"] == "Pricing first.\n\nDemand second.\n\nMargins third."
+        assert sorted(primary.parts) == [1, 2, 3]
+        # Part 2 succeeded on the primary, so the fallback only writes parts 1 and 3
+        assert sorted(fallback.parts) == [1, 3]
+        assert db_session.get(GeneratedContent, UUID(data["content_id"])).status == "completed"
+    
+    @pytest.mark.asyncio
+    async def test_only_uncached_parts_are_charged(self):
+        """A section stitched from cached and fresh parts is charged for the fresh parts only"""
+        from app.integrations.tokenizer import TokenUsage
+        from app.services import GenerationService
+        
+        class StubClient:
+            model = "test-model"
+            
+            def __init__(self, cached):
+                self.cached = cached
+            
+            async def generate_content(self, prompt, usage, **kwargs):
+                usage.prompt_tokens, usage.completion_tokens, usage.cached = 10, 5, self.cached
+                
+                async def chunks():
+                    yield "First."
+                return chunks()
+        
+        async def charged(first_cached, later_cached):
+            later = []
+            for i, cached in enumerate(later_cached):
+                part_usage = TokenUsage("test-model")
+                part_usage.prompt_tokens, part_usage.completion_tokens, part_usage.cached = 20, 10 * (i + 1), cached
+                task = asyncio.get_running_loop().create_future()
+                task.set_result(f"Part {i + 2}.")
+                later.append((task, part_usage))
+            usage = TokenUsage("test-model")
+            async for _ in GenerationService._generate_parts(StubClient(first_cached), "", later, "Title", True, usage):
+                pass
+            assert usage.total_tokens == 15 + 30 + 40
+            return usage.billable_tokens
+        
+        assert await charged(False, (False, False)) == 85
+        assert await charged(False, (True, False)) == 55
+        assert await charged(True, (False, True)) == 30
+        assert await charged(True, (True, True)) == 0
+    
+    def test_medium_sections_use_one_call(self, seeded_section: dict):
+        """Sections that aren't long are generated in a single completion"""
+        from app.integrations import llm_registry
+        
+        llm_client = TestSpanRefinement._client("One piece.")
+        with llm_registry.override(llm_client):
+            response = client.post(
+                "/api/generation/generate",
+                json={"document_id": seeded_section["document_id"], "section_id": seeded_section["section_id"],
+                      "use_cache": False},
+                headers=seeded_section["headers"]
+            )
+        
+        assert response.json()["data"]["content"] == "One piece."
+        assert len(llm_client.prompts) == 1
+        assert "Write only part" not in llm_client.prompts[0][0]
+
+
 # Fixtures
+@pytest.fixture
+def seeded_section(db_session):
+    """Create a user, project and document with sections to generate into"""
+    from app.core.security import SecurityUtils
+    from app.models import User, Project, Document, Section
+    
+    user = User(email="generator@example.com", password_hash="not-used")
+    project = Project(user=user, title="Generation Project", document_type="document")
+    document = Document(project=project, title="Report", document_type="word", config_json={})
+    sections = [
+        Section(document=document, title=f"Section {i}", section_order=i, content_type="text")
+        for i in range(4)
+    ]
+    db_session.add_all([user, project, document, *sections])
+    db_session.commit()
+    
+    token = SecurityUtils.create_access_token({"sub": str(user.id)})
+    return {
+        "document_id": str(document.id),
+        "section_id": str(sections[0].id),
+        "section_ids": [str(s.id) for s in sections],
+        "user_id": str(user.id),
+        "headers": {"Authorization": f"Bearer {token}"}
+    }
+
+
 @pytest.fixture
 def valid_token():
     """Generate valid token"""
@@ -0,0 +1,603 @@
+"""
+Test Suite for LLM Integration Layer
+"""
+import asyncio
+import json
+import time
+import pytest
+from unittest.mock import patch
+
+from app.integrations import LLMClient, MockLLMClient, PromptManager, get_llm_client
+from app.integrations.cache import LLMResponseCache
+from app.integrations.rate_limiter import (
+    AdaptiveConcurrencyLimit, LLMRateLimitError, ProviderRateLimiter, TokenBucket
+)
+from app.integrations.tokenizer import TokenUsage, count_tokens
+
+
+class CountingClient(LLMClient):
+    """Stand-in provider that counts upstream calls"""
+
+    provider = "test"
+
+    def __init__(self):
+        super().__init__("test-model")
+        self.calls = 0
+
+    async def _complete(self, prompt, max_tokens, temperature, usage):
+        self.calls += 1
+        return f"completion for {prompt}"
+
+    async def _stream(self, prompt, max_tokens, temperature, usage):
+        self.calls += 1
+        for word in ["streamed ", "completion"]:
+            yield word
+
+
+class TestResponseCache:
+    """Test the prompt-keyed response cache"""
+
+    def test_key_normalizes_whitespace(self):
+        """Whitespace differences map to the same key"""
+        key_a = LLMResponseCache.make_key("Write  an\nintro ", "gpt-4", 0.7, 2000)
+        key_b = LLMResponseCache.make_key("Write an intro", "gpt-4", 0.7, 2000)
+        assert key_a == key_b
+
+    def test_key_includes_sampling_parameters(self):
+        """Model, temperature and max_tokens all change the key"""
+        base = LLMResponseCache.make_key("prompt", "gpt-4", 0.7, 2000)
+        assert base != LLMResponseCache.make_key("prompt", "gemini-pro", 0.7, 2000)
+        assert base != LLMResponseCache.make_key("prompt", "gpt-4", 0.2, 2000)
+        assert base != LLMResponseCache.make_key("prompt", "gpt-4", 0.7, 500)
+
+    @pytest.mark.asyncio
+    async def test_hit_and_miss_counters(self):
+        """Lookups are counted as hits or misses"""
+        cache = LLMResponseCache()
+        assert await cache.get("missing") is None
+        await cache.set("key", "value")
+        assert await cache.get("key") == "value"
+
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+
+    @pytest.mark.asyncio
+    async def test_lru_eviction_by_entries_and_size(self):
+        """Least-recently-used entries are evicted past either limit"""
+        cache = LLMResponseCache(max_entries=2, max_bytes=10)
+        await cache.set("a", "1234")
+        await cache.set("b", "1234")
+        await cache.get("a")
+        await cache.set("c", "1234")
+        assert await cache.get("b") is None
+        assert await cache.get("a") == "1234"
+
+        await cache.set("d", "123456789")
+        assert cache.stats()["size_bytes"] <= 10
+
+    @pytest.mark.asyncio
+    async def test_expired_entries_are_dropped(self):
+        """Entries are not served past their TTL"""
+        cache = LLMResponseCache(ttl_seconds=-1)
+        await cache.set("key", "value")
+        assert await cache.get("key") is None
+
+    @pytest.mark.asyncio
+    async def test_client_serves_repeats_from_cache(self):
+        """Identical deterministic prompts reach the provider once unless bypassed"""
+        cache = LLMResponseCache()
+        client = CountingClient()
+
+        with patch("app.integrations.response_cache", cache):
+            first = await client.generate_content("same prompt", temperature=0)
+            second = await client.generate_content("same prompt", temperature=0)
+            chunks = [c async for c in await client.generate_content("same prompt", temperature=0, stream=True)]
+            await client.generate_content("same prompt", temperature=0, use_cache=False)
+
+        assert first == second
+        assert "".join(chunks) == first
+        assert client.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_sampled_calls_are_cached_only_on_request(self):
+        """Calls at a non-zero temperature get a fresh completion unless the caller opts in"""
+        cache = LLMResponseCache()
+        client = CountingClient()
+
+        with patch("app.integrations.response_cache", cache):
+            await client.generate_content("draft prompt")
+            await client.generate_content("draft prompt")
+            assert client.calls == 2
+            await client.generate_content("draft prompt", use_cache=True)
+            await client.generate_content("draft prompt", use_cache=True)
+
+        assert client.calls == 3
+
+
+class TestRateLimiter:
+    """Test provider rate limiting and adaptive concurrency"""
+
+    @pytest.mark.asyncio
+    async def test_token_bucket_waits_for_refill(self):
+        """Requests beyond the bucket wait instead of failing"""
+        bucket = TokenBucket(rate_per_minute=600, capacity=1)  # 10 per second
+        await bucket.acquire(1, max_wait=1.0)
+        start = time.monotonic()
+        await bucket.acquire(1, max_wait=1.0)
+        assert time.monotonic() - start >= 0.08
+
+    @pytest.mark.asyncio
+    async def test_token_bucket_rejects_beyond_max_wait(self):
+        """A wait longer than max_wait raises a rate limit error"""
+        bucket = TokenBucket(rate_per_minute=1, capacity=1)
+        await bucket.acquire(1, max_wait=1.0)
+        with pytest.raises(LLMRateLimitError):
+            await bucket.acquire(1, max_wait=1.0)
+
+    def test_aimd_backs_off_and_recovers(self):
+        """Throttling halves the limit and successes ramp it back up"""
+        limit = AdaptiveConcurrencyLimit(maximum=8)
+        limit.in_flight = 1
+        limit.release(throttled=True)
+        assert int(limit.limit) == 4
+
+        for _ in range(40):
+            limit.in_flight = 1
+            limit.release(latency=0.1)
+        assert int(limit.limit) == 8
+
+    @pytest.mark.asyncio
+    async def test_concurrency_limit_queues_fairly(self):
+        """Waiters beyond the limit are admitted in arrival order"""
+        limit = AdaptiveConcurrencyLimit(maximum=1)
+        admitted = []
+
+        async def worker(name):
+            await limit.acquire()
+            admitted.append(name)
+            await asyncio.sleep(0.01)
+            limit.release()
+
+        await asyncio.gather(*[worker(i) for i in range(5)])
+        assert admitted == list(range(5))
+
+    @pytest.mark.asyncio
+    async def test_client_retries_provider_429(self):
+        """A throttled call is retried under the limiter instead of failing"""
+
+        class FlakyClient(CountingClient):
+            async def _complete(self, prompt, max_tokens, temperature, usage):
+                self.calls += 1
+                if self.calls == 1:
+                    raise LLMRateLimitError("429", retry_after=0.01)
+                return "ok"
+
+        client = FlakyClient()
+        limiter = ProviderRateLimiter("test", 600, 100000, max_concurrency=4)
+        with patch("app.integrations.get_rate_limiter", return_value=limiter):
+            assert await client.generate_content("prompt", use_cache=False) == "ok"
+
+        assert client.calls == 2
+        assert limiter.throttled_calls == 1
+        assert int(limiter.concurrency.limit) == 2
+
+
+class TestMockProvider:
+    """Test the deterministic offline mock provider"""
+
+    @pytest.mark.asyncio
+    async def test_output_is_deterministic(self):
+        """The same prompt yields the same content in both modes"""
+        client = MockLLMClient(ttft_ms=0, tokens_per_second=0)
+        prompt = PromptManager.build_content_prompt("Intro", "word", "text", length="short")
+
+        first = await client.generate_content(prompt, use_cache=False)
+        second = await client.generate_content(prompt, use_cache=False)
+        streamed = [c async for c in await client.generate_content(prompt, stream=True, use_cache=False)]
+
+        assert first == second
+        assert "".join(streamed) == first
+        assert len(streamed) == 150
+
+    @pytest.mark.asyncio
+    async def test_outline_prompts_return_json(self):
+        """Outline prompts get a parseable outline with the requested size"""
+        client = MockLLMClient(ttft_ms=0, tokens_per_second=0)
+        prompt = PromptManager.build_outline_prompt("AI", "report", 4)
+
+        outline = json.loads(await client.generate_content(prompt, use_cache=False))
+        assert len(outline) == 4
+        assert {"title", "description"} <= set(outline[0])
+
+    @pytest.mark.asyncio
+    async def test_simulated_latency(self):
+        """Time to first token and throughput follow the configuration"""
+        client = MockLLMClient(ttft_ms=100, tokens_per_second=1000)
+        prompt = PromptManager.build_content_prompt("Intro", "word", "text", length="short")
+
+        start = time.monotonic()
+        stream = await client.generate_content(prompt, stream=True, use_cache=False)
+        await stream.__anext__()
+        ttft = time.monotonic() - start
+        async for _ in stream:
+            pass
+        total = time.monotonic() - start
+
+        assert 0.09 <= ttft < 0.3
+        assert total >= 0.1 + 149 / 1000
+
+    @pytest.mark.asyncio
+    async def test_fault_injection(self):
+        """Configured error and 429 rates raise the matching errors"""
+        prompt = "prompt"
+        with pytest.raises(LLMRateLimitError):
+            await MockLLMClient(rate_limit_rate=1.0)._complete(prompt, 100, 0.7, TokenUsage("mock-llm"))
+        with pytest.raises(Exception, match="Mock LLM error"):
+            await MockLLMClient(error_rate=1.0, ttft_ms=0)._complete(prompt, 100, 0.7, TokenUsage("mock-llm"))
+
+    def test_registered_with_registry(self):
+        """The mock provider is available through get_llm_client"""
+        assert get_llm_client("mock").provider == "mock"
+
+
+class TestTokenAccounting:
+    """Test tokenizer-based prompt and completion counts"""
+
+    def test_count_tokens(self):
+        """Counts are positive, deterministic and grow with the text"""
+        assert count_tokens("") == 0
+        short = count_tokens("Write an introduction.")
+        long = count_tokens("Write an introduction. " * 50)
+        assert short > 0
+        assert long > short
+        assert count_tokens("Write an introduction. " * 50) == long
+
+    def test_provider_counts_take_precedence(self):
+        """Provider-reported usage replaces local counts and stops local accumulation"""
+        usage = TokenUsage("gpt-4")
+        usage.count_prompt("some prompt text")
+        usage.add_completion("some completion")
+        usage.set_provider_counts(12, 34)
+        usage.add_completion("more text")
+
+        assert usage.source == "provider"
+        assert (usage.prompt_tokens, usage.completion_tokens, usage.total_tokens) == (12, 34, 46)
+
+    @pytest.mark.asyncio
+    async def test_streamed_chunks_are_counted(self):
+        """Streams without provider usage are counted chunk by chunk"""
+        client = CountingClient()
+        usage = TokenUsage(client.model)
+        chunks = [c async for c in await client.generate_content("prompt", stream=True, use_cache=False, usage=usage)]
+
+        assert usage.prompt_tokens == count_tokens("prompt", client.model)
+        assert usage.completion_tokens == sum(count_tokens(c, client.model) for c in chunks)
+        assert usage.source == "tokenizer"
+
+    @pytest.mark.asyncio
+    async def test_mock_provider_reports_usage(self):
+        """The mock provider reports its own token counts"""
+        client = MockLLMClient(ttft_ms=0, tokens_per_second=0)
+        prompt = PromptManager.build_content_prompt("Intro", "word", "text", length="short")
+        usage = TokenUsage(client.model)
+        await client.generate_content(prompt, use_cache=False, usage=usage)
+
+        assert usage.source == "provider"
+        assert usage.completion_tokens == 150
+
+
+class TestCallLedger:
+    """Test per-call ledger records"""
+
+    @pytest.mark.asyncio
+    async def test_records_outcomes_and_cache_hits(self):
+        """Successes, cache hits and failures are each recorded once"""
+        from app.integrations.ledger import LatencyLedger
+
+        class FailingClient(CountingClient):
+            async def _complete(self, prompt, max_tokens, temperature, usage):
+                raise Exception("boom")
+
+        ledger = LatencyLedger()
+        with patch("app.integrations.ledger.latency_ledger", ledger), \
+                patch("app.integrations.response_cache", LLMResponseCache()):
+            client = CountingClient()
+            await client.generate_content("prompt", temperature=0)
+            await client.generate_content("prompt", temperature=0)
+            with pytest.raises(Exception):
+                await FailingClient().generate_content("other", use_cache=False)
+
+        rows = list(ledger._pending)
+        ledger._pending.clear()
+        await ledger.aclose()
+        assert [r["outcome"] for r in rows] == ["success", "success", "error"]
+        assert [r["cache_hit"] for r in rows] == [False, True, False]
+        assert rows[0]["ttft_ms"] == rows[0]["total_ms"]
+        assert rows[2]["error_message"] == "boom"
+
+
+class TestUserQuotas:
+    """Test sliding-window request and token budgets"""
+    
+    @staticmethod
+    def _manager(**tiers):
+        from app.integrations.quota import QuotaManager
+        return QuotaManager(100, tiers or {"free": {"tokens": 1000}}, "free", default_requests=0)
+    
+    @pytest.mark.asyncio
+    async def test_previous_window_is_weighted_by_overlap(self):
+        """Usage from the previous window counts in proportion to how much of it the window still covers"""
+        from app.integrations.quota import QuotaExceededError
+        
+        manager = self._manager()
+        with patch("app.integrations.quota.time.time", return_value=50.0):
+            await manager.reserve("user", "free", 800)
+        
+        with patch("app.integrations.quota.time.time", return_value=150.0):
+            # Half the previous window overlaps: 400 + 500 fits under 1000
+            await manager.reserve("user", "free", 500)
+            with pytest.raises(QuotaExceededError) as exc:
+                await manager.reserve("user", "free", 200)
+        
+        assert exc.value.kind == "tokens"
+        assert exc.value.used == 900
+        assert exc.value.retry_after == pytest.approx(12.5)
+        assert "tier 'free'" in str(exc.value) and "900 of 1,000 tokens" in str(exc.value)
+    
+    @pytest.mark.asyncio
+    async def test_settle_replaces_estimate_with_actual_usage(self):
+        """An over-estimated reservation gives its unused tokens back once settled"""
+        from app.integrations.quota import QuotaManager
+        
+        manager = QuotaManager(3600, {"free": {"tokens": 1000}})
+        reservation = await manager.reserve("user", "free", 900)
+        reservation.settle(120)
+        reservation.settle(5000)
+        
+        usage = await manager.usage("user", "free")
+        assert usage["tokens"]["used"] == 120
+        assert usage["requests"]["used"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_late_settlement_corrects_its_own_window(self):
+        """A reservation settled after the window rolled over adjusts the previous window, not the current one"""
+        manager = self._manager()
+        with patch("app.integrations.quota.time.time", return_value=50.0):
+            early = await manager.reserve("user", "free", 700)
+        
+        with patch("app.integrations.quota.time.time", return_value=150.0):
+            await manager.reserve("user", "free", 300)
+            early.settle(100)
+            usage = await manager.usage("user", "free")
+        
+        assert manager.store._counts["user:tokens"] == (1, 300, 100)
+        # 300 this window plus half of the settled 100 from the previous one
+        assert usage["tokens"]["used"] == 350
+        
+        with patch("app.integrations.quota.time.time", return_value=350.0):
+            # Two windows on, the settlement no longer counts and is dropped
+            late = await manager.reserve("user", "free", 200)
+        with patch("app.integrations.quota.time.time", return_value=550.0):
+            await manager.reserve("user", "free", 50)
+            late.settle(0)
+        assert manager.store._counts["user:tokens"] == (5, 50, 0)
+    
+    @pytest.mark.asyncio
+    async def test_tiers_and_request_limits(self):
+        """Tiers without a request limit use the default; unknown tiers fall back to the default tier"""
+        from app.integrations.quota import QuotaExceededError, QuotaManager
+        
+        manager = QuotaManager(3600, {"free": {"tokens": 0}, "pro": {"requests": 3}}, "free", default_requests=2)
+        for _ in range(2):
+            await manager.reserve("free-user", "unknown", 10)
+        with pytest.raises(QuotaExceededError) as exc:
+            await manager.reserve("free-user", "free", 10)
+        assert exc.value.kind == "requests" and exc.value.limit == 2
+        
+        for _ in range(3):
+            await manager.reserve("pro-user", "pro", 10)
+        with pytest.raises(QuotaExceededError):
+            await manager.check("pro-user", "pro")
+    
+    @pytest.mark.asyncio
+    async def test_oversized_request_is_rejected_outright(self):
+        """A single call larger than the whole budget says so instead of suggesting a retry"""
+        from app.integrations.quota import QuotaExceededError
+        
+        with pytest.raises(QuotaExceededError) as exc:
+            await self._manager().reserve("user", "free", 5000)
+        assert exc.value.retry_after is None
+        assert "more than the 'free' tier's budget" in str(exc.value)
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_reservations_cannot_overshoot(self):
+        """Reservations racing on a slow store are admitted only while they fit, and refusals are rolled back"""
+        from app.integrations.quota import MemoryWindowStore, QuotaExceededError, QuotaManager
+        
+        class SlowStore(MemoryWindowStore):
+            # Every round trip yields after touching the counters, as a networked store would
+            async def read(self, keys, window):
+                counts = await super().read(keys, window)
+                await asyncio.sleep(0)
+                return counts
+            
+            async def add(self, increments, window):
+                await super().add(increments, window)
+                await asyncio.sleep(0)
+            
+            async def add_and_read(self, increments, window):
+                counts = await super().add_and_read(increments, window)
+                await asyncio.sleep(0)
+                return counts
+        
+        manager = QuotaManager(3600, {"free": {"tokens": 1000}}, store=SlowStore())
+        results = await asyncio.gather(
+            *(manager.reserve("user", "free", 200) for _ in range(10)),
+            return_exceptions=True
+        )
+        
+        assert sum(not isinstance(r, Exception) for r in results) == 5
+        assert all(isinstance(r, QuotaExceededError) for r in results if isinstance(r, Exception))
+        usage = await manager.usage("user", "free")
+        assert usage["tokens"]["used"] == 1000
+        assert usage["requests"]["used"] == 5
+    
+    @pytest.mark.asyncio
+    async def test_hot_path_is_sub_millisecond(self):
+        """Reserve and settle against the in-process store stay far below a millisecond"""
+        manager = self._manager(free={"requests": 0, "tokens": 10 ** 9})
+        start = time.perf_counter()
+        for i in range(1000):
+            reservation = await manager.reserve(f"user-{i % 50}", "free", 100)
+            reservation.settle(80)
+        assert (time.perf_counter() - start) / 1000 < 0.001
+
+
+class TestCircuitBreaker:
+    """Test per-provider circuit breaking and hedged requests"""
+
+    def test_trips_on_failure_rate(self):
+        """Enough failures among recent calls open the circuit and calls are refused"""
+        from app.integrations.circuit_breaker import CircuitBreaker
+
+        breaker = CircuitBreaker("test", window_calls=4, min_calls=4, failure_rate=0.5, open_seconds=60)
+        for outcome in ("success", "error", "rate_limited", "success"):
+            breaker.record(outcome, 0.1)
+        assert breaker.state == "closed"
+
+        breaker.record("error")
+        assert breaker.state == "open"
+        assert not breaker.allow()
+        assert breaker.stats()["rejected_calls"] == 1
+        assert breaker.retry_after() > 59
+
+    def test_trips_on_slow_calls(self):
+        """A provider that answers, but too slowly, is also taken out of rotation"""
+        from app.integrations.circuit_breaker import CircuitBreaker
+
+        breaker = CircuitBreaker("test", window_calls=3, min_calls=3, slow_call_seconds=1.0, slow_call_rate=0.6)
+        for latency in (0.2, 5.0, 6.0):
+            breaker.record("success", latency)
+
+        assert breaker.state == "open"
+
+    def test_half_open_probe(self):
+        """After the open period one probe is let through; its outcome decides the circuit"""
+        from app.integrations.circuit_breaker import CircuitBreaker
+
+        breaker = CircuitBreaker("test", window_calls=2, min_calls=2, open_seconds=0.05)
+        breaker.record("error")
+        breaker.record("error")
+        time.sleep(0.06)
+
+        assert breaker.available
+        assert breaker.allow()
+        assert breaker.state == "half_open"
+        assert not breaker.allow()
+        breaker.record("error")
+        assert breaker.state == "open"
+        assert breaker.trips == 2
+
+        time.sleep(0.06)
+        assert breaker.allow()
+        breaker.record("success", 0.1)
+        assert breaker.state == "closed"
+        assert breaker.allow()
+
+    @pytest.mark.asyncio
+    async def test_open_circuit_refuses_calls(self):
+        """Calls to a provider with an open circuit fail fast without reaching it, cache hits still work"""
+        from app.integrations.circuit_breaker import CircuitOpenError, get_circuit_breaker
+
+        llm_client = CountingClient()
+        cached = await llm_client.generate_content("cached prompt", temperature=0)
+        get_circuit_breaker("test")._trip()
+
+        with pytest.raises(CircuitOpenError) as error:
+            await llm_client.generate_content("prompt", use_cache=False)
+        assert error.value.provider == "test"
+        assert error.value.retry_after > 0
+        assert await llm_client.generate_content("cached prompt", temperature=0) == cached
+        assert llm_client.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_provider_errors_are_counted(self):
+        """Failed provider calls feed the breaker; throttled ones do not"""
+        from app.integrations.circuit_breaker import get_circuit_breaker
+
+        with patch.object(get_circuit_breaker("mock"), "min_calls", 2):
+            for _ in range(2):
+                with pytest.raises(Exception, match="Mock LLM error"):
+                    await MockLLMClient(error_rate=1.0, ttft_ms=0).generate_content("prompt", use_cache=False)
+
+        assert get_circuit_breaker("mock").state == "open"
+
+    @pytest.mark.asyncio
+    async def test_hedged_request_beats_slow_call(self):
+        """A non-streaming call outlasting the p95 latency gets a second request, and the faster one wins"""
+        from app.core.config import settings
+        from app.integrations.circuit_breaker import get_circuit_breaker
+
+        class StallingClient(CountingClient):
+            async def _complete(self, prompt, max_tokens, temperature, usage):
+                self.calls += 1
+                # The first request stalls; the hedge answers at the usual speed
+                await asyncio.sleep(2.0 if self.calls == 1 else 0.05)
+                return f"completion {self.calls}"
+
+        breaker = get_circuit_breaker("test")
+        for _ in range(20):
+            breaker.record("success", 0.05, "test-model")
+
+        llm_client = StallingClient()
+        usage = TokenUsage("test-model")
+        with patch.object(settings, "LLM_HEDGE_ENABLED", True), \
+                patch.object(settings, "LLM_HEDGE_MIN_DELAY_SECONDS", 0.1):
+            start = time.monotonic()
+            content = await llm_client.generate_content("prompt", use_cache=False, usage=usage)
+            elapsed = time.monotonic() - start
+
+        assert content == "completion 2"
+        assert llm_client.calls == 2
+        assert elapsed < 0.5
+        assert usage.completion_tokens > 0
+        assert breaker.state == "closed"
+
+    @pytest.mark.asyncio
+    async def test_failed_primary_counted_when_hedge_wins(self):
+        """A primary that errors while its hedge is in flight is recorded as an error, not cancelled"""
+        from app.core.config import settings
+        from app.integrations.circuit_breaker import LLMProviderError, get_circuit_breaker
+
+        class FailingPrimaryClient(CountingClient):
+            async def _complete(self, prompt, max_tokens, temperature, usage):
+                self.calls += 1
+                if self.calls == 1:
+                    await asyncio.sleep(0.15)
+                    raise LLMProviderError("upstream error", self.provider)
+                await asyncio.sleep(0.2)
+                return "hedged completion"
+
+        breaker = get_circuit_breaker("test")
+        for _ in range(20):
+            breaker.record("success", 0.05, "test-model")
+
+        with patch.object(settings, "LLM_HEDGE_ENABLED", True), \
+                patch.object(settings, "LLM_HEDGE_MIN_DELAY_SECONDS", 0.1):
+            content = await FailingPrimaryClient().generate_content("prompt", use_cache=False)
+
+        assert content == "hedged completion"
+        outcomes = list(breaker._outcomes)[-2:]
+        assert [failed for failed, _ in outcomes] == [True, False]
+
+    @pytest.mark.asyncio
+    async def test_hedging_skipped_without_latency_history(self):
+        """Without enough latency samples to estimate p95, calls are not duplicated"""
+        from app.core.config import settings
+
+        llm_client = CountingClient()
+        with patch.object(settings, "LLM_HEDGE_ENABLED", True):
+            await llm_client.generate_content("prompt", use_cache=False)
+
+        assert llm_client.calls == 1